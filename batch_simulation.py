@@ -0,0 +1,132 @@
+import os
+import sys
+import time
+import contextlib
+import multiprocessing
+import pandas as pd
+
+import run_hybrid_solver_layers as sim
+
+# --- Headless Multi-Day Batch ---
+# Replays many days of preprocessed_orders.csv without the HTML dashboard
+# and collects each day's KPIs (see run_hybrid_solver_layers.simulation_kpis)
+# into one table. Days run in parallel, one per worker process. Each worker
+# loads the matrices and the order history once in its pool initializer and
+# reuses them for every day it simulates. The simulation is deterministic
+# (discrete-event clock, seeded per day), so the table does not depend on
+# the number of workers.
+# Pool workers cannot start a pool of their own, so the optimizers of each
+# day run in the worker's own process (OPTIMIZER_PROCESS_ISOLATION off).
+
+BATCH_NUM_WORKERS = os.cpu_count() or 1
+BATCH_OUTPUT_CSV = 'outputs/batch_simulation_kpis.csv'
+BATCH_QUIET = True  # Discard the per-day simulation log in the workers
+
+_worker_data = None
+_worker_orders = None
+
+
+@contextlib.contextmanager
+def _output(quiet):
+    """Sends stdout to os.devnull while quiet."""
+    if not quiet:
+        yield
+        return
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def _init_batch_worker(quiet):
+    """Pool initializer: loads the matrices and the order history once per worker."""
+    global _worker_data, _worker_orders
+    sim.OPTIMIZER_PROCESS_ISOLATION = False
+    sim.LAYER_3_NUM_PROCESSES = 1
+    with _output(quiet):
+        _worker_data = sim.load_simulation_data()
+        _worker_orders = sim.load_order_history()
+
+
+def _simulate_day(task):
+    """Runs one day in a worker. Returns: its KPIs, or None if the data could not be loaded."""
+    day_of_year, quiet = task
+    if _worker_data is None or _worker_orders is None:
+        return None
+    with _output(quiet):
+        return sim.run_hybrid_simulation(
+            day_of_year, generate_report=False, simulation_data=_worker_data, all_orders_df=_worker_orders
+        )
+
+
+def available_days(orders_file=sim.PREPROCESSED_ORDER_FILE):
+    """Returns: the sorted days of year that have orders."""
+    return sorted(int(day) for day in pd.read_csv(orders_file, usecols=['day_of_year'])['day_of_year'].unique())
+
+
+def summarize_kpis(results):
+    """
+    One table of the days' KPIs (one row per day, in day order) plus an
+    'all' row: totals for orders, unassigned, trucks (truck-days), trips, distance,
+    cost and L1 calls; the wait average over all L1-assigned orders and the
+    overall maximum; L1 latency percentiles over all calls of all days.
+    Returns: pandas DataFrame.
+    """
+    results = sorted(results, key=lambda r: r['day'])
+    all_latencies = [ms for r in results for ms in r['l1_latencies_ms']]
+    num_waits = sum(r['l1_assigned'] for r in results)
+    total = {
+        'day': 'all',
+        'orders': sum(r['orders'] for r in results),
+        'unassigned': sum(r['unassigned'] for r in results),
+        'l1_assigned': num_waits,
+        'trucks': sum(r['trucks'] for r in results),
+        'trips': sum(r['trips'] for r in results),
+        'distance_km': sum(r['distance_km'] for r in results),
+        'cost': sum(r['cost'] for r in results),
+        'avg_wait_min': sum(r['avg_wait_min'] * r['l1_assigned'] for r in results) / num_waits if num_waits else 0.0,
+        'max_wait_min': max((r['max_wait_min'] for r in results), default=0),
+        'l1_calls': len(all_latencies),
+        'l1_p50_ms': sim.percentile(all_latencies, 0.5),
+        'l1_p95_ms': sim.percentile(all_latencies, 0.95),
+        'l1_max_ms': max(all_latencies, default=0.0),
+        'runtime_sec': sum(r['runtime_sec'] for r in results)
+    }
+    rows = [{key: value for key, value in r.items() if key != 'l1_latencies_ms'} for r in results]
+    return pd.DataFrame(rows + [total])
+
+
+def run_batch(days=None, num_workers=BATCH_NUM_WORKERS, quiet=BATCH_QUIET):
+    """
+    Simulates the given days (default: every day with orders) on a pool of
+    num_workers processes.
+    Returns: the KPI table (see summarize_kpis).
+    """
+    if days is None:
+        days = available_days()
+    num_workers = max(1, min(num_workers, len(days)))
+    print(f"--- Batch: simulating {len(days)} days on {num_workers} worker processes ---")
+    start_time = time.time()
+    results = []
+    with multiprocessing.Pool(num_workers, initializer=_init_batch_worker, initargs=(quiet,)) as pool:
+        for day, kpis in zip(days, pool.imap(_simulate_day, [(day, quiet) for day in days], chunksize=1)):
+            if kpis is None:
+                print(f"Day {day}: failed (data could not be loaded)")
+                continue
+            results.append(kpis)
+            print(f"Day {day}: cost {kpis['cost']:.2f}, {kpis['trucks']} trucks, "
+                  f"{kpis['unassigned']} unassigned ({kpis['runtime_sec']:.1f}s)")
+    print(f"--- Batch finished in {time.time() - start_time:.1f}s ---")
+    return summarize_kpis(results)
+
+
+if __name__ == "__main__":
+    # Optional day range: python batch_simulation.py FIRST_DAY [LAST_DAY]
+    selected_days = None
+    if len(sys.argv) > 1:
+        first_day = int(sys.argv[1])
+        last_day = int(sys.argv[2]) if len(sys.argv) > 2 else first_day
+        selected_days = [day for day in available_days() if first_day <= day <= last_day]
+    table = run_batch(selected_days)
+    print(table.to_string(index=False, float_format=lambda value: f"{value:.2f}"))
+    os.makedirs(os.path.dirname(BATCH_OUTPUT_CSV), exist_ok=True)
+    table.to_csv(BATCH_OUTPUT_CSV, index=False)
+    print(f"✅ KPI table saved to '{BATCH_OUTPUT_CSV}'")
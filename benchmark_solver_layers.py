@@ -0,0 +1,586 @@
+import sys
+import json
+import time
+import threading
+import random
+import copy
+import tracemalloc
+import pandas as pd
+
+import hybrid_solver_layers as hsl
+from orders import make_order
+
+# --- Benchmark Configuration ---
+TIME_MATRIX_FILE = 'matrix_data_with_distance.json'
+PREPROCESSED_ORDER_FILE = 'preprocessed_orders.csv'
+BENCHMARK_DAY_OF_YEAR = 358
+NUM_VEHICLES = 10
+VEHICLE_CAPACITY = 20
+MAX_ROUTE_DURATION_MINS = 200
+FIXED_COST_PER_TRUCK = 5000
+VARIABLE_COST_PER_KM = 15
+BENCHMARK_SEED = 42
+
+
+def load_benchmark_data(day_of_year=BENCHMARK_DAY_OF_YEAR):
+    """
+    Loads the master matrices and the orders of one day, as the same
+    Order records the simulation uses.
+    """
+    with open(TIME_MATRIX_FILE, 'r') as f:
+        data = json.load(f)
+
+    all_orders_df = pd.read_csv(PREPROCESSED_ORDER_FILE)
+    day_df = all_orders_df[all_orders_df['day_of_year'] == day_of_year].sort_values(by='minute_of_day')
+
+    orders = []
+    for row in day_df.to_dict('records'):
+        orders.append(make_order(
+            row['order_id'],
+            int(row['location_index']),
+            int(row['demand']),
+            int(row['minute_of_day'])
+        ))
+
+    return {
+        'locations': data['locations'],
+        'time_matrix': data['time_matrix'],
+        'distance_matrix': data['distance_matrix'],
+        'orders': orders
+    }
+
+
+def build_l1_state(data):
+    """Runs Layer 1 over the day's orders and returns (routes, pending)."""
+    random.seed(BENCHMARK_SEED)
+    routes = {i: [] for i in range(NUM_VEHICLES)}
+    pending = []
+    for order in data['orders']:
+        new_routes, _ = hsl.assign_new_order_realtime(
+            order, routes, data['time_matrix'], VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS
+        )
+        if new_routes:
+            routes = new_routes
+        else:
+            pending.append(order)
+    return routes, pending
+
+
+# --- Benchmarks ---
+
+def bench_state_copy(data, trials=200):
+    """
+    Per-iteration allocation of one ALNS destroy/repair step compared with
+    a deepcopy of the same fleet state (what every step used to pay for).
+    Reports the peak transient allocation in KB, measured with tracemalloc.
+    """
+    routes, pending = build_l1_state(data)
+    total_assigned = sum(len(r) for r in routes.values())
+    num_to_remove = max(1, int(total_assigned * hsl.ALNS_DESTROY_MIN_PERCENT))
+
+    def measure(fn):
+        peaks = []
+        for _ in range(trials):
+            tracemalloc.start()
+            base, _ = tracemalloc.get_traced_memory()
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            peaks.append(peak - base)
+        return sum(peaks) / len(peaks) / 1024.0
+
+    def alns_step():
+        partial, bank = hsl._destroy_random(routes, num_to_remove, data['time_matrix'], data['distance_matrix'])
+        bank.extend(pending)
+        hsl._repair_greedy(
+            partial, bank, data['time_matrix'], data['distance_matrix'],
+            VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS, NUM_VEHICLES
+        )
+
+    random.seed(BENCHMARK_SEED)
+    deepcopy_kb = measure(lambda: copy.deepcopy(routes))
+    clone_kb = measure(lambda: hsl._clone_routes(routes))
+    step_kb = measure(alns_step)
+
+    start = time.perf_counter()
+    for _ in range(trials):
+        alns_step()
+    step_ms = (time.perf_counter() - start) * 1000.0 / trials
+
+    print(f"[state_copy] {total_assigned} orders on {sum(1 for r in routes.values() if r)} vehicles")
+    print(f"[state_copy] deepcopy of fleet state : {deepcopy_kb:8.1f} KB")
+    print(f"[state_copy] copy-on-write clone     : {clone_kb:8.1f} KB")
+    print(f"[state_copy] ALNS destroy+repair step: {step_kb:8.1f} KB peak, {step_ms:.2f} ms")
+
+
+def bench_l1_latency(data):
+    """
+    Layer 1 latency per order over a full day, and the cost of the
+    50-iteration tabu refinement alone on each resulting route.
+    """
+    random.seed(BENCHMARK_SEED)
+    routes = {i: [] for i in range(NUM_VEHICLES)}
+    latencies_ms = []
+    for order in data['orders']:
+        start = time.perf_counter()
+        new_routes, _ = hsl.assign_new_order_realtime(
+            order, routes, data['time_matrix'], VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS
+        )
+        latencies_ms.append((time.perf_counter() - start) * 1000.0)
+        if new_routes:
+            routes = new_routes
+
+    tabu_ms = []
+    for v_id, route_orders in routes.items():
+        if len(route_orders) < 2:
+            continue
+        start = time.perf_counter()
+        hsl._tabu_search_capacity(
+            routes, data['time_matrix'], VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS,
+            iterations=50, tabu_tenure=7, vehicle_ids=[v_id],
+            max_non_improving=hsl.L1_TABU_MAX_NON_IMPROVING
+        )
+        tabu_ms.append((time.perf_counter() - start) * 1000.0)
+
+    l1_cost, l1_trucks, _ = hsl.calculate_total_fleet_cost(
+        routes, data['distance_matrix'], FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM
+    )
+    print(f"[l1_latency] L1-only fleet state: Cost={l1_cost:.2f}, Trucks={l1_trucks}")
+
+    latencies_ms.sort()
+    p50 = latencies_ms[len(latencies_ms) // 2]
+    p95 = latencies_ms[int(len(latencies_ms) * 0.95)]
+    print(f"[l1_latency] {len(latencies_ms)} orders: p50={p50:.2f} ms, p95={p95:.2f} ms, max={latencies_ms[-1]:.2f} ms")
+    if tabu_ms:
+        print(f"[l1_latency] 50-iteration tabu per route: avg={sum(tabu_ms) / len(tabu_ms):.2f} ms, max={max(tabu_ms):.2f} ms")
+
+
+def bench_alns(data, iterations=1000):
+    """
+    Time-to-quality of Layer 3 (ALNS) from the L1 state: final cost,
+    unassigned orders and runtime, plus the per-operator statistics.
+    """
+    routes, pending = build_l1_state(data)
+    random.seed(BENCHMARK_SEED)
+    operator_stats = {}
+    start = time.perf_counter()
+    best_routes, unassigned = hsl.run_alns_optimization(
+        routes, pending, data['time_matrix'], data['distance_matrix'],
+        NUM_VEHICLES, VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS,
+        FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM,
+        alns_iterations=iterations, operator_stats=operator_stats
+    )
+    runtime = time.perf_counter() - start
+    cost, trucks, _ = hsl.calculate_total_fleet_cost(
+        best_routes, data['distance_matrix'], FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM
+    )
+    print(f"[alns] {iterations} iterations in {runtime:.2f}s: Cost={cost:.2f}, Trucks={trucks}, Unassigned={len(unassigned)}")
+    cache = hsl.route_cost_cache_stats()
+    print(f"[alns] route cost cache: {cache['hits']} hits, {cache['misses']} misses ({100.0 * cache['hit_rate']:.1f}%)")
+
+
+def bench_multistart(data, iterations=500, worker_counts=(1, 2, 4, 8)):
+    """
+    Multi-start ALNS on a process pool: wall-clock time and best cost for
+    1/2/4/8 independent starts, one start per worker. Scaling is bounded by
+    the number of physical cores of the machine.
+    """
+    import parallel_alns
+
+    routes, pending = build_l1_state(data)
+    print(f"[multistart] {parallel_alns.ALNS_MULTISTART_WORKERS} CPU core(s) available")
+    for workers in worker_counts:
+        pool = parallel_alns.create_alns_pool(data['time_matrix'], data['distance_matrix'], workers)
+        try:
+            start = time.perf_counter()
+            best_routes, unassigned, start_results = parallel_alns.run_alns_multistart(
+                pool, routes, pending, NUM_VEHICLES, VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS,
+                FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM,
+                num_starts=workers, base_seed=BENCHMARK_SEED, alns_iterations=iterations
+            )
+            runtime = time.perf_counter() - start
+        finally:
+            pool.close()
+            pool.join()
+        costs = sorted(r['cost'] for r in start_results)
+        print(f"[multistart] {workers} start(s) in {runtime:.2f}s: best={costs[0]:.2f}, "
+              f"worst={costs[-1]:.2f}, Unassigned={len(unassigned)}")
+
+
+def _replay_l1(data, stop_event, latencies_ms):
+    """Replays Layer 1 over the day's orders (from empty routes, again and again) until stop_event is set."""
+    while not stop_event.is_set():
+        routes = {i: [] for i in range(NUM_VEHICLES)}
+        for order in data['orders']:
+            if stop_event.is_set():
+                return
+            start = time.perf_counter()
+            new_routes, _ = hsl.assign_new_order_realtime(
+                order, routes, data['time_matrix'], VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS
+            )
+            latencies_ms.append((time.perf_counter() - start) * 1000.0)
+            if new_routes:
+                routes = new_routes
+
+
+def bench_l1_under_load(data, budget_sec=6.0):
+    """
+    Layer 1 latency while an optimizer cycle (L2 + L3 until a deadline)
+    runs: with no optimizer, with L2/L3 as threads of this process, and with
+    L2/L3 on pool processes reading the matrices from shared memory.
+    """
+    import parallel_alns
+    from shared_matrices import SharedMatrix
+
+    routes, pending = build_l1_state(data)
+    for mode in ('idle', 'threads', 'processes'):
+        pool, blocks = None, []
+        if mode == 'processes':
+            blocks = [SharedMatrix(data['time_matrix']), SharedMatrix(data['distance_matrix'])]
+            pool = parallel_alns.create_alns_pool(blocks[0], blocks[1], 2)
+        deadline = time.time() + budget_sec
+        if mode == 'threads':
+            optimizers = [
+                lambda: hsl.batch_optimization_vrp(routes, pending, data['time_matrix'], NUM_VEHICLES,
+                                                   VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS, deadline=deadline),
+                lambda: hsl.run_alns_optimization(routes, pending, data['time_matrix'], data['distance_matrix'],
+                                                  NUM_VEHICLES, VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS,
+                                                  FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM, deadline=deadline),
+            ]
+        elif mode == 'processes':
+            optimizers = [
+                lambda: parallel_alns.run_l2_in_pool(pool, routes, pending, NUM_VEHICLES, VEHICLE_CAPACITY,
+                                                     MAX_ROUTE_DURATION_MINS, deadline=deadline),
+                lambda: parallel_alns.run_alns_in_pool(pool, routes, pending, NUM_VEHICLES, VEHICLE_CAPACITY,
+                                                       MAX_ROUTE_DURATION_MINS, FIXED_COST_PER_TRUCK,
+                                                       VARIABLE_COST_PER_KM, deadline=deadline),
+            ]
+        else:
+            optimizers = [lambda: time.sleep(budget_sec)]
+
+        threads = [threading.Thread(target=optimizer) for optimizer in optimizers]
+        stop_event, latencies_ms = threading.Event(), []
+        for thread in threads:
+            thread.start()
+        replay = threading.Thread(target=_replay_l1, args=(data, stop_event, latencies_ms))
+        replay.start()
+        for thread in threads:
+            thread.join()
+        stop_event.set()
+        replay.join()
+        if pool is not None:
+            pool.close()
+            pool.join()
+        for block in blocks:
+            block.close()
+
+        latencies_ms.sort()
+        p50 = latencies_ms[len(latencies_ms) // 2]
+        p95 = latencies_ms[int(len(latencies_ms) * 0.95)]
+        print(f"[l1_under_load] {mode:9s}: {len(latencies_ms)} orders, p50={p50:.2f} ms, "
+              f"p95={p95:.2f} ms, max={latencies_ms[-1]:.2f} ms")
+
+
+def bench_islands(data, budget_sec=8.0, island_counts=(1, 2, 4, 8), checkpoints=(0.25, 0.5, 1.0)):
+    """
+    Island-model ALNS: best cost against wall time for 1/2/4/8 islands with
+    the same wall-clock budget. At each checkpoint the best solution found by
+    any island so far is reported (fewest unassigned first, then cost).
+    """
+    import parallel_alns
+
+    routes, pending = build_l1_state(data)
+    print(f"[islands] {parallel_alns.ALNS_MULTISTART_WORKERS} CPU core(s) available, budget {budget_sec:.1f}s")
+    for islands in island_counts:
+        pool = parallel_alns.create_alns_pool(data['time_matrix'], data['distance_matrix'], islands)
+        try:
+            start = time.perf_counter()
+            _, unassigned, island_results = parallel_alns.run_alns_islands(
+                pool, routes, pending, NUM_VEHICLES, VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS,
+                FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM,
+                num_islands=islands, base_seed=BENCHMARK_SEED,
+                alns_iterations=10 ** 9, deadline=time.time() + budget_sec
+            )
+            runtime = time.perf_counter() - start
+        finally:
+            pool.close()
+            pool.join()
+
+        curve = []
+        for fraction in checkpoints:
+            t = budget_sec * fraction
+            points = [(u, c) for r in island_results for (elapsed, c, u) in r['trajectory'] if elapsed <= t]
+            if points:
+                u, c = min(points)
+                curve.append(f"{t:.1f}s={c:.0f}" + (f"/{u}u" if u else ""))
+            else:
+                curve.append(f"{t:.1f}s=-")
+        migrants = sum(r['immigrants_received'] for r in island_results)
+        print(f"[islands] {islands} island(s) in {runtime:.2f}s: {', '.join(curve)} "
+              f"(Unassigned={len(unassigned)}, migrations adopted={migrants})")
+
+
+def bench_solution_arrays(data, trials=2000):
+    """
+    Dict-of-lists fleet state against the array-backed giant tour: pickled
+    size (what a worker process receives), encode/decode time and the fleet
+    cost evaluation on each representation.
+    """
+    import pickle
+    import solution_arrays as sa
+
+    routes, pending = build_l1_state(data)
+    table = sa.build_order_table(routes, pending)
+    tour, vehicle_ids = sa.routes_to_giant_tour(routes, table)
+
+    dict_bytes = len(pickle.dumps((routes, pending)))
+    array_bytes = len(pickle.dumps((table, tour, vehicle_ids, table.keys(pending))))
+    tour_bytes = len(pickle.dumps((tour, vehicle_ids)))
+
+    def timed_us(fn):
+        start = time.perf_counter()
+        for _ in range(trials):
+            fn()
+        return (time.perf_counter() - start) * 1e6 / trials
+
+    dm = data['distance_matrix']
+    encode_us = timed_us(lambda: sa.routes_to_giant_tour(routes, table))
+    decode_us = timed_us(lambda: sa.giant_tour_to_routes(tour, vehicle_ids, table))
+    dict_cost_us = timed_us(lambda: hsl.calculate_total_fleet_cost(routes, dm, FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM))
+    tour_cost_us = timed_us(lambda: sa.giant_tour_fleet_cost(tour, table, dm, FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM))
+    assert abs(hsl.calculate_total_fleet_cost(routes, dm, FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM)[0]
+               - sa.giant_tour_fleet_cost(tour, table, dm, FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM)[0]) < 1e-6
+
+    print(f"[solution_arrays] {len(table)} orders, pickled: dicts={dict_bytes} B, "
+          f"table+tour={array_bytes} B, tour only={tour_bytes} B")
+    print(f"[solution_arrays] encode={encode_us:.1f} us, decode={decode_us:.1f} us")
+    print(f"[solution_arrays] fleet cost: dicts={dict_cost_us:.1f} us, giant tour={tour_cost_us:.1f} us")
+
+
+def bench_l2_matrix(data, sizes=(100, 500, 2000)):
+    """
+    L2 solver-matrix expansion (depot + one node per order) with NumPy fancy
+    indexing, compared with the per-cell Python loop it replaced. Orders are
+    sampled with replacement from the day to reach each size.
+    """
+    tm = data['time_matrix']
+    rng = random.Random(BENCHMARK_SEED)
+
+    def python_loop(orders):
+        n = len(orders) + 1
+        locs = [0] + [o['index'] for o in orders]
+        m = [[0] * n for _ in range(n)]
+        for i in range(n):
+            for j in range(n):
+                if i != j:
+                    m[i][j] = tm[locs[i]][locs[j]]
+        return m
+
+    for size in sizes:
+        orders = [rng.choice(data['orders']) for _ in range(size)]
+        start = time.perf_counter()
+        reference = python_loop(orders)
+        loop_ms = (time.perf_counter() - start) * 1000.0
+        start = time.perf_counter()
+        vectorised = hsl.build_solver_time_matrix(tm, orders)
+        numpy_ms = (time.perf_counter() - start) * 1000.0
+        assert vectorised.tolist() == reference
+        print(f"[l2_matrix] {size} orders: python loop={loop_ms:.1f} ms, numpy={numpy_ms:.2f} ms")
+
+
+def bench_l2_bundling(data, days=(358, 245, 300)):
+    """
+    Layer 2 (OR-Tools) on the L1 state of several days, with one solver node
+    per order and with co-located orders bundled: model size, solve time,
+    fleet cost and unassigned orders.
+    """
+    for day in days:
+        day_data = data if day == BENCHMARK_DAY_OF_YEAR else load_benchmark_data(day)
+        routes, pending = build_l1_state(day_data)
+        for bundle_orders in (False, True):
+            start = time.perf_counter()
+            new_routes, unassigned = hsl.batch_optimization_vrp(
+                routes, pending, day_data['time_matrix'], NUM_VEHICLES, VEHICLE_CAPACITY,
+                MAX_ROUTE_DURATION_MINS, bundle_orders=bundle_orders
+            )
+            runtime = time.perf_counter() - start
+            num_orders = sum(len(r) for r in routes.values()) + len(pending)
+            max_bundle_demand = max(1, int(VEHICLE_CAPACITY * hsl.L2_BUNDLE_CAPACITY_FRACTION))
+            all_orders = pending + [o for r in routes.values() for o in r]
+            num_nodes = 1 + (len(hsl.bundle_colocated_orders(all_orders, max_bundle_demand))
+                             if bundle_orders else num_orders)
+            cost, trucks, _ = hsl.calculate_total_fleet_cost(
+                new_routes, day_data['distance_matrix'], FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM
+            )
+            label = "bundled" if bundle_orders else "per-order"
+            print(f"[l2_bundling] day {day} {label:9s}: {num_nodes:4d} nodes, {runtime:.2f}s, "
+                  f"Cost={cost:.2f}, Trucks={trucks}, Unassigned={len(unassigned)}")
+
+
+def bench_l2_warm_start(data, days=(358, 245, 300)):
+    """
+    Layer 2 (OR-Tools) on the L1 state of several days, starting from scratch
+    vs from the L1 routes: fleet cost and unassigned orders of the result.
+    """
+    for day in days:
+        day_data = data if day == BENCHMARK_DAY_OF_YEAR else load_benchmark_data(day)
+        routes, pending = build_l1_state(day_data)
+        l1_cost, l1_trucks, _ = hsl.calculate_total_fleet_cost(
+            routes, day_data['distance_matrix'], FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM
+        )
+        print(f"[l2_warm_start] day {day} L1 input : Cost={l1_cost:.2f}, Trucks={l1_trucks}, Unassigned={len(pending)}")
+        for warm_start in (False, True):
+            new_routes, unassigned = hsl.batch_optimization_vrp(
+                routes, pending, day_data['time_matrix'], NUM_VEHICLES, VEHICLE_CAPACITY,
+                MAX_ROUTE_DURATION_MINS, warm_start=warm_start
+            )
+            cost, trucks, _ = hsl.calculate_total_fleet_cost(
+                new_routes, day_data['distance_matrix'], FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM
+            )
+            label = "warm" if warm_start else "cold"
+            print(f"[l2_warm_start] day {day} {label:9s}: Cost={cost:.2f}, Trucks={trucks}, "
+                  f"Unassigned={len(unassigned)}")
+
+
+def bench_decomposition(data, num_days=10, budget_sec=60.0):
+    """
+    Cluster-first decomposition on a large synthetic instance (the orders of
+    the num_days busiest days at once, with the fleet scaled to their total
+    demand): monolithic L2 vs sweep and k-means decomposition, sequential
+    and on a process pool, then the same for L3 (ALNS) with sweep clusters.
+    Fleet cost, unassigned orders and runtime.
+    """
+    import math
+    import parallel_alns
+    from decomposition import decomposed_alns_optimization, decomposed_optimization_vrp
+
+    all_orders_df = pd.read_csv(PREPROCESSED_ORDER_FILE)
+    busiest_days = all_orders_df.groupby('day_of_year').size().nlargest(num_days).index
+    orders = []
+    for day in sorted(busiest_days):
+        orders.extend(data['orders'] if day == BENCHMARK_DAY_OF_YEAR else load_benchmark_data(day)['orders'])
+    num_vehicles = math.ceil(1.1 * sum(o['demand'] for o in orders) / VEHICLE_CAPACITY)
+    routes = {i: [] for i in range(num_vehicles)}
+    print(f"[decomposition] {len(orders)} orders from {num_days} days, {num_vehicles} vehicles")
+
+    def report(label, runtime, new_routes, unassigned):
+        cost, trucks, _ = hsl.calculate_total_fleet_cost(
+            new_routes, data['distance_matrix'], FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM
+        )
+        print(f"[decomposition] {label:22s}: {runtime:6.2f}s, Cost={cost:.2f}, Trucks={trucks}, "
+              f"Unassigned={len(unassigned)}")
+
+    start = time.perf_counter()
+    new_routes, unassigned = hsl.batch_optimization_vrp(
+        routes, orders, data['time_matrix'], num_vehicles, VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS,
+        deadline=time.time() + budget_sec
+    )
+    report("monolithic", time.perf_counter() - start, new_routes, unassigned)
+
+    pool = parallel_alns.create_alns_pool(data['time_matrix'], data['distance_matrix'])
+    try:
+        for method in ('sweep', 'kmeans'):
+            for label, method_pool in (('sequential', None), ('pool', pool)):
+                start = time.perf_counter()
+                new_routes, unassigned = decomposed_optimization_vrp(
+                    routes, orders, data['time_matrix'], data['distance_matrix'], data['locations'],
+                    num_vehicles, VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS,
+                    FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM,
+                    method=method, pool=method_pool, deadline=time.time() + budget_sec
+                )
+                report(f"{method} {label}", time.perf_counter() - start, new_routes, unassigned)
+
+        random.seed(BENCHMARK_SEED)
+        start = time.perf_counter()
+        new_routes, unassigned = hsl.run_alns_optimization(
+            routes, orders, data['time_matrix'], data['distance_matrix'], num_vehicles,
+            VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS, FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM,
+            deadline=time.time() + budget_sec
+        )
+        report("ALNS monolithic", time.perf_counter() - start, new_routes, unassigned)
+        for label, method_pool in (('sequential', None), ('pool', pool)):
+            start = time.perf_counter()
+            new_routes, unassigned = decomposed_alns_optimization(
+                routes, orders, data['time_matrix'], data['distance_matrix'], data['locations'],
+                num_vehicles, VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS,
+                FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM,
+                pool=method_pool, deadline=time.time() + budget_sec, seed=BENCHMARK_SEED
+            )
+            report(f"ALNS sweep {label}", time.perf_counter() - start, new_routes, unassigned)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _count_python_work(stop_event, counter):
+    """Busy Python loop (needs the GIL) counting its iterations until stop_event is set."""
+    n = 0
+    while not stop_event.is_set():
+        n += 1
+    counter.append(n)
+
+
+def bench_l2_transit(data, days=(358, 245)):
+    """
+    Layer 2 engine with Python transit callbacks vs precomputed transit
+    matrices, on the L1 state of several days (one node per order): search
+    throughput (branches/s within the time limit) and objective, and GIL
+    contention, as the work a concurrent Python thread gets done during the
+    solve relative to running alone for as long.
+    """
+    for day in days:
+        day_data = data if day == BENCHMARK_DAY_OF_YEAR else load_benchmark_data(day)
+        routes, pending = build_l1_state(day_data)
+        orders = pending + [o for r in routes.values() for o in r]
+        solver_matrix = hsl.build_solver_time_matrix(day_data['time_matrix'], orders)
+        demands = [0] + [o['demand'] for o in orders]
+        for precomputed in (False, True):
+            stats = {}
+            stop_event, counter = threading.Event(), []
+            worker = threading.Thread(target=_count_python_work, args=(stop_event, counter))
+            worker.start()
+            start = time.perf_counter()
+            hsl.solve_vrp_with_capacity(
+                solver_matrix, demands, [VEHICLE_CAPACITY] * NUM_VEHICLES,
+                [MAX_ROUTE_DURATION_MINS] * NUM_VEHICLES, NUM_VEHICLES,
+                precomputed_transits=precomputed, solver_stats=stats
+            )
+            runtime = time.perf_counter() - start
+            stop_event.set()
+            worker.join()
+
+            # Same thread alone for the same wall time
+            stop_event, alone = threading.Event(), []
+            worker = threading.Thread(target=_count_python_work, args=(stop_event, alone))
+            worker.start()
+            time.sleep(runtime)
+            stop_event.set()
+            worker.join()
+
+            label = "matrix" if precomputed else "callback"
+            print(f"[l2_transit] day {day} {label:8s}: {len(orders)} nodes, {runtime:.2f}s, "
+                  f"{stats['branches'] / runtime:,.0f} branches/s, objective={stats['objective']}, "
+                  f"python thread progress {100.0 * counter[0] / alone[0]:.0f}% of solo")
+
+
+BENCHMARKS = {
+    'state_copy': bench_state_copy,
+    'l1_latency': bench_l1_latency,
+    'alns': bench_alns,
+    'multistart': bench_multistart,
+    'l1_under_load': bench_l1_under_load,
+    'islands': bench_islands,
+    'solution_arrays': bench_solution_arrays,
+    'l2_matrix': bench_l2_matrix,
+    'l2_bundling': bench_l2_bundling,
+    'l2_transit': bench_l2_transit,
+    'l2_warm_start': bench_l2_warm_start,
+    'decomposition': bench_decomposition,
+}
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BENCHMARKS.keys())
+    benchmark_data = load_benchmark_data()
+    print(f"Loaded {len(benchmark_data['orders'])} orders for day {BENCHMARK_DAY_OF_YEAR}.")
+    for name in selected:
+        BENCHMARKS[name](benchmark_data)
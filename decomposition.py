@@ -0,0 +1,379 @@
+import copy
+import math
+import random
+import time
+
+import numpy as np
+
+import hybrid_solver_layers as hsl
+
+# --- Cluster-First, Route-Second Parameters ---
+DECOMPOSITION_MIN_ORDERS = 300      # Below this many orders, L2 and L3 solve the instance as a whole
+DECOMPOSITION_ORDERS_PER_CLUSTER = 150
+DECOMPOSITION_METHOD = 'sweep'      # 'sweep' (polar angle around the depot) or 'kmeans' (on lat/lng)
+DECOMPOSITION_KMEANS_ITERATIONS = 20
+DECOMPOSITION_BOUNDARY_REOPT = True # Re-solve each pair of neighbouring clusters after stitching
+
+
+# --- Clustering ---
+# Orders are clustered by location, so co-located orders always end up in
+# the same cluster, and clusters come back sorted by polar angle around the
+# depot: cluster k and k + 1 (and the last and the first) are neighbours.
+def location_coordinates(locations, time_matrix):
+    """
+    Returns: [(latitude, longitude), ...] of every location. A location that
+    failed geocoding (NaN) borrows the coordinates of the geocoded location
+    closest to it in travel time.
+    """
+    coordinates = [(loc['latitude'], loc['longitude']) for loc in locations]
+    geocoded = [i for i, (lat, lng) in enumerate(coordinates) if not (math.isnan(lat) or math.isnan(lng))]
+    for i, (lat, lng) in enumerate(coordinates):
+        if (math.isnan(lat) or math.isnan(lng)) and geocoded:
+            nearest = min(geocoded, key=lambda j: time_matrix[i][j] + time_matrix[j][i])
+            coordinates[i] = coordinates[nearest]
+    return coordinates
+
+
+def _angle(coordinates, point):
+    depot_lat, depot_lng = coordinates[0]
+    return math.atan2(point[0] - depot_lat, point[1] - depot_lng)
+
+
+def sweep_clusters(demand_by_location, coordinates, num_clusters):
+    """
+    Sweep clustering: locations sorted by polar angle around the depot
+    (coordinates from location_coordinates) and cut into num_clusters
+    consecutive sectors of about equal demand.
+    Returns: list of clusters, each a list of location indices.
+    """
+    angles = {loc: _angle(coordinates, coordinates[loc]) for loc in demand_by_location}
+    ordered = sorted(demand_by_location, key=lambda loc: (angles[loc], loc))
+    target = sum(demand_by_location.values()) / num_clusters
+    clusters = [[]]
+    load = 0
+    for loc in ordered:
+        if load >= target and len(clusters) < num_clusters:
+            clusters.append([])
+            load = 0
+        clusters[-1].append(loc)
+        load += demand_by_location[loc]
+    return clusters
+
+
+def kmeans_clusters(demand_by_location, coordinates, num_clusters,
+                    iterations=DECOMPOSITION_KMEANS_ITERATIONS):
+    """
+    Demand-weighted k-means (Lloyd's algorithm) on the lat/lng of the
+    locations, seeded with the sweep clusters so the result is deterministic.
+    Returns: list of non-empty clusters, each a list of location indices,
+    sorted by the polar angle of their centroid around the depot.
+    """
+    location_indices = sorted(demand_by_location)
+    points = np.array([coordinates[loc] for loc in location_indices])
+    weights = np.array([demand_by_location[loc] for loc in location_indices], dtype=float)
+    position = {loc: i for i, loc in enumerate(location_indices)}
+
+    labels = np.empty(len(location_indices), dtype=int)
+    for k, cluster in enumerate(sweep_clusters(demand_by_location, coordinates, num_clusters)):
+        labels[[position[loc] for loc in cluster]] = k
+    num_clusters = labels.max() + 1
+
+    for _ in range(iterations):
+        centroids = np.array([
+            np.average(points[labels == k], axis=0, weights=weights[labels == k]) if np.any(labels == k)
+            else points[0]
+            for k in range(num_clusters)
+        ])
+        distances = ((points[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+        new_labels = distances.argmin(axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+    clusters = []
+    for k in range(num_clusters):
+        members = [location_indices[i] for i in np.flatnonzero(labels == k)]
+        if members:
+            clusters.append((_angle(coordinates, points[labels == k].mean(axis=0)), members))
+    clusters.sort(key=lambda item: item[0])
+    return [members for _, members in clusters]
+
+
+def allocate_vehicles(cluster_demands, num_vehicles):
+    """
+    Splits the fleet over the clusters in proportion to their demand
+    (largest remainder), at least one vehicle per cluster.
+    Returns: list with the number of vehicles of each cluster.
+    """
+    total = sum(cluster_demands) or 1
+    spare = num_vehicles - len(cluster_demands)
+    shares = [spare * demand / total for demand in cluster_demands]
+    counts = [1 + int(share) for share in shares]
+    by_remainder = sorted(range(len(shares)), key=lambda k: (-(shares[k] - int(shares[k])), k))
+    for k in by_remainder[:num_vehicles - sum(counts)]:
+        counts[k] += 1
+    return counts
+
+
+# --- Sub-Problem Solves ---
+def _boundary_rounds(num_clusters):
+    """
+    Neighbouring cluster pairs (a ring in angle order) grouped into rounds of
+    disjoint pairs, so the pairs of one round can be re-solved in parallel.
+    Returns: list of rounds, each a list of (a, b) cluster pairs.
+    """
+    pairs = [(0, 1)] if num_clusters == 2 else [(k, (k + 1) % num_clusters) for k in range(num_clusters)]
+    rounds = []
+    while pairs:
+        used, this_round, rest = set(), [], []
+        for a, b in pairs:
+            if a in used or b in used:
+                rest.append((a, b))
+            else:
+                this_round.append((a, b))
+                used.update((a, b))
+        rounds.append(this_round)
+        pairs = rest
+    return rounds
+
+
+def _solve_l2_problems(problems, time_matrix, distance_matrix, vehicle_capacity, max_route_duration_mins,
+                       fixed_cost_per_truck, variable_cost_per_km, warm_start, pool, deadline, deterministic):
+    """
+    Solves (current_routes, pending_orders, num_vehicles) problems with
+    batch_optimization_vrp (fleet-cost objective), in parallel on the pool
+    when there is one.
+    Returns: one (routes, unassigned) per problem.
+    """
+    if pool is not None:
+        from parallel_alns import run_l2_many_in_pool
+        solutions = run_l2_many_in_pool(pool, problems, vehicle_capacity, max_route_duration_mins,
+                                        warm_start=warm_start, deadline=deadline,
+                                        fixed_cost_per_truck=fixed_cost_per_truck,
+                                        variable_cost_per_km=variable_cost_per_km, deterministic=deterministic)
+        return [(routes, unassigned) for routes, unassigned, _ in solutions]
+    return [
+        hsl.batch_optimization_vrp(current_routes, pending_orders, time_matrix, num_vehicles,
+                                   vehicle_capacity, max_route_duration_mins,
+                                   warm_start=warm_start, deadline=deadline, distance_matrix=distance_matrix,
+                                   fixed_cost_per_truck=fixed_cost_per_truck, variable_cost_per_km=variable_cost_per_km,
+                                   deterministic=deterministic)
+        for current_routes, pending_orders, num_vehicles in problems
+    ]
+
+
+def _solve_alns_problems(problems, time_matrix, distance_matrix, vehicle_capacity, max_route_duration_mins,
+                         fixed_cost_per_truck, variable_cost_per_km, pool, deadline, search_state, seed, clock):
+    """
+    Solves (current_routes, pending_orders, num_vehicles) problems with
+    run_alns_optimization, problem k seeded with seed + k (None: unseeded)
+    and continuing from a copy of search_state.
+    The problems run side by side: on the pool's workers, or in process on
+    copies of clock started at the same time (clock ends at the latest). In
+    process without a clock they share the time up to the deadline, one
+    after the other.
+    Returns: one (routes, unassigned, alns_state) per problem.
+    """
+    if pool is not None:
+        from parallel_alns import run_alns_many_in_pool
+        return run_alns_many_in_pool(pool, problems, vehicle_capacity, max_route_duration_mins,
+                                     fixed_cost_per_truck, variable_cost_per_km, deadline=deadline,
+                                     alns_state=search_state, base_seed=seed, clock=clock)
+    solutions = []
+    clock_units = []
+    for k, (current_routes, pending_orders, num_vehicles) in enumerate(problems):
+        problem_clock = copy.copy(clock)
+        problem_deadline = deadline
+        if clock is None and deadline is not None:
+            problem_deadline = time.time() + (deadline - time.time()) / (len(problems) - k)
+        if seed is not None:
+            random.seed(seed + k)
+        state = dict(search_state)
+        routes, unassigned = hsl.run_alns_optimization(
+            current_routes, pending_orders, time_matrix, distance_matrix, num_vehicles,
+            vehicle_capacity, max_route_duration_mins, fixed_cost_per_truck, variable_cost_per_km,
+            deadline=problem_deadline, alns_state=state, clock=problem_clock
+        )
+        solutions.append((routes, unassigned, state))
+        if clock is not None:
+            clock_units.append(problem_clock.units)
+    if clock_units:
+        clock.units = max(clock_units)
+    return solutions
+
+
+def _objective(routes, unassigned, distance_matrix, fixed_cost_per_truck, variable_cost_per_km):
+    cost, _, _ = hsl.calculate_total_fleet_cost(routes, distance_matrix, fixed_cost_per_truck, variable_cost_per_km)
+    return hsl.calculate_alns_objective(cost, unassigned, fixed_cost_per_truck)
+
+
+def _decomposed_solve(current_routes, pending_orders, time_matrix, distance_matrix, locations, num_vehicles,
+                      fixed_cost_per_truck, variable_cost_per_km, num_clusters, method, boundary_reoptimization,
+                      solve_problems, label):
+    """
+    Steps 1-4 of decomposed_optimization_vrp, with the sub-problems solved
+    by solve_problems(problems, warm_start, phases_left): problems is a list
+    of (current_routes, pending_orders, num_vehicles), and phases_left counts
+    this call and the calls still to come (the cluster solves, then one per
+    boundary round). It returns one (routes, unassigned) per problem.
+    Returns: (routes, unassigned).
+    """
+    all_orders = pending_orders[:]
+    for route in current_routes.values():
+        all_orders.extend(route)
+    if not all_orders:
+        return {i: [] for i in range(num_vehicles)}, []
+
+    # 1. Clusters and vehicle subsets
+    demand_by_location = {}
+    for order in all_orders:
+        demand_by_location[order['index']] = demand_by_location.get(order['index'], 0) + order['demand']
+    if num_clusters is None:
+        num_clusters = math.ceil(len(all_orders) / DECOMPOSITION_ORDERS_PER_CLUSTER)
+    num_clusters = max(1, min(num_clusters, num_vehicles, len(demand_by_location)))
+    coordinates = location_coordinates(locations, time_matrix)
+    if method == 'kmeans':
+        location_clusters = kmeans_clusters(demand_by_location, coordinates, num_clusters)
+    else:
+        location_clusters = sweep_clusters(demand_by_location, coordinates, num_clusters)
+    cluster_of_location = {loc: k for k, cluster in enumerate(location_clusters) for loc in cluster}
+    cluster_orders = [[] for _ in location_clusters]
+    for order in all_orders:
+        cluster_orders[cluster_of_location[order['index']]].append(order)
+    vehicle_counts = allocate_vehicles(
+        [sum(demand_by_location[loc] for loc in cluster) for cluster in location_clusters], num_vehicles
+    )
+    cluster_vehicles = []
+    next_vehicle = 0
+    for count in vehicle_counts:
+        cluster_vehicles.append(list(range(next_vehicle, next_vehicle + count)))
+        next_vehicle += count
+    boundary_rounds = []
+    if boundary_reoptimization and len(location_clusters) > 1:
+        boundary_rounds = _boundary_rounds(len(location_clusters))
+    print(f"--- [{label} DECOMPOSED] {len(all_orders)} orders -> {len(location_clusters)} {method} clusters, "
+          f"vehicles per cluster: {vehicle_counts} ---")
+
+    # 2. Independent cluster solves (each cluster starts from scratch: the
+    # incumbent routes do not follow the cluster boundaries)
+    problems = [
+        ({i: [] for i in range(len(vehicles))}, orders, len(vehicles))
+        for orders, vehicles in zip(cluster_orders, cluster_vehicles)
+    ]
+    solutions = solve_problems(problems, False, 1 + len(boundary_rounds))
+
+    # 3. Stitch the clusters back onto the global vehicle IDs
+    routes = {i: [] for i in range(num_vehicles)}
+    unassigned_by_cluster = []
+    for (cluster_routes, cluster_unassigned), vehicles in zip(solutions, cluster_vehicles):
+        for local_id, route in cluster_routes.items():
+            routes[vehicles[local_id]] = route
+        unassigned_by_cluster.append(cluster_unassigned)
+
+    # 4. Boundary re-optimization between neighbouring clusters
+    for round_index, round_pairs in enumerate(boundary_rounds):
+        problems = []
+        for a, b in round_pairs:
+            vehicles = cluster_vehicles[a] + cluster_vehicles[b]
+            problems.append((
+                {local_id: routes[v_id] for local_id, v_id in enumerate(vehicles)},
+                unassigned_by_cluster[a] + unassigned_by_cluster[b],
+                len(vehicles)
+            ))
+        solutions = solve_problems(problems, True, len(boundary_rounds) - round_index)
+        for (a, b), problem, (pair_routes, pair_unassigned) in zip(round_pairs, problems, solutions):
+            before = _objective(problem[0], problem[1], distance_matrix, fixed_cost_per_truck, variable_cost_per_km)
+            after = _objective(pair_routes, pair_unassigned, distance_matrix, fixed_cost_per_truck, variable_cost_per_km)
+            if after < before:
+                vehicles = cluster_vehicles[a] + cluster_vehicles[b]
+                for local_id, v_id in enumerate(vehicles):
+                    routes[v_id] = pair_routes[local_id]
+                # The pair's unassigned orders now belong to its first cluster
+                unassigned_by_cluster[a] = pair_unassigned
+                unassigned_by_cluster[b] = []
+                print(f"--- [{label} DECOMPOSED] Boundary {a}-{b}: objective {before:.2f} -> {after:.2f} ---")
+
+    unassigned = [order for cluster_unassigned in unassigned_by_cluster for order in cluster_unassigned]
+    return routes, unassigned
+
+
+def decomposed_optimization_vrp(current_routes, pending_orders, time_matrix, distance_matrix, locations,
+                                num_vehicles, vehicle_capacity, max_route_duration_mins,
+                                fixed_cost_per_truck, variable_cost_per_km,
+                                num_clusters=None, method=DECOMPOSITION_METHOD,
+                                boundary_reoptimization=DECOMPOSITION_BOUNDARY_REOPT,
+                                pool=None, deadline=None, deterministic=False):
+    """
+    Cluster-first, route-second Layer 2 for large instances.
+    1. Clusters all orders (routes + pending) by location, with sweep or
+       k-means (num_clusters defaults to one per DECOMPOSITION_ORDERS_PER_CLUSTER
+       orders, at most one per vehicle), and splits the fleet over the
+       clusters in proportion to their demand.
+    2. Solves every cluster with batch_optimization_vrp on its own vehicles,
+       in parallel when a pool (see parallel_alns.create_alns_pool) is given.
+    3. Stitches the cluster routes back onto the global vehicle IDs.
+    4. With boundary_reoptimization, re-solves each pair of neighbouring
+       clusters together, warm-started from the stitched routes, and keeps
+       the result when it lowers the ALNS objective (fleet cost plus the
+       unassigned penalty). Disjoint pairs are solved in parallel.
+    deterministic: see batch_optimization_vrp.
+    Returns: (routes, unassigned) like batch_optimization_vrp.
+    """
+    def solve_problems(problems, warm_start, phases_left):
+        # Every solve sizes its own limits (L2_TIME_LIMIT_PER_NODE) up to the deadline
+        return _solve_l2_problems(problems, time_matrix, distance_matrix, vehicle_capacity, max_route_duration_mins,
+                                  fixed_cost_per_truck, variable_cost_per_km, warm_start, pool, deadline,
+                                  deterministic)
+
+    return _decomposed_solve(current_routes, pending_orders, time_matrix, distance_matrix, locations, num_vehicles,
+                             fixed_cost_per_truck, variable_cost_per_km, num_clusters, method,
+                             boundary_reoptimization, solve_problems, "LAYER 2")
+
+
+def decomposed_alns_optimization(current_routes, pending_orders, time_matrix, distance_matrix, locations,
+                                 num_vehicles, vehicle_capacity, max_route_duration_mins,
+                                 fixed_cost_per_truck, variable_cost_per_km,
+                                 num_clusters=None, method=DECOMPOSITION_METHOD,
+                                 boundary_reoptimization=DECOMPOSITION_BOUNDARY_REOPT,
+                                 pool=None, deadline=None, alns_state=None, seed=None, clock=None):
+    """
+    Cluster-first, route-second Layer 3: the steps of
+    decomposed_optimization_vrp with run_alns_optimization as the solver.
+    The boundary searches start from the stitched routes, so they never
+    return a worse pair.
+    The time up to the deadline is shared equally by the cluster solves and
+    the boundary rounds, which run one after the other; the searches of one
+    phase run side by side (see _solve_alns_problems). deadline and clock
+    are as in run_alns_optimization. No cancel token or lower bound is
+    passed on: they apply to the whole instance, not to a cluster.
+    Continuation: every search starts from the operator weights and
+    temperature in alns_state, and those of the largest cluster are written
+    back. Elites are solutions of the whole instance and are not used.
+    Returns: (routes, unassigned) like run_alns_optimization.
+    """
+    if alns_state is None:
+        alns_state = {}
+    now = clock.now if clock is not None else time.time
+    search_state = {key: alns_state[key] for key in ('weights', 'temperature') if key in alns_state}
+    cluster_states = []
+
+    def solve_problems(problems, warm_start, phases_left):
+        # The stitched routes are the search's starting point either way
+        phase_deadline = None if deadline is None else now() + max(0.0, deadline - now()) / phases_left
+        solutions = _solve_alns_problems(problems, time_matrix, distance_matrix, vehicle_capacity,
+                                         max_route_duration_mins, fixed_cost_per_truck, variable_cost_per_km,
+                                         pool, phase_deadline, search_state, seed, clock)
+        if not cluster_states:
+            # The first phase solves the clusters, each with all its orders pending
+            cluster_states.extend((len(problem[1]), state) for problem, (_, _, state) in zip(problems, solutions))
+        return [(routes, unassigned) for routes, unassigned, _ in solutions]
+
+    routes, unassigned = _decomposed_solve(current_routes, pending_orders, time_matrix, distance_matrix, locations,
+                                           num_vehicles, fixed_cost_per_truck, variable_cost_per_km, num_clusters,
+                                           method, boundary_reoptimization, solve_problems, "LAYER 3")
+    if cluster_states:
+        _, largest_state = max(cluster_states, key=lambda item: item[0])
+        alns_state['weights'] = largest_state['weights']
+        alns_state['temperature'] = largest_state['temperature']
+        alns_state['cycles'] = alns_state.get('cycles', 0) + 1
+    return routes, unassigned
@@ -1,14 +1,32 @@
-import copy
 import random
-from collections import deque
-from optimization_solver_layers import solve_vrp_with_capacity # We import our new engine
+import functools
+from collections import OrderedDict, deque
+import numpy as np
+from optimization_solver_layers import solve_vrp_with_capacity, SERVICE_TIME_MINUTES # We import our new engine
+from solution_cache import solution_fingerprint
 import math
 import time
 # --- Helper Function ---
 
+# --- Layer 2 Parameters ---
+L2_BUNDLE_COLOCATED_ORDERS = True # Merge orders at the same location into one solver node per bundle
+L2_BUNDLE_CAPACITY_FRACTION = 0.25 # Max bundle demand as a share of vehicle capacity (full-truck bundles
+                                   # take away the solver's freedom to split a location across trucks)
+L2_DROP_PENALTY_PER_ORDER = 1000000 # OR-Tools disjunction penalty for each unserved order (travel-time objective)
+L2_WARM_START = True # Start the L2 search from the incumbent routes instead of from scratch
+L2_GAP_TOLERANCE = 0.01 # With a lower bound: stop once the ALNS objective of the best is within this share of it
+L2_COST_SCALE = 100 # Fleet-cost objective: OR-Tools costs are integers, in 1/L2_COST_SCALE cost units
+
+# --- Layer 1 Parameters ---
+L1_TABU_MAX_NON_IMPROVING = 10 # Stop the L1 tabu refinement after this many non-improving moves
+L1_CANDIDATE_LIST_SIZE = 5     # Nearest neighbours per stop scanned by the inter-route moves
+L1_INTER_ROUTE_MAX_MOVES = 10  # Max improving inter-route moves applied per new order
+
 # --- ALNS Parameters (can be tuned) ---
-ALNS_ITERATIONS = 5000     # How many iterations to run
+ALNS_ITERATIONS = 5000     # How many iterations to run (upper bound, see deadline)
+ALNS_MAX_NON_IMPROVING = 1500 # Stop after this many iterations without a new best (None = never)
 ALNS_SEGMENT_LENGTH = 50   # How often to update operator weights
+ALNS_MIGRATION_INTERVAL = 100 # Island model: iterations between elite exchanges
 ALNS_REACTION_FACTOR = 0.7 # How much new scores influence weights (0 to 1)
 # Acceptance criteria (Simulated Annealing based)
 ALNS_TEMP_START = 1000
@@ -17,38 +35,144 @@ ALNS_COOLING_RATE = 0.995 # T_new = T_old * cooling_rate
 # Destroy control (% of orders to remove)
 ALNS_DESTROY_MIN_PERCENT = 0.15
 ALNS_DESTROY_MAX_PERCENT = 0.40
+# Destroy operator tuning
+ALNS_REMOVAL_RANDOMNESS = 3    # p in the y^p randomised pick of worst/Shaw/route removal
+ALNS_SHAW_DISTANCE_WEIGHT = 9  # Shaw relatedness weights (distance, time, demand)
+ALNS_SHAW_TIME_WEIGHT = 3
+ALNS_SHAW_DEMAND_WEIGHT = 2
+ALNS_MIN_OPERATOR_WEIGHT = 0.05 # Keeps every operator selectable
+ALNS_UNASSIGNED_PENALTY_TRUCKS = 10 # Penalty per unassigned order, in truck fixed costs
+ALNS_ELITE_POOL_SIZE = 5      # Best distinct solutions carried to the next cycle (warm start)
+ALNS_WARM_REHEAT_FRACTION = 0.1 # A continued search restarts at least at this share of temp_start
+ALNS_GAP_TOLERANCE = 0.01     # With a lower bound: stop once the best is within this share of it
 # Operator Scores
-ALNS_SIGMA1 = 1 # Score for finding new global best  10
-ALNS_SIGMA2 = 1  # Score for finding solution better than current 5
-ALNS_SIGMA3 = 1  # Score for accepting worse solution (exploration) 2
+ALNS_SIGMA1 = 10 # Score for finding new global best
+ALNS_SIGMA2 = 5  # Score for finding solution better than current
+ALNS_SIGMA3 = 2  # Score for accepting worse solution (exploration)
 
 
-def calculate_raw_route_distance(stop_indices, distance_matrix):
+# --- Matrix Versions ---
+# The caches derived from a matrix (route sums, candidate lists, NumPy
+# copies) are keyed by its version: a hash of its contents, taken the first
+# time the matrix is seen and re-taken by refresh_matrix_versions() at the
+# start of every layer call (L1 assignment, L2, ALNS). A matrix edited in
+# place therefore gets a new version at the next layer call, its old entries
+# become unreachable, and equal matrices share their entries. The table of
+# known matrices is a small LRU: it keeps at most MATRIX_VERSION_TABLE_SIZE
+# matrices alive (so their ids are not reused while they are in it).
+MATRIX_VERSION_TABLE_SIZE = 8
+
+_matrix_versions = OrderedDict()  # id(matrix) -> (matrix, version), least recently used first
+_matrices_by_version = {}         # version -> a known matrix with that content
+
+def _matrix_content_hash(matrix):
+    if isinstance(matrix, np.ndarray):
+        return hash((matrix.shape, matrix.tobytes()))
+    return hash(tuple(map(tuple, matrix)))
+
+def _forget_matrix(matrix_id):
+    matrix, version = _matrix_versions.pop(matrix_id)
+    if _matrices_by_version.get(version) is matrix:
+        del _matrices_by_version[version]
+        for other, other_version in _matrix_versions.values():
+            if other_version == version:
+                _matrices_by_version[version] = other
+                break
+
+def _register_matrix(matrix):
+    matrix_id = id(matrix)
+    if matrix_id in _matrix_versions:
+        _forget_matrix(matrix_id)
+    version = _matrix_content_hash(matrix)
+    _matrix_versions[matrix_id] = (matrix, version)
+    _matrices_by_version.setdefault(version, matrix)
+    while len(_matrix_versions) > MATRIX_VERSION_TABLE_SIZE:
+        _forget_matrix(next(iter(_matrix_versions)))
+    return version
+
+def _matrix_version(matrix):
+    """Returns: the version of matrix (hashing it only the first time it is seen)."""
+    entry = _matrix_versions.get(id(matrix))
+    if entry is not None and entry[0] is matrix:
+        _matrix_versions.move_to_end(id(matrix))
+        return entry[1]
+    return _register_matrix(matrix)
+
+def refresh_matrix_versions(*matrices):
+    """Re-hashes the given matrices, so in-place edits since the last call are seen."""
+    for matrix in matrices:
+        if matrix is not None:
+            _register_matrix(matrix)
+
+def invalidate_route_cost_cache(matrix=None):
     """
-    Calculates the total travel distance for a list of stop indices.
-    Assumes depot is start (0) and end (0).
-    e.g., [5, 3] -> dist(0,5) + dist(5,3) + dist(3,0)
+    With a matrix, re-hashes it right away (the layer calls do this on entry
+    anyway); without, drops every cached route sum and matrix version.
     """
-    if not stop_indices:
-        return 0
-    
-    total_distance = 0
+    if matrix is not None:
+        refresh_matrix_versions(matrix)
+        return
+    _cached_route_sum_by_version.cache_clear()
+    _matrix_versions.clear()
+    _matrices_by_version.clear()
+    _candidate_list_cache['version'] = None
+    _int_matrix_cache['version'] = None
+    _float_matrix_cache['version'] = None
+    _service_time_cache['version'] = None
+    _service_time_versions.clear()
+
+# --- Route Cost Cache ---
+# The same stop sequences are costed over and over (L1 insertion, ALNS
+# repairs, the KPIs of the report), so raw route sums are memoised in an LRU
+# keyed by (matrix version, stop tuple).
+# The LRU is functools.lru_cache: a lookup costs about as much as summing a
+# short route in Python, so anything slower would not pay for itself.
+ROUTE_COST_CACHE_SIZE = 50000
+ROUTE_COST_CACHE_MIN_STOPS = 6 # Shorter routes are summed directly, as fast as a lookup
+
+def route_cost_cache_stats():
+    """Returns: {'size', 'hits', 'misses', 'hit_rate'} of the route cost cache."""
+    info = _cached_route_sum_by_version.cache_info()
+    lookups = info.hits + info.misses
+    return {'size': info.currsize, 'hits': info.hits, 'misses': info.misses,
+            'hit_rate': info.hits / lookups if lookups else 0.0}
+
+def _raw_route_sum(stop_indices, matrix, matrix_name):
+    """Sum of matrix values along depot -> stop_indices -> depot (inf on a bad index)."""
+    total = 0
     last_idx = 0 # Start at depot
-    
+
     for stop_idx in stop_indices:
         # --- Basic Bounds Check ---
-        if last_idx >= len(distance_matrix) or stop_idx >= len(distance_matrix[last_idx]):
-             print(f"Error: Index out of bounds in distance_matrix access ({last_idx}, {stop_idx})")
+        if last_idx >= len(matrix) or stop_idx >= len(matrix[last_idx]):
+             print(f"Error: Index out of bounds in {matrix_name} access ({last_idx}, {stop_idx})")
              return float('inf') # Return infinity on error
-        total_distance += distance_matrix[last_idx][stop_idx]
+        total += matrix[last_idx][stop_idx]
         last_idx = stop_idx
-        
+
     # Return to depot
-    if last_idx >= len(distance_matrix) or 0 >= len(distance_matrix[last_idx]):
+    if last_idx >= len(matrix) or 0 >= len(matrix[last_idx]):
         print(f"Error: Index out of bounds returning to depot ({last_idx}, 0)")
         return float('inf')
-    total_distance += distance_matrix[last_idx][0]
-    return total_distance
+    total += matrix[last_idx][0]
+    return total
+
+@functools.lru_cache(maxsize=ROUTE_COST_CACHE_SIZE)
+def _cached_route_sum_by_version(version, stops, matrix_name):
+    return _raw_route_sum(stops, _matrices_by_version[version], matrix_name)
+
+def _cached_route_sum(stop_indices, matrix, matrix_name):
+    if len(stop_indices) < ROUTE_COST_CACHE_MIN_STOPS:
+        return _raw_route_sum(stop_indices, matrix, matrix_name) if stop_indices else 0
+    return _cached_route_sum_by_version(_matrix_version(matrix), tuple(stop_indices), matrix_name)
+
+def calculate_raw_route_distance(stop_indices, distance_matrix):
+    """
+    Calculates the total travel distance for a list of stop indices.
+    Assumes depot is start (0) and end (0).
+    e.g., [5, 3] -> dist(0,5) + dist(5,3) + dist(3,0)
+    """
+    return _cached_route_sum(stop_indices, distance_matrix, "distance_matrix")
 
 def calculate_raw_route_time(stop_indices, time_matrix):
     """
@@ -56,27 +180,63 @@ def calculate_raw_route_time(stop_indices, time_matrix):
     Assumes depot is start (0) and end (0).
     e.g., [5, 3] -> time(0,5) + time(5,3) + time(3,0)
     """
-    if not stop_indices:
-        return 0
-    
-    total_time = 0
-    last_idx = 0 # Start at depot
-    
-    for stop_idx in stop_indices:
-        # --- Basic Bounds Check ---
-        if last_idx >= len(time_matrix) or stop_idx >= len(time_matrix[last_idx]):
-             print(f"Error: Index out of bounds in time_matrix access ({last_idx}, {stop_idx})")
-             return float('inf') # Return infinity on error
-        total_time += time_matrix[last_idx][stop_idx]
-        last_idx = stop_idx
-        
-    # Return to depot
-    if last_idx >= len(time_matrix) or 0 >= len(time_matrix[last_idx]):
-        print(f"Error: Index out of bounds returning to depot ({last_idx}, 0)")
-        return float('inf')
-        
-    total_time += time_matrix[last_idx][0]
-    return total_time
+    return _cached_route_sum(stop_indices, time_matrix, "time_matrix")
+
+# --- Service Time ---
+# L1, ALNS and L2 time a route the same way: travel time along its stop
+# sequence plus SERVICE_TIME_PER_STOP at every stop. The service time is
+# folded into the time matrix (added to every arc leaving a customer for
+# another location) by with_service_time() at each layer's entry point, so
+# the route durations, the duration limit checks and the L2 transits all
+# see it. Consecutive orders at one location are one stop, served once.
+SERVICE_TIME_PER_STOP = SERVICE_TIME_MINUTES * 60 # Time at each stop, in time-matrix units (seconds)
+
+_service_time_cache = {'version': None, 'matrix': None}
+_service_time_versions = set() # Versions of matrices that already include the service time
+
+def with_service_time(time_matrix):
+    """
+    Returns: a list-of-lists copy of time_matrix in which every arc i -> j
+    with i != 0 and i != j costs SERVICE_TIME_PER_STOP more (cached for the
+    last matrix version). A matrix returned by this function is handed back
+    unchanged, so a layer may pass its matrix on to another one.
+    """
+    version = _matrix_version(time_matrix)
+    if version in _service_time_versions:
+        return time_matrix
+    cache = _service_time_cache
+    if cache['version'] != version:
+        folded = _as_float_array(time_matrix) + SERVICE_TIME_PER_STOP
+        folded[0, :] -= SERVICE_TIME_PER_STOP
+        np.fill_diagonal(folded, np.diagonal(_as_float_array(time_matrix)))
+        folded_matrix = folded.tolist()
+        _service_time_versions.add(_matrix_version(folded_matrix))
+        cache['version'], cache['matrix'] = version, folded_matrix
+    return cache['matrix']
+
+# --- Route State Helpers (copy-on-write) ---
+# A routes dict maps v_id -> list of order objects. Order objects are treated
+# as immutable and are shared between every state that contains them, and a
+# route list is never mutated once it is part of a routes dict. A "copy" of
+# the fleet state is therefore a new dict pointing at the same route lists,
+# and only the routes touched by a move are rebuilt.
+
+def _clone_routes(routes_dict):
+    """
+    Returns a new routes dict sharing the (immutable) route lists.
+    O(num_vehicles) instead of a deepcopy of every order.
+    """
+    return dict(routes_dict)
+
+def _with_route(routes_dict, vehicle_id, new_route_orders):
+    """
+    Returns a new routes dict in which only vehicle_id's route is replaced.
+    All other routes are shared with routes_dict.
+    """
+    new_routes = dict(routes_dict)
+    new_routes[vehicle_id] = new_route_orders
+    return new_routes
+
 # --- Main Cost Calculation Functions ---
 def calculate_total_fleet_cost(routes_dict, distance_matrix, 
                                fixed_cost_per_truck, variable_cost_per_km):
@@ -109,6 +269,13 @@ def calculate_total_fleet_cost(routes_dict, distance_matrix,
                  (variable_cost_per_km * total_distance)
                  
     return total_cost, num_trucks_used, total_distance
+def calculate_alns_objective(fleet_cost, unassigned_orders, fixed_cost_per_truck):
+    """
+    The objective ALNS minimises: fleet cost plus a heavy penalty
+    (ALNS_UNASSIGNED_PENALTY_TRUCKS trucks' worth) per unassigned order.
+    """
+    return fleet_cost + (len(unassigned_orders) * fixed_cost_per_truck * ALNS_UNASSIGNED_PENALTY_TRUCKS)
+
 def calculate_route_cost(route_orders, time_matrix):
     """
     Calculates the travel time (in minutes) for a route
@@ -135,7 +302,7 @@ def calculate_total_cost(routes_dict, time_matrix):
         total_cost += calculate_route_cost(route_orders, time_matrix)
     return total_cost
 
-# --- LAYER 1: IMMEDIATE ASSIGNMENT (Greedy + Tabu) ---
+# --- LAYER 1: IMMEDIATE ASSIGNMENT (Greedy + Tabu + Inter-Route) ---
 
 def _greedy_insert_capacity(new_order, current_routes, time_matrix, 
                            vehicle_capacity, max_route_duration_mins):
@@ -193,8 +360,11 @@ def _greedy_insert_capacity(new_order, current_routes, time_matrix,
 
     # 2. If we found a good insertion, return the new state
     if best_vehicle != -1:
-        new_routes_state = copy.deepcopy(current_routes)
-        new_routes_state[best_vehicle].insert(best_insertion_idx, new_order)
+        route_orders = current_routes[best_vehicle]
+        new_routes_state = _with_route(
+            current_routes, best_vehicle,
+            route_orders[:best_insertion_idx] + [new_order] + route_orders[best_insertion_idx:]
+        )
         return new_routes_state, "Best Insertion"
 
     # 3. If no insertion worked, try to put it in an EMPTY vehicle
@@ -205,8 +375,7 @@ def _greedy_insert_capacity(new_order, current_routes, time_matrix,
         # Find the first empty vehicle
         for v_id, route_orders in current_routes.items():
             if not route_orders:
-                new_routes_state = copy.deepcopy(current_routes)
-                new_routes_state[v_id].append(new_order)
+                new_routes_state = _with_route(current_routes, v_id, [new_order])
                 return new_routes_state, "New Vehicle"
 
     # 4. If all else fails, return None
@@ -254,80 +423,478 @@ def log_vehicle_changes(old_routes, new_routes, assigned_order, method, timestam
                     "stop_names": [all_locations[idx]['original_address'].split(',')[0] for idx in unique_stops]
                 })
             break # Stop after finding the vehicle that changed
+# --- Stop-Sequence Helpers (used by the delta-evaluated local searches) ---
+# The cost of a route only depends on its unique stops in first-visit order
+# (see calculate_route_cost), so the local searches work on that stop
+# sequence and keep the orders of each stop grouped behind it.
+
+def _route_to_stop_groups(route_orders):
+    """
+    Splits a route into its stop sequence and the orders served at each stop.
+    Returns: stops (list of location indices in first-visit order),
+             groups ({location index: [order_obj, ...]})
+    """
+    groups = {}
+    for order in route_orders:
+        loc_idx = order['index']
+        if loc_idx in groups:
+            groups[loc_idx].append(order)
+        else:
+            groups[loc_idx] = [order]
+    return list(groups), groups
+
+def _stop_groups_to_route(stops, groups):
+    """Inverse of _route_to_stop_groups: expands a stop sequence back to orders."""
+    route_orders = []
+    for loc_idx in stops:
+        route_orders.extend(groups[loc_idx])
+    return route_orders
+
+def _path_prefix_sums(path, time_matrix):
+    """
+    For a closed path [0, s1, ..., sn, 0] returns (fwd, bwd) prefix sums where
+    fwd[k] is the cost of the first k arcs and bwd[k] the cost of the same
+    arcs traversed backwards. Reversing any segment can then be costed in O(1),
+    even on an asymmetric matrix.
+    """
+    fwd = [0] * len(path)
+    bwd = [0] * len(path)
+    for k in range(1, len(path)):
+        a, b = path[k - 1], path[k]
+        fwd[k] = fwd[k - 1] + time_matrix[a][b]
+        bwd[k] = bwd[k - 1] + time_matrix[b][a]
+    return fwd, bwd
+
+def _best_intra_route_move(path, fwd, bwd, time_matrix, max_route_raw,
+                           tabu_set, aspiration_delta):
+    """
+    Scans the swap, 2-opt and or-opt neighbourhoods of one route, each move
+    costed in O(1) from the prefix sums.
+    Returns: (delta, move, tabu_key) for the best admissible move, or None.
+    A tabu move is admissible only if its delta beats aspiration_delta
+    (i.e. it would produce a new best solution).
+    """
+    n = len(path) - 2  # Number of stops (path has a depot at both ends)
+    m = time_matrix
+    best = None
+    # Moves that would break the duration limit are never better than this
+    best_delta = max_route_raw - fwd[-1] + 1e-9
+
+    for i in range(1, n + 1):
+        a, pi, pi_next = path[i - 1], path[i], path[i + 1]
+        for j in range(i + 1, n + 1):
+            pj, b = path[j], path[j + 1]
+
+            # a) Swap stops i and j
+            if j == i + 1:
+                delta = (m[a][pj] + m[pj][pi] + m[pi][b]) - (m[a][pi] + m[pi][pj] + m[pj][b])
+            else:
+                pj_prev = path[j - 1]
+                delta = (m[a][pj] + m[pj][pi_next] + m[pj_prev][pi] + m[pi][b]) - \
+                        (m[a][pi] + m[pi][pi_next] + m[pj_prev][pj] + m[pj][b])
+            if delta < best_delta:
+                tabu_key = (pi, pj) if pi < pj else (pj, pi)
+                if tabu_key not in tabu_set or delta < aspiration_delta:
+                    best_delta = delta
+                    best = (delta, ('swap', i, j), tabu_key)
+
+            # b) 2-opt: reverse segment i..j (adjacent case is the swap above)
+            if j > i + 1:
+                delta = (m[a][pj] + m[pi][b] + bwd[j] - bwd[i]) - \
+                        (m[a][pi] + m[pj][b] + fwd[j] - fwd[i])
+                if delta < best_delta:
+                    tabu_key = (pi, pj) if pi < pj else (pj, pi)
+                    if tabu_key not in tabu_set or delta < aspiration_delta:
+                        best_delta = delta
+                        best = (delta, ('2opt', i, j), tabu_key)
+
+    # c) Or-opt: move a segment of 1-3 stops to another position
+    for seg_len in (1, 2, 3):
+        for i in range(1, n - seg_len + 2):
+            e = i + seg_len - 1
+            a, pi, pe, b = path[i - 1], path[i], path[e], path[e + 1]
+            removal_delta = m[a][b] - m[a][pi] - m[pe][b]
+            row_pe = m[pe]
+            for k in range(0, n + 1):
+                if i - 1 <= k <= e:
+                    continue
+                pk, pk_next = path[k], path[k + 1]
+                delta = removal_delta + m[pk][pi] + row_pe[pk_next] - m[pk][pk_next]
+                if delta < best_delta:
+                    tabu_key = (pi, pk) if pi < pk else (pk, pi)
+                    if tabu_key not in tabu_set or delta < aspiration_delta:
+                        best_delta = delta
+                        best = (delta, ('oropt', i, e, k), tabu_key)
+
+    return best
+
+def _apply_intra_route_move(stops, move):
+    """Returns a new stop list with the move applied (the input is not mutated)."""
+    kind = move[0]
+    # Move positions are in path coordinates (stop s sits at path position s+1)
+    if kind == 'swap':
+        i, j = move[1] - 1, move[2] - 1
+        new_stops = stops[:]
+        new_stops[i], new_stops[j] = new_stops[j], new_stops[i]
+    elif kind == '2opt':
+        i, j = move[1] - 1, move[2] - 1
+        new_stops = stops[:i] + stops[i:j + 1][::-1] + stops[j + 1:]
+    else: # 'oropt'
+        i, e, k = move[1] - 1, move[2] - 1, move[3]
+        segment = stops[i:e + 1]
+        rest = stops[:i] + stops[e + 1:]
+        insert_at = k if k < i else k - len(segment)
+        new_stops = rest[:insert_at] + segment + rest[insert_at:]
+    return new_stops
+
 def _tabu_search_capacity(initial_solution, time_matrix, 
                          vehicle_capacity, max_route_duration_mins,
-                         iterations=50, tabu_tenure=10):
+                         iterations=50, tabu_tenure=10, vehicle_ids=None,
+                         max_non_improving=None):
     """
     (Adapted from your v1)
-    Performs a Tabu Search (2-opt swap) on routes made of *order objects*.
-    It swaps *orders* in the list, and calculate_route_cost handles the
-    change in path cost automatically.
+    Performs a Tabu Search on routes made of *order objects*, using swap,
+    2-opt and or-opt moves on each route's stop sequence.
+    Every move is costed in O(1) (see _path_prefix_sums), the tabu list is
+    a set with FIFO expiry, and the fleet cost is tracked by deltas.
+    vehicle_ids restricts the search to those routes (default: all).
+    max_non_improving stops the search after that many iterations without
+    a new best (default: run all iterations).
+    Capacity is unchanged by intra-route moves.
     """
     if not initial_solution: 
         return None
-        
-    best_solution = copy.deepcopy(initial_solution)
-    best_cost = calculate_total_cost(best_solution, time_matrix)
-    current_solution = copy.deepcopy(initial_solution)
-    tabu_list = deque(maxlen=tabu_tenure)
-    
+
+    if vehicle_ids is None:
+        vehicle_ids = list(initial_solution.keys())
+    max_route_raw = max_route_duration_mins * 60.0
+
+    # Per-route search state: stops, groups, closed path and prefix sums
+    route_groups = {}
+    current_stops = {}
+    route_paths = {}
+    for vehicle_id in vehicle_ids:
+        route_orders = initial_solution.get(vehicle_id)
+        if not route_orders or len(route_orders) < 2:
+            continue
+        stops, groups = _route_to_stop_groups(route_orders)
+        if len(stops) < 2:
+            continue
+        route_groups[vehicle_id] = groups
+        current_stops[vehicle_id] = stops
+        path = [0] + stops + [0]
+        route_paths[vehicle_id] = (path,) + _path_prefix_sums(path, time_matrix)
+
+    if not current_stops:
+        return _clone_routes(initial_solution)
+
+    best_stops = dict(current_stops)
+    current_delta_total = 0  # Current cost minus initial cost (raw units)
+    best_delta_total = 0
+    tabu_set = set()
+    tabu_queue = deque()
+    non_improving = 0
+
     for _ in range(iterations):
-        neighborhood = []
-        
-        # Find all valid swaps
-        for vehicle_id, route_orders in current_solution.items():
-            if len(route_orders) > 1:
-                for i in range(len(route_orders)):
-                    for j in range(i + 1, len(route_orders)):
-                        
-                        # Get the *location indices* of the orders
-                        order_i_idx = route_orders[i]['index']
-                        order_j_idx = route_orders[j]['index']
-                        
-                        # Don't swap orders for the same location
-                        if order_i_idx == order_j_idx:
-                            continue
-                        
-                        # Check tabu list (uses location indices)
-                        if (order_i_idx, order_j_idx) in tabu_list or (order_j_idx, order_i_idx) in tabu_list:
-                            continue
-                            
-                        # Create neighbor by swapping *orders*
-                        neighbor_route_orders = route_orders[:]
-                        neighbor_route_orders[i], neighbor_route_orders[j] = neighbor_route_orders[j], neighbor_route_orders[i]
-                        
-                        # Check duration constraint
-                        if calculate_route_cost(neighbor_route_orders, time_matrix) <= max_route_duration_mins:
-                            # (Capacity is unchanged by a swap)
-                            neighborhood.append((vehicle_id, neighbor_route_orders, (order_i_idx, order_j_idx)))
-        
-        if not neighborhood:
+        best_move = None
+        best_move_vehicle = -1
+        # A tabu move is allowed if it leads to a new best solution
+        aspiration_delta = best_delta_total - current_delta_total
+
+        for vehicle_id, (path, fwd, bwd) in route_paths.items():
+            candidate = _best_intra_route_move(
+                path, fwd, bwd, time_matrix, max_route_raw, tabu_set, aspiration_delta
+            )
+            if candidate and (best_move is None or candidate[0] < best_move[0]):
+                best_move = candidate
+                best_move_vehicle = vehicle_id
+
+        if best_move is None:
             break # No valid moves found
 
-        # Find the best move in the neighborhood
-        best_neighbor_vehicle, best_neighbor_route, best_neighbor_cost_change, best_tabu_move = -1, None, float('inf'), None
-        
-        for vehicle_id, neighbor_route_orders, tabu_move in neighborhood:
-            cost_change = calculate_route_cost(neighbor_route_orders, time_matrix) - calculate_route_cost(current_solution[vehicle_id], time_matrix)
-            
-            if cost_change < best_neighbor_cost_change:
-                best_neighbor_cost_change = cost_change
-                best_neighbor_vehicle = vehicle_id
-                best_neighbor_route = neighbor_route_orders
-                best_tabu_move = tabu_move
-                
-        if best_neighbor_vehicle != -1:
-            # Apply the best move
-            current_solution[best_neighbor_vehicle] = best_neighbor_route
-            tabu_list.append(best_tabu_move)
-            
-            current_cost = calculate_total_cost(current_solution, time_matrix)
-            if current_cost < best_cost:
-                best_solution = copy.deepcopy(current_solution)
-                best_cost = current_cost
-                
+        # Apply the best move (rebuild only that route's state)
+        delta, move, tabu_key = best_move
+        new_stops = _apply_intra_route_move(current_stops[best_move_vehicle], move)
+        current_stops[best_move_vehicle] = new_stops
+        path = [0] + new_stops + [0]
+        route_paths[best_move_vehicle] = (path,) + _path_prefix_sums(path, time_matrix)
+        current_delta_total += delta
+
+        if tabu_key not in tabu_set:
+            tabu_set.add(tabu_key)
+            tabu_queue.append(tabu_key)
+            if len(tabu_queue) > tabu_tenure:
+                tabu_set.discard(tabu_queue.popleft())
+
+        if current_delta_total < best_delta_total:
+            best_delta_total = current_delta_total
+            best_stops = dict(current_stops)
+            non_improving = 0
+        else:
+            non_improving += 1
+            if max_non_improving is not None and non_improving >= max_non_improving:
+                break
+
+    # Expand the best stop sequences back to order lists (touched routes only)
+    best_solution = _clone_routes(initial_solution)
+    for vehicle_id, stops in best_stops.items():
+        best_solution[vehicle_id] = _stop_groups_to_route(stops, route_groups[vehicle_id])
     return best_solution
 
+# --- Granular Inter-Route Neighbourhoods (L1) ---
+# Relocate, exchange and 2-opt* moves between two routes, restricted to each
+# stop's nearest neighbours from a precomputed candidate list. Every move is
+# costed in O(1) from the route prefix sums.
+
+_candidate_list_cache = {'version': None, 'k': None, 'lists': None}
+
+def build_candidate_lists(time_matrix, k):
+    """
+    For every location, the k nearest other locations by round-trip time
+    (time(i,j) + time(j,i)). The lists for the last matrix version/k are cached.
+    """
+    cache = _candidate_list_cache
+    version = _matrix_version(time_matrix)
+    if cache['version'] == version and cache['k'] == k:
+        return cache['lists']
+
+    num_locations = len(time_matrix)
+    candidate_lists = []
+    for i in range(num_locations):
+        row = time_matrix[i]
+        neighbours = sorted((j for j in range(num_locations) if j != i),
+                            key=lambda j: row[j] + time_matrix[j][i])
+        candidate_lists.append(neighbours[:k])
+
+    cache['version'], cache['k'], cache['lists'] = version, k, candidate_lists
+    return candidate_lists
+
+def _inter_route_state(stops, groups, time_matrix):
+    """
+    Search state of one route: closed path, cost prefix sums, load prefix
+    sums and the path position of each stop.
+    """
+    path = [0] + stops + [0]
+    fwd, _ = _path_prefix_sums(path, time_matrix)
+    load_prefix = [0] * len(path)
+    for k in range(1, len(path) - 1):
+        load_prefix[k] = load_prefix[k - 1] + sum(o['demand'] for o in groups[path[k]])
+    load_prefix[-1] = load_prefix[-2]
+    return {
+        'stops': stops,
+        'groups': groups,
+        'path': path,
+        'fwd': fwd,
+        'load_prefix': load_prefix,
+        'position': {loc_idx: k for k, loc_idx in enumerate(path) if k and k < len(path) - 1}
+    }
+
+def _evaluate_inter_route_moves(state_a, i, state_b, q, time_matrix,
+                                vehicle_capacity, max_route_raw):
+    """
+    Evaluates the moves defined by stop i of route A and its candidate
+    neighbour at stop q of route B.
+    Returns: (delta, move) for the best feasible move, or None.
+    """
+    m = time_matrix
+    path_a, path_b = state_a['path'], state_b['path']
+    raw_a, raw_b = state_a['fwd'][-1], state_b['fwd'][-1]
+    load_a, load_b = state_a['load_prefix'][-1], state_b['load_prefix'][-1]
+    u, w = path_a[i], path_b[q]
+    dem_u = state_a['load_prefix'][i] - state_a['load_prefix'][i - 1]
+    dem_w = state_b['load_prefix'][q] - state_b['load_prefix'][q - 1]
+    u_in_b = u in state_b['position']
+    w_in_a = w in state_a['position']
+
+    best = None
+    best_delta = 0 # Only improving moves are returned
+
+    def removal_delta(path, k):
+        return m[path[k - 1]][path[k + 1]] - m[path[k - 1]][path[k]] - m[path[k]][path[k + 1]]
+
+    def fits(raw, route_delta):
+        # A changed route must respect the duration limit, or at least not get longer
+        return route_delta <= 0 or raw + route_delta <= max_route_raw
+
+    # a) Relocate u into B (next to w, or merged if B already serves u)
+    if load_b + dem_u <= vehicle_capacity:
+        delta_a = removal_delta(path_a, i)
+        if u_in_b:
+            options = [(0, None)]
+        else:
+            options = [(m[x][u] + m[u][y] - m[x][y], pos)
+                       for pos, x, y in ((q, w, path_b[q + 1]), (q - 1, path_b[q - 1], w))]
+        for delta_b, pos in options:
+            delta = delta_a + delta_b
+            if delta < best_delta and fits(raw_a, delta_a) and fits(raw_b, delta_b):
+                best_delta, best = delta, ('relocate', 'a', i, pos)
+
+    # b) Relocate w into A (next to u, or merged if A already serves w)
+    if load_a + dem_w <= vehicle_capacity:
+        delta_b = removal_delta(path_b, q)
+        if w_in_a:
+            options = [(0, None)]
+        else:
+            options = [(m[x][w] + m[w][y] - m[x][y], pos)
+                       for pos, x, y in ((i, u, path_a[i + 1]), (i - 1, path_a[i - 1], u))]
+        for delta_a, pos in options:
+            delta = delta_a + delta_b
+            if delta < best_delta and fits(raw_a, delta_a) and fits(raw_b, delta_b):
+                best_delta, best = delta, ('relocate', 'b', q, pos)
+
+    # c) Exchange u and w (only if neither route already serves the other stop)
+    if not u_in_b and not w_in_a and \
+       load_a - dem_u + dem_w <= vehicle_capacity and load_b - dem_w + dem_u <= vehicle_capacity:
+        a_prev, a_next = path_a[i - 1], path_a[i + 1]
+        b_prev, b_next = path_b[q - 1], path_b[q + 1]
+        delta_a = m[a_prev][w] + m[w][a_next] - m[a_prev][u] - m[u][a_next]
+        delta_b = m[b_prev][u] + m[u][b_next] - m[b_prev][w] - m[w][b_next]
+        delta = delta_a + delta_b
+        if delta < best_delta and fits(raw_a, delta_a) and fits(raw_b, delta_b):
+            best_delta, best = delta, ('exchange', i, q)
+
+    # d) 2-opt*: A keeps its head up to u and takes B's tail from w (arc u->w),
+    #    B keeps its head up to w's predecessor and takes A's tail after u
+    fwd_a, fwd_b = state_a['fwd'], state_b['fwd']
+    lp_a, lp_b = state_a['load_prefix'], state_b['load_prefix']
+    new_raw_a = fwd_a[i] + m[u][w] + (raw_b - fwd_b[q])
+    new_raw_b = fwd_b[q - 1] + m[path_b[q - 1]][path_a[i + 1]] + (raw_a - fwd_a[i + 1])
+    delta = new_raw_a + new_raw_b - raw_a - raw_b
+    if delta < best_delta and fits(raw_a, new_raw_a - raw_a) and fits(raw_b, new_raw_b - raw_b) and \
+       lp_a[i] + (load_b - lp_b[q - 1]) <= vehicle_capacity and \
+       lp_b[q - 1] + (load_a - lp_a[i]) <= vehicle_capacity:
+        # Stitching must not visit a location twice in one route
+        head_a, tail_b = path_a[1:i + 1], path_b[q:-1]
+        head_b, tail_a = path_b[1:q], path_a[i + 1:-1]
+        if not (set(head_a) & set(tail_b)) and not (set(head_b) & set(tail_a)):
+            best_delta, best = delta, ('2opt*', i, q)
+
+    if best is None:
+        return None
+    return best_delta, best
+
+def _apply_inter_route_move(state_a, state_b, move):
+    """
+    Applies an inter-route move.
+    Returns: (new_stops_a, new_groups_a, new_stops_b, new_groups_b)
+    The input states are not mutated.
+    """
+    stops_a, groups_a = state_a['stops'], state_a['groups']
+    stops_b, groups_b = state_b['stops'], state_b['groups']
+    kind = move[0]
+
+    if kind == 'relocate':
+        # Normalise to "move stop k of route src into route dst after path position pos"
+        if move[1] == 'a':
+            src_stops, src_groups, dst_stops, dst_groups = stops_a, groups_a, stops_b, groups_b
+        else:
+            src_stops, src_groups, dst_stops, dst_groups = stops_b, groups_b, stops_a, groups_a
+        k, pos = move[2], move[3]
+        loc_idx = src_stops[k - 1]
+        new_src_stops = src_stops[:k - 1] + src_stops[k:]
+        new_src_groups = {loc: g for loc, g in src_groups.items() if loc != loc_idx}
+        new_dst_groups = dict(dst_groups)
+        if loc_idx in dst_groups:
+            new_dst_stops = dst_stops
+            new_dst_groups[loc_idx] = dst_groups[loc_idx] + src_groups[loc_idx]
+        else:
+            new_dst_stops = dst_stops[:pos] + [loc_idx] + dst_stops[pos:]
+            new_dst_groups[loc_idx] = src_groups[loc_idx]
+        if move[1] == 'a':
+            return new_src_stops, new_src_groups, new_dst_stops, new_dst_groups
+        return new_dst_stops, new_dst_groups, new_src_stops, new_src_groups
+
+    # A location may be served by both routes, so every stop keeps the
+    # order group of the route it came from
+    i, q = move[1], move[2]
+    if kind == 'exchange':
+        u, w = stops_a[i - 1], stops_b[q - 1]
+        new_stops_a = stops_a[:i - 1] + [w] + stops_a[i:]
+        new_stops_b = stops_b[:q - 1] + [u] + stops_b[q:]
+        new_groups_a = {loc: (groups_b[w] if loc == w else groups_a[loc]) for loc in new_stops_a}
+        new_groups_b = {loc: (groups_a[u] if loc == u else groups_b[loc]) for loc in new_stops_b}
+    else: # '2opt*'
+        new_stops_a = stops_a[:i] + stops_b[q - 1:]
+        new_stops_b = stops_b[:q - 1] + stops_a[i:]
+        new_groups_a = {loc: groups_a[loc] for loc in stops_a[:i]}
+        new_groups_a.update((loc, groups_b[loc]) for loc in stops_b[q - 1:])
+        new_groups_b = {loc: groups_b[loc] for loc in stops_b[:q - 1]}
+        new_groups_b.update((loc, groups_a[loc]) for loc in stops_a[i:])
+    return new_stops_a, new_groups_a, new_stops_b, new_groups_b
+
+def _inter_route_search(solution, time_matrix, vehicle_capacity, max_route_duration_mins,
+                        focus_vehicles, candidate_list_size=5, max_moves=10):
+    """
+    Best-improvement local search over relocate, exchange and 2-opt* moves
+    between routes. Only pairs (stop, candidate neighbour) with at least one
+    stop on a focus route are scanned; routes changed by a move join the focus.
+    Returns: (new_solution, total_delta) where total_delta is the change in
+    raw route cost (<= 0). Untouched routes are shared with solution.
+    """
+    candidate_lists = build_candidate_lists(time_matrix, candidate_list_size)
+    max_route_raw = max_route_duration_mins * 60.0
+
+    states = {}
+    loc_vehicles = {} # location -> set of vehicles serving it
+    for v_id, route_orders in solution.items():
+        if not route_orders:
+            continue
+        stops, groups = _route_to_stop_groups(route_orders)
+        states[v_id] = _inter_route_state(stops, groups, time_matrix)
+        for loc_idx in stops:
+            loc_vehicles.setdefault(loc_idx, set()).add(v_id)
+
+    focus = set(v_id for v_id in focus_vehicles if v_id in states)
+    changed = set()
+    total_delta = 0
+
+    for _ in range(max_moves):
+        best = None
+        for v_a in focus:
+            state_a = states[v_a]
+            path_a = state_a['path']
+            for i in range(1, len(path_a) - 1):
+                for neighbour in candidate_lists[path_a[i]]:
+                    for v_b in loc_vehicles.get(neighbour, ()):
+                        if v_b == v_a:
+                            continue
+                        state_b = states[v_b]
+                        result = _evaluate_inter_route_moves(
+                            state_a, i, state_b, state_b['position'][neighbour],
+                            time_matrix, vehicle_capacity, max_route_raw
+                        )
+                        if result and (best is None or result[0] < best[0]):
+                            best = (result[0], result[1], v_a, v_b)
+
+        if best is None:
+            break # Local optimum for the focus routes
+
+        delta, move, v_a, v_b = best
+        new_stops_a, new_groups_a, new_stops_b, new_groups_b = _apply_inter_route_move(
+            states[v_a], states[v_b], move
+        )
+        for v_id, stops, groups in ((v_a, new_stops_a, new_groups_a), (v_b, new_stops_b, new_groups_b)):
+            for loc_idx in states[v_id]['stops']:
+                loc_vehicles[loc_idx].discard(v_id)
+            if stops:
+                states[v_id] = _inter_route_state(stops, groups, time_matrix)
+                for loc_idx in stops:
+                    loc_vehicles.setdefault(loc_idx, set()).add(v_id)
+                focus.add(v_id)
+            else:
+                del states[v_id]
+                focus.discard(v_id)
+            changed.add(v_id)
+        total_delta += delta
+
+    new_solution = _clone_routes(solution)
+    for v_id in changed:
+        if v_id in states:
+            new_solution[v_id] = _stop_groups_to_route(states[v_id]['stops'], states[v_id]['groups'])
+        else:
+            new_solution[v_id] = []
+    return new_solution, total_delta
+
 # --- ALNS Helper: Roulette Wheel Selection ---
 def _roulette_wheel_selection(weights):
     total_weight = sum(weights)
@@ -350,10 +917,14 @@ def assign_new_order_realtime(new_order, current_routes, time_matrix,
     (Adapted from your v1)
     Orchestrator for Layer 1 assignment.
     1. Runs a greedy insertion.
-    2. Runs a Tabu Search refinement.
-    3. Returns the best solution found.
+    2. Runs a Tabu Search refinement over all routes.
+    3. Runs a granular inter-route search (relocate/exchange/2-opt*)
+       around the routes changed by 1-2.
+    4. Returns the best solution found.
     """
-    
+    refresh_matrix_versions(time_matrix)
+    time_matrix = with_service_time(time_matrix)
+
     # 1. Find initial solution with Greedy Insertion
     greedy_solution, method = _greedy_insert_capacity(
         new_order, current_routes, time_matrix, 
@@ -362,25 +933,40 @@ def assign_new_order_realtime(new_order, current_routes, time_matrix,
     
     if greedy_solution is None:
         return None, "Failed"
-        
-    greedy_total_cost = calculate_total_cost(greedy_solution, time_matrix)
+
+    greedy_cost = calculate_total_cost(greedy_solution, time_matrix)
     
     # 2. Refine the greedy solution with Tabu Search
     tabu_solution = _tabu_search_capacity(
         greedy_solution, time_matrix, 
         vehicle_capacity, max_route_duration_mins,
-        iterations=50, tabu_tenure=7 # L1 should be fast
+        iterations=50, tabu_tenure=7, # L1 should be fast
+        max_non_improving=L1_TABU_MAX_NON_IMPROVING
     )
     
+    best_solution = greedy_solution
     if tabu_solution:
-        tabu_total_cost = calculate_total_cost(tabu_solution, time_matrix)
+        tabu_cost = calculate_total_cost(tabu_solution, time_matrix)
         
-        # Compare costs and return the best
-        if tabu_total_cost < greedy_total_cost - 0.1: # Use 0.1 min threshold
-            return tabu_solution, "Tabu Search"
+        # Compare costs and keep the best
+        if tabu_cost < greedy_cost - 0.1: # Use 0.1 min threshold
+            best_solution, method = tabu_solution, "Tabu Search"
+
+    # Copy-on-write states share every unchanged route list with the input
+    touched_vehicles = [v_id for v_id, route in best_solution.items()
+                        if route is not current_routes.get(v_id)]
+
+    # 3. Cheap cross-vehicle improvements around the changed routes
+    inter_solution, inter_delta = _inter_route_search(
+        best_solution, time_matrix, vehicle_capacity, max_route_duration_mins,
+        focus_vehicles=touched_vehicles,
+        candidate_list_size=L1_CANDIDATE_LIST_SIZE, max_moves=L1_INTER_ROUTE_MAX_MOVES
+    )
+    if -inter_delta / 60.0 > 0.1: # Same 0.1 min threshold
+        return inter_solution, "Inter-Route Search"
     
-    # If tabu failed or wasn't better, return the greedy one
-    return greedy_solution, method # "Best Insertion" or "New Vehicle"
+    # Otherwise return the greedy or tabu solution
+    return best_solution, method # "Best Insertion", "New Vehicle" or "Tabu Search"
 
 # --- ALNS Repair Operators ---
 def _repair_greedy(partial_solution_routes, request_bank, time_matrix, distance_matrix,
@@ -389,7 +975,7 @@ def _repair_greedy(partial_solution_routes, request_bank, time_matrix, distance_
     Reinserts orders from request_bank into partial_solution using best insertion heuristic.
     Returns: repaired_solution_routes, uninserted_orders
     """
-    repaired_solution = copy.deepcopy(partial_solution_routes)
+    repaired_solution = _clone_routes(partial_solution_routes)
     uninserted_orders = []
     
     # Optional: Shuffle request bank to avoid bias
@@ -438,7 +1024,10 @@ def _repair_greedy(partial_solution_routes, request_bank, time_matrix, distance_
 
         # If insertion found, apply it
         if insertion_found:
-            repaired_solution[best_insertion_vehicle].insert(best_insertion_index, order)
+            route_orders = repaired_solution[best_insertion_vehicle]
+            repaired_solution[best_insertion_vehicle] = (
+                route_orders[:best_insertion_index] + [order] + route_orders[best_insertion_index:]
+            )
         else:
             # Try starting a new route on an empty vehicle
             cost_of_new_route_sec = calculate_raw_route_time([order['index']], time_matrix)
@@ -449,9 +1038,7 @@ def _repair_greedy(partial_solution_routes, request_bank, time_matrix, distance_
                 # Find the first empty vehicle
                 for v_id in range(num_vehicles):
                     if v_id not in repaired_solution or not repaired_solution[v_id]:
-                        if v_id not in repaired_solution: # Ensure key exists
-                             repaired_solution[v_id] = []
-                        repaired_solution[v_id].append(order)
+                        repaired_solution[v_id] = [order]
                         can_start_new_route = True
                         break # Stop after finding one empty vehicle
             
@@ -460,54 +1047,362 @@ def _repair_greedy(partial_solution_routes, request_bank, time_matrix, distance_
 
     return repaired_solution, uninserted_orders
 
+def _insertion_route_state(route_orders, time_matrix):
+    """Compact per-route state used by the regret repair: stops, groups, load, raw time."""
+    stops, groups = _route_to_stop_groups(route_orders)
+    return {
+        'stops': stops,
+        'groups': groups,
+        'load': sum(o['demand'] for o in route_orders),
+        'raw': calculate_raw_route_time(stops, time_matrix)
+    }
+
+def _best_stop_insertion(route_state, order, time_matrix, vehicle_capacity, max_route_raw):
+    """
+    Cheapest feasible insertion of one order into a route, at stop level:
+    joining an existing stop for the same location costs nothing, otherwise
+    the order's location is inserted as a new stop between two neighbours.
+    Returns: (cost_increase, stop_position) or None if infeasible.
+    (stop_position is None when joining an existing stop.)
+    """
+    if route_state['load'] + order['demand'] > vehicle_capacity:
+        return None
+    loc_idx = order['index']
+    if loc_idx in route_state['groups']:
+        return (0, None)
+
+    stops = route_state['stops']
+    m = time_matrix
+    best_delta, best_pos = float('inf'), -1
+    prev = 0
+    for pos in range(len(stops) + 1):
+        nxt = stops[pos] if pos < len(stops) else 0
+        delta = m[prev][loc_idx] + m[loc_idx][nxt] - m[prev][nxt]
+        if delta < best_delta:
+            best_delta, best_pos = delta, pos
+        prev = nxt
+
+    if route_state['raw'] + best_delta > max_route_raw:
+        return None
+    return (best_delta, best_pos)
+
+def _repair_regret_k(partial_solution_routes, request_bank, time_matrix, distance_matrix,
+                     vehicle_capacity, max_route_duration_mins, num_vehicles, k):
+    """
+    Regret-k insertion: repeatedly inserts the order whose best insertion
+    would become most expensive if postponed (sum of the gaps between its
+    best and its 2nd..k-th best route). Orders with fewer than k feasible
+    routes come first. Insertion costs are cached per (order, route) and
+    only the route that changed is re-evaluated after each insertion.
+    Returns: repaired_solution_routes, uninserted_orders
+    """
+    repaired_solution = _clone_routes(partial_solution_routes)
+    uninserted_orders = []
+    max_route_raw = max_route_duration_mins * 60.0
+    missing_option_regret = float('inf')
+
+    route_states = {v_id: _insertion_route_state(route, time_matrix)
+                    for v_id, route in repaired_solution.items() if route}
+    touched = set()
+
+    bank = request_bank[:]
+    options = [{} for _ in bank] # bank position -> {v_id: (cost, pos)}
+    for b_idx, order in enumerate(bank):
+        for v_id, state in route_states.items():
+            option = _best_stop_insertion(state, order, time_matrix, vehicle_capacity, max_route_raw)
+            if option:
+                options[b_idx][v_id] = option
+
+    remaining = list(range(len(bank)))
+    while remaining:
+        # --- 1. Pick the order with the largest regret ---
+        best_pick, best_key = None, None
+        for b_idx in remaining:
+            costs = sorted(cost for cost, _ in options[b_idx].values())
+            if not costs:
+                key = (missing_option_regret, 0) # Needs a new vehicle: handle first
+            else:
+                regret = 0
+                for h in range(1, k):
+                    if h < len(costs):
+                        regret += costs[h] - costs[0]
+                    else:
+                        regret = missing_option_regret
+                        break
+                key = (regret, -costs[0])
+            if best_key is None or key > best_key:
+                best_pick, best_key = b_idx, key
+        remaining.remove(best_pick)
+        order = bank[best_pick]
+
+        # --- 2. Insert it (or open a new vehicle) ---
+        if options[best_pick]:
+            v_id = min(options[best_pick], key=lambda v: options[best_pick][v][0])
+            cost, pos = options[best_pick][v_id]
+            state = route_states[v_id]
+            groups = dict(state['groups'])
+            if pos is None:
+                groups[order['index']] = groups[order['index']] + [order]
+                stops = state['stops']
+            else:
+                groups[order['index']] = [order]
+                stops = state['stops'][:pos] + [order['index']] + state['stops'][pos:]
+            route_states[v_id] = {
+                'stops': stops, 'groups': groups,
+                'load': state['load'] + order['demand'], 'raw': state['raw'] + cost
+            }
+        else:
+            v_id = None
+            cost_of_new_route = calculate_raw_route_time([order['index']], time_matrix)
+            if order['demand'] <= vehicle_capacity and cost_of_new_route <= max_route_raw:
+                for candidate_v in range(num_vehicles):
+                    if candidate_v not in route_states:
+                        v_id = candidate_v
+                        break
+            if v_id is None:
+                uninserted_orders.append(order) # Could not insert this order
+                continue
+            route_states[v_id] = {
+                'stops': [order['index']], 'groups': {order['index']: [order]},
+                'load': order['demand'], 'raw': cost_of_new_route
+            }
+        touched.add(v_id)
+
+        # --- 3. Re-evaluate only the changed route for the remaining orders ---
+        state = route_states[v_id]
+        for b_idx in remaining:
+            option = _best_stop_insertion(state, bank[b_idx], time_matrix, vehicle_capacity, max_route_raw)
+            if option:
+                options[b_idx][v_id] = option
+            else:
+                options[b_idx].pop(v_id, None)
+
+    for v_id in touched:
+        state = route_states[v_id]
+        repaired_solution[v_id] = _stop_groups_to_route(state['stops'], state['groups'])
+    return repaired_solution, uninserted_orders
+
+def _repair_regret_2(partial_solution_routes, request_bank, time_matrix, distance_matrix,
+                     vehicle_capacity, max_route_duration_mins, num_vehicles):
+    """Regret-2 insertion (see _repair_regret_k)."""
+    return _repair_regret_k(partial_solution_routes, request_bank, time_matrix, distance_matrix,
+                            vehicle_capacity, max_route_duration_mins, num_vehicles, k=2)
+
+def _repair_regret_3(partial_solution_routes, request_bank, time_matrix, distance_matrix,
+                     vehicle_capacity, max_route_duration_mins, num_vehicles):
+    """Regret-3 insertion (see _repair_regret_k)."""
+    return _repair_regret_k(partial_solution_routes, request_bank, time_matrix, distance_matrix,
+                            vehicle_capacity, max_route_duration_mins, num_vehicles, k=3)
+
 # --- ALNS Destroy Operators ---
-def _destroy_random(solution_routes, num_to_remove):
+def _remove_positions(solution_routes, positions_by_vehicle):
+    """
+    Removes orders by (vehicle, position) from a routes dict.
+    Only the touched routes are rebuilt; the input is not mutated.
+    Returns: partial_solution_routes, removed orders (in removal order)
+    """
+    partial_solution = _clone_routes(solution_routes)
+    removed_orders = []
+    for v_id, positions in positions_by_vehicle.items():
+        route = solution_routes[v_id]
+        removed_orders.extend(route[idx] for idx in positions)
+        partial_solution[v_id] = [order for idx, order in enumerate(route) if idx not in positions]
+    return partial_solution, removed_orders
+
+def _randomised_pick(num_candidates):
+    """
+    Index into a list sorted best-first, biased towards the front
+    (y^p selection, p = ALNS_REMOVAL_RANDOMNESS).
+    """
+    return int(num_candidates * random.random() ** ALNS_REMOVAL_RANDOMNESS)
+
+def _destroy_random(solution_routes, num_to_remove, time_matrix, distance_matrix):
     """
     Removes num_to_remove randomly selected orders from the solution.
     Returns: partial_solution_routes, request_bank (list of removed order objects)
     """
-    partial_solution = copy.deepcopy(solution_routes)
-    request_bank = []
-    
-    # Create a flat list of all assigned (vehicle_id, order_index_in_route, order_object)
-    assigned_orders_info = []
-    for v_id, route in partial_solution.items():
-        for idx, order in enumerate(route):
-            assigned_orders_info.append({'v_id': v_id, 'idx': idx, 'order': order})
-
-    if not assigned_orders_info:
-        return partial_solution, [] # Nothing to remove
+    # Create a flat list of all assigned (vehicle_id, order_index_in_route)
+    assigned_positions = [(v_id, idx) for v_id, route in solution_routes.items()
+                          for idx in range(len(route))]
 
     # Determine actual number to remove (don't exceed available orders)
-    actual_num_to_remove = min(num_to_remove, len(assigned_orders_info))
+    actual_num_to_remove = min(num_to_remove, len(assigned_positions))
     if actual_num_to_remove <= 0:
-         return partial_solution, []
+        return _clone_routes(solution_routes), [] # Nothing to remove
 
-    # Shuffle and select orders to remove
-    random.shuffle(assigned_orders_info)
-    orders_to_remove_info = assigned_orders_info[:actual_num_to_remove]
-    
-    # Store removed orders and create a quick lookup for removal
-    removed_lookup = {} # Key: v_id, Value: list of indices to remove (sorted desc)
-    for info in orders_to_remove_info:
-        request_bank.append(info['order'])
-        v_id = info['v_id']
-        if v_id not in removed_lookup:
-            removed_lookup[v_id] = []
-        removed_lookup[v_id].append(info['idx'])
-
-    # Remove orders efficiently (by index, descending to avoid shifting issues)
-    for v_id, indices in removed_lookup.items():
-        indices.sort(reverse=True) # Sort descending
-        route = partial_solution[v_id]
-        for idx in indices:
-            del route[idx] # Remove by index
-
-    return partial_solution, request_bank
+    positions_by_vehicle = {}
+    for v_id, idx in random.sample(assigned_positions, actual_num_to_remove):
+        positions_by_vehicle.setdefault(v_id, set()).add(idx)
+
+    return _remove_positions(solution_routes, positions_by_vehicle)
+
+def _destroy_worst(solution_routes, num_to_remove, time_matrix, distance_matrix):
+    """
+    Worst-cost removal: removes the stops whose detour costs the most
+    distance (randomised), with all their orders, until at least
+    num_to_remove orders are removed.
+    Returns: partial_solution_routes, request_bank
+    """
+    dm = distance_matrix
+    candidates = [] # (distance saved, v_id, location index)
+    for v_id, route in solution_routes.items():
+        if not route:
+            continue
+        path = [0] + list(dict.fromkeys(o['index'] for o in route)) + [0]
+        for k in range(1, len(path) - 1):
+            saving = dm[path[k - 1]][path[k]] + dm[path[k]][path[k + 1]] - dm[path[k - 1]][path[k + 1]]
+            candidates.append((saving, v_id, path[k]))
+    candidates.sort(key=lambda c: c[0], reverse=True)
+
+    positions_by_vehicle = {}
+    num_removed = 0
+    while candidates and num_removed < num_to_remove:
+        _, v_id, loc_idx = candidates.pop(_randomised_pick(len(candidates)))
+        positions = [idx for idx, o in enumerate(solution_routes[v_id]) if o['index'] == loc_idx]
+        positions_by_vehicle.setdefault(v_id, set()).update(positions)
+        num_removed += len(positions)
+
+    return _remove_positions(solution_routes, positions_by_vehicle)
+
+def _destroy_shaw(solution_routes, num_to_remove, time_matrix, distance_matrix):
+    """
+    Shaw (relatedness) removal: starts from a random seed order and removes
+    the orders most related to it (randomised pick from the ranking), where
+    relatedness combines travel distance, travel time and demand similarity.
+    The ranking is computed once per call.
+    Returns: partial_solution_routes, request_bank
+    """
+    assigned = [(v_id, idx, order) for v_id, route in solution_routes.items()
+                for idx, order in enumerate(route)]
+    if not assigned or num_to_remove <= 0:
+        return _clone_routes(solution_routes), []
+
+    # Normalise each term over the locations involved
+    locations = list(set(order['index'] for _, _, order in assigned))
+    max_dist = max([distance_matrix[a][b] for a in locations for b in locations] + [1e-9])
+    max_time = max([time_matrix[a][b] for a in locations for b in locations] + [1e-9])
+    max_demand = max(order['demand'] for _, _, order in assigned) or 1
+
+    def relatedness(order_a, order_b):
+        a, b = order_a['index'], order_b['index']
+        return (ALNS_SHAW_DISTANCE_WEIGHT * (distance_matrix[a][b] + distance_matrix[b][a]) / (2 * max_dist) +
+                ALNS_SHAW_TIME_WEIGHT * (time_matrix[a][b] + time_matrix[b][a]) / (2 * max_time) +
+                ALNS_SHAW_DEMAND_WEIGHT * abs(order_a['demand'] - order_b['demand']) / max_demand)
+
+    remaining = assigned[:]
+    removed = [remaining.pop(random.randrange(len(remaining)))]
+    seed = removed[0][2]
+    remaining.sort(key=lambda entry: relatedness(seed, entry[2]))
+    while remaining and len(removed) < num_to_remove:
+        removed.append(remaining.pop(_randomised_pick(len(remaining))))
+
+    positions_by_vehicle = {}
+    for v_id, idx, _ in removed:
+        positions_by_vehicle.setdefault(v_id, set()).add(idx)
+    return _remove_positions(solution_routes, positions_by_vehicle)
+
+def _destroy_route(solution_routes, num_to_remove, time_matrix, distance_matrix):
+    """
+    Route removal: empties whole routes, lightest load first (randomised),
+    until at least num_to_remove orders are removed. This is the operator
+    that lets the repair step close trucks.
+    Returns: partial_solution_routes, request_bank
+    """
+    used_routes = sorted(
+        ((sum(o['demand'] for o in route), v_id) for v_id, route in solution_routes.items() if route)
+    )
+
+    positions_by_vehicle = {}
+    num_removed = 0
+    while used_routes and num_removed < num_to_remove:
+        _, v_id = used_routes.pop(_randomised_pick(len(used_routes)))
+        positions_by_vehicle[v_id] = set(range(len(solution_routes[v_id])))
+        num_removed += len(solution_routes[v_id])
+
+    return _remove_positions(solution_routes, positions_by_vehicle)
 # --- Main Function 3: Layer 2 (Batch VRP Optimization) ---
 
+_int_matrix_cache = {'version': None, 'array': None}
+_float_matrix_cache = {'version': None, 'array': None}
+
+def _as_int_array(matrix):
+    """Contiguous int64 NumPy copy of a list-of-lists matrix (cached for the last matrix version)."""
+    cache = _int_matrix_cache
+    version = _matrix_version(matrix)
+    if cache['version'] != version:
+        cache['array'] = np.ascontiguousarray(np.asarray(matrix).astype(np.int64))
+        cache['version'] = version
+    return cache['array']
+
+def _as_float_array(matrix):
+    """Contiguous float64 NumPy copy of a list-of-lists matrix (cached for the last matrix version)."""
+    cache = _float_matrix_cache
+    version = _matrix_version(matrix)
+    if cache['version'] != version:
+        cache['array'] = np.ascontiguousarray(np.asarray(matrix, dtype=float))
+        cache['version'] = version
+    return cache['array']
+
+def build_solver_time_matrix(time_matrix, orders):
+    """
+    Expands the location matrix to the per-order solver matrix used by L2:
+    solver node 0 is the depot, node k is orders[k - 1], and entry (i, j) is
+    the travel time between their locations (0 on the diagonal).
+    Returns: an (N+1) x (N+1) contiguous int64 NumPy array.
+    """
+    node_locations = np.fromiter((o['index'] for o in orders), dtype=np.intp, count=len(orders))
+    node_locations = np.concatenate(([0], node_locations))
+    solver_time_matrix = _as_int_array(time_matrix)[np.ix_(node_locations, node_locations)]
+    np.fill_diagonal(solver_time_matrix, 0)
+    return solver_time_matrix
+
+def build_solver_cost_matrix(distance_matrix, orders, variable_cost_per_km, max_arc_cost):
+    """
+    Arc costs for the fleet-cost objective of L2, on the same nodes as
+    build_solver_time_matrix: variable_cost_per_km * distance, in
+    1/L2_COST_SCALE units. A leg with no known distance (inf) costs
+    max_arc_cost (e.g. the drop penalty: never worth driving).
+    Returns: an (N+1) x (N+1) int64 NumPy array.
+    """
+    node_locations = np.concatenate(([0], [o['index'] for o in orders])).astype(np.intp)
+    distances = _as_float_array(distance_matrix)[np.ix_(node_locations, node_locations)]
+    np.fill_diagonal(distances, 0)
+    costs = np.rint(distances * variable_cost_per_km * L2_COST_SCALE)
+    return np.where(np.isfinite(costs), np.minimum(costs, max_arc_cost), max_arc_cost).astype(np.int64)
+
+def bundle_colocated_orders(orders, max_bundle_demand):
+    """
+    Packs orders that share a location into bundles of at most
+    max_bundle_demand units (first-fit decreasing per location), so that L2
+    sees one node per bundle instead of one per order. An order larger than
+    max_bundle_demand gets a bundle of its own.
+    Returns: list of bundles, each a list of orders at one location.
+    """
+    orders_by_location = {}
+    for order in orders:
+        orders_by_location.setdefault(order['index'], []).append(order)
+
+    bundles = []
+    for location_orders in orders_by_location.values():
+        open_bundles = [] # [load, [orders]]
+        for order in sorted(location_orders, key=lambda o: -o['demand']):
+            for bundle in open_bundles:
+                if bundle[0] + order['demand'] <= max_bundle_demand:
+                    bundle[0] += order['demand']
+                    bundle[1].append(order)
+                    break
+            else:
+                open_bundles.append([order['demand'], [order]])
+        bundles.extend(orders_in_bundle for _, orders_in_bundle in open_bundles)
+    return bundles
+
 def batch_optimization_vrp(current_routes, pending_orders, time_matrix, 
-                         num_vehicles, vehicle_capacity, max_route_duration_mins):
+                         num_vehicles, vehicle_capacity, max_route_duration_mins,
+                         bundle_orders=L2_BUNDLE_COLOCATED_ORDERS, warm_start=L2_WARM_START,
+                         deadline=None, solver_stats=None, lower_bound=None,
+                         distance_matrix=None, fixed_cost_per_truck=None, variable_cost_per_km=None,
+                         gap_tolerance=L2_GAP_TOLERANCE, cancel_token=None, deterministic=False,
+                         clock=None, on_new_best=None):
     """
     Re-optimizes all current routes AND tries to include pending orders.
     
@@ -516,8 +1411,43 @@ def batch_optimization_vrp(current_routes, pending_orders, time_matrix,
     This solves the "super-order" problem where demand for one location
     (e.g., 50 units for Aura Pizzas) exceeds a single vehicle's capacity (e.g., 20).
     The solver can now create multiple routes to the same location.
+
+    With bundle_orders, co-located orders are first merged into bundles of
+    at most L2_BUNDLE_CAPACITY_FRACTION * vehicle_capacity units (see
+    bundle_colocated_orders); each bundle is one solver node, is dropped with
+    the penalty of all its orders, and is expanded back to its orders afterwards.
+
+    With warm_start, the incumbent current_routes are handed to the solver as
+    its initial solution, so the search improves them instead of rebuilding a
+    first solution. Bundles then never mix orders of different routes (or of
+    a route and the pending list), so every route maps onto whole nodes.
+
+    deadline (time.time(), optional) bounds the solver's time budget, and
+    solver_stats (a dict, optional) receives the engine's search statistics
+    and anytime curve (see solve_vrp_with_capacity).
+
+    With distance_matrix and the truck costs, the solver minimises the
+    ALNS objective itself (fixed_cost_per_truck per vehicle used,
+    variable_cost_per_km per km, ALNS_UNASSIGNED_PENALTY_TRUCKS trucks per
+    unserved order; see build_solver_cost_matrix) instead of travel time,
+    so its result competes with L3 on the orchestrator's own cost.
+    lower_bound (see lower_bounds.objective_lower_bound) together with
+    distance_matrix and the truck costs lets the search stop as soon as the
+    ALNS objective of its best solution is within gap_tolerance of it.
+    cancel_token (see portfolio.CancellationToken) gets the ALNS objective of
+    every new best (needs distance_matrix and the truck costs), and the
+    search returns its best-so-far once the token is cancelled.
+    on_new_best(routes, unassigned, cost), like in run_alns_optimization,
+    is called with every new best (needs distance_matrix and the truck costs).
+    deterministic: end the search on its solution limits, not on time (see
+    set_search_limits), for reproducible runs.
+    clock (see portfolio.WorkClock): run on simulated time instead, one tick
+    per solution. deadline is then a simulated time, and cancel_token is
+    polled and reported to with clock.now().
     """
-    
+    refresh_matrix_versions(time_matrix, distance_matrix)
+    time_matrix = with_service_time(time_matrix)
+
     # 1. Combine all orders (from routes + pending) into one big list
     all_orders_to_assign = pending_orders[:]
     for route in current_routes.values():
@@ -529,96 +1459,149 @@ def batch_optimization_vrp(current_routes, pending_orders, time_matrix,
 
     # 2. Create the "Solver Data Model"
     
-    # The "solver locations" are now the DEPOT (index 0) + all individual orders.
-    # If we have 79 orders, we have 80 "solver locations".
-    num_orders = len(all_orders_to_assign)
-    num_solver_locs = num_orders + 1 # (Depot + all orders)
+    # The "solver locations" are the DEPOT (index 0) + one node per bundle of
+    # orders (a single order each when bundling is off).
+    if bundle_orders:
+        max_bundle_demand = max(1, int(vehicle_capacity * L2_BUNDLE_CAPACITY_FRACTION))
+        order_groups = [pending_orders] + list(current_routes.values()) if warm_start else [all_orders_to_assign]
+        solver_bundles = [
+            bundle for group in order_groups for bundle in bundle_colocated_orders(group, max_bundle_demand)
+        ]
+    else:
+        solver_bundles = [[order] for order in all_orders_to_assign]
+    num_solver_locs = len(solver_bundles) + 1 # (Depot + all bundles)
+    print(f"--- [LAYER 2] Model size: {len(all_orders_to_assign) + 1} order nodes -> {num_solver_locs} solver nodes ---")
     
     # Create mapping
-    # map_solver_to_order[1] -> all_orders_to_assign[0]
-    # map_solver_to_order[2] -> all_orders_to_assign[1]
+    # map_solver_to_bundle[1] -> solver_bundles[0]
+    # map_solver_to_bundle[2] -> solver_bundles[1]
     # ...
     # (index 0 is reserved for the depot)
-    map_solver_to_order = {i + 1: order for i, order in enumerate(all_orders_to_assign)}
+    map_solver_to_bundle = {i + 1: bundle for i, bundle in enumerate(solver_bundles)}
 
     # 3. Build the inputs for the solver engine
     
-    # a) Solver Time Matrix (an (N+1) x (N+1) matrix)
-    solver_time_matrix = [[0] * num_solver_locs for _ in range(num_solver_locs)]
-    
-    # This is now a big loop.
-    for i in range(num_solver_locs):
-        for j in range(num_solver_locs):
-            if i == j:
-                continue
-                
-            # Get the "original" location index (from all_locations)
-            if i == 0 and j > 0:
-                # Depot to Order
-                order_j_loc_idx = map_solver_to_order[j]['index']
-                solver_time_matrix[i][j] = time_matrix[0][order_j_loc_idx]
-            elif i > 0 and j == 0:
-                # Order to Depot
-                order_i_loc_idx = map_solver_to_order[i]['index']
-                solver_time_matrix[i][j] = time_matrix[order_i_loc_idx][0]
-            elif i > 0 and j > 0:
-                # Order to Order
-                order_i_loc_idx = map_solver_to_order[i]['index']
-                order_j_loc_idx = map_solver_to_order[j]['index']
-                solver_time_matrix[i][j] = time_matrix[order_i_loc_idx][order_j_loc_idx]
-            
+    # a) Solver Time Matrix (an (N+1) x (N+1) matrix), gathered in one NumPy fancy-indexing step
+    solver_time_matrix = build_solver_time_matrix(time_matrix, [bundle[0] for bundle in solver_bundles])
+
     # b) Solver Demands List (one entry for each solver location)
     # The demand for the depot (index 0) is 0.
-    # The demand for solver_loc 1 is the demand of order 1.
-    solver_demands = [0] + [order['demand'] for order in all_orders_to_assign]
+    # The demand for solver_loc k is the total demand of bundle k.
+    solver_demands = [0] + [sum(order['demand'] for order in bundle) for bundle in solver_bundles]
+
+    # c) Objective: the fleet cost when the costs are known, else travel time
+    fleet_cost_objective = distance_matrix is not None and fixed_cost_per_truck is not None \
+        and variable_cost_per_km is not None
+    arc_cost_matrix = None
+    vehicle_fixed_cost = 0
+    drop_penalty_per_order = L2_DROP_PENALTY_PER_ORDER
+    if fleet_cost_objective:
+        drop_penalty_per_order = int(round(fixed_cost_per_truck * ALNS_UNASSIGNED_PENALTY_TRUCKS * L2_COST_SCALE))
+        vehicle_fixed_cost = int(round(fixed_cost_per_truck * L2_COST_SCALE))
+        arc_cost_matrix = build_solver_cost_matrix(
+            distance_matrix, [bundle[0] for bundle in solver_bundles], variable_cost_per_km, drop_penalty_per_order
+        )
+    # Dropping a bundle drops all its orders, so it costs the per-order penalty that many times
+    solver_drop_penalties = [0] + [drop_penalty_per_order * len(bundle) for bundle in solver_bundles]
 
-    # c) Vehicle Capacities & Durations
+    # d) Vehicle Capacities & Durations
     vehicle_capacities = [vehicle_capacity] * num_vehicles
     # Solver needs duration in seconds
     vehicle_max_durations_sec = [int(max_route_duration_mins * 60)] * num_vehicles
 
+    # e) Initial Routes: each incumbent route as its sequence of solver nodes.
+    # Nodes at the same location are kept together, in the order the
+    # locations first appear in the route: the stop sequence L1 and ALNS
+    # time the route by, so a route they accept fits the L2 span bound too.
+    initial_routes = None
+    if warm_start:
+        solver_node_of = {
+            order['id']: solver_idx for solver_idx, bundle in map_solver_to_bundle.items() for order in bundle
+        }
+        initial_routes = []
+        for v_id in range(num_vehicles):
+            route_nodes = []
+            for order in current_routes.get(v_id, []):
+                solver_idx = solver_node_of[order['id']]
+                if solver_idx not in route_nodes:
+                    route_nodes.append(solver_idx)
+            stop_position = {}
+            for node in route_nodes:
+                stop_position.setdefault(map_solver_to_bundle[node][0]['index'], len(stop_position))
+            route_nodes.sort(key=lambda node: stop_position[map_solver_to_bundle[node][0]['index']])
+            initial_routes.append(route_nodes)
+
+    # f) Early stop on the optimality gap (checked at every new best) and on cancellation
+    clock_now = clock.now if clock is not None else lambda: None # Simulated time for the cancel token
+    stop_check = None
+    if distance_matrix is not None and (lower_bound is not None or cancel_token is not None or on_new_best):
+        def stop_check(solver_routes):
+            routes = {v_id: [order for node in route for order in map_solver_to_bundle[node]]
+                      for v_id, route in enumerate(solver_routes)}
+            cost, _, _ = calculate_total_fleet_cost(routes, distance_matrix, fixed_cost_per_truck, variable_cost_per_km)
+            assigned_nodes = {node for route in solver_routes for node in route}
+            unassigned = [order for node, bundle in map_solver_to_bundle.items() if node not in assigned_nodes
+                          for order in bundle]
+            objective = calculate_alns_objective(cost, unassigned, fixed_cost_per_truck)
+            if on_new_best:
+                on_new_best(routes, unassigned, cost)
+            if cancel_token is not None:
+                cancel_token.report(objective, at=clock_now())
+            return lower_bound is not None and objective - lower_bound <= gap_tolerance * objective
+
     # 4. Call the Solver Engine!
-    # The solver now sees 80 locations, each with its own small demand.
+    solve_start = time.perf_counter()
     solution_routes_solver, unassigned_solver_indices = solve_vrp_with_capacity(
         solver_time_matrix,
         solver_demands,
         vehicle_capacities,
         vehicle_max_durations_sec,
-        num_vehicles
+        num_vehicles,
+        drop_penalties=solver_drop_penalties,
+        initial_routes=initial_routes,
+        deadline=deadline,
+        solver_stats=solver_stats,
+        stop_check=stop_check,
+        should_stop=(lambda: cancel_token.cancelled(at=clock_now())) if cancel_token is not None else None,
+        arc_cost_matrix=arc_cost_matrix,
+        vehicle_fixed_cost=vehicle_fixed_cost,
+        deterministic=deterministic,
+        clock=clock
     )
+    print(f"--- [LAYER 2] Solve time: {time.perf_counter() - solve_start:.2f}s for {num_solver_locs} solver nodes ---")
     
     # 5. Parse the solution (convert solver indices back to order objects)
     
     new_optimized_routes = {i: [] for i in range(num_vehicles)}
     
-    # Keep track of which orders (by solver index) were assigned
+    # Keep track of which bundles (by solver index) were assigned
     assigned_solver_indices = set()
     
     for v_id, vehicle_route_solver in enumerate(solution_routes_solver):
         for solver_stop_idx in vehicle_route_solver:
             # solver_stop_idx is a solver index, e.g., 1, 2, ... 79
             
-            # Get the full order object from our map
-            order_obj = map_solver_to_order.get(solver_stop_idx)
+            # Expand the bundle back to its orders
+            bundle = map_solver_to_bundle.get(solver_stop_idx)
             
-            if order_obj:
-                new_optimized_routes[v_id].append(order_obj)
+            if bundle:
+                new_optimized_routes[v_id].extend(bundle)
                 assigned_solver_indices.add(solver_stop_idx)
 
     # 6. Find any orders that were *not* assigned
     final_unassigned_orders = []
     
-    # Check any orders returned by the solver
+    # Check any bundles returned by the solver
     for unassigned_idx in unassigned_solver_indices:
-        order_obj = map_solver_to_order.get(unassigned_idx)
-        if order_obj:
-            final_unassigned_orders.append(order_obj)
+        bundle = map_solver_to_bundle.get(unassigned_idx)
+        if bundle:
+            final_unassigned_orders.extend(bundle)
             
-    # Also check our *original* list for any orders not in the "assigned" set
-    for solver_idx, order_obj in map_solver_to_order.items():
+    # Also check our *original* list for any bundles not in the "assigned" set
+    for solver_idx, bundle in map_solver_to_bundle.items():
         if solver_idx not in assigned_solver_indices and solver_idx not in unassigned_solver_indices:
-            # This order was not in *any* solution route
-            final_unassigned_orders.append(order_obj)
+            # This bundle was not in *any* solution route
+            final_unassigned_orders.extend(bundle)
 
     # De-duplicate the unassigned list
     final_unassigned_orders_deduped = []
@@ -631,74 +1614,221 @@ def batch_optimization_vrp(current_routes, pending_orders, time_matrix,
     return new_optimized_routes, final_unassigned_orders_deduped
 
 
+# --- ALNS Warm Start ---
+def _reconcile_elite(elite_routes, all_orders_by_id, num_vehicles):
+    """
+    Maps a solution from a previous cycle onto the current orders: routes
+    keep their order, orders that no longer exist are dropped and the rest
+    are replaced by their current objects. Vehicles beyond num_vehicles are
+    ignored.
+    Returns: (routes_dict, missing_orders) where missing_orders are current
+    orders the elite does not contain (new orders since it was found).
+    """
+    routes = {v_id: [] for v_id in range(num_vehicles)}
+    placed = set()
+    for v_id, route_orders in elite_routes.items():
+        if v_id not in routes:
+            continue
+        kept = [all_orders_by_id[o['id']] for o in route_orders
+                if o['id'] in all_orders_by_id and o['id'] not in placed]
+        placed.update(o['id'] for o in kept)
+        routes[v_id] = kept
+    missing_orders = [o for o_id, o in all_orders_by_id.items() if o_id not in placed]
+    return routes, missing_orders
+
+def _update_elite_pool(elite_pool, routes, unassigned, objective, fingerprint):
+    """Keeps the ALNS_ELITE_POOL_SIZE best distinct solutions, best first."""
+    if any(e['fingerprint'] == fingerprint for e in elite_pool):
+        return
+    elite_pool.append({'routes': routes, 'unassigned': unassigned,
+                       'objective': objective, 'fingerprint': fingerprint})
+    elite_pool.sort(key=lambda e: e['objective'])
+    del elite_pool[ALNS_ELITE_POOL_SIZE:]
+
+
+# --- ALNS Operator Statistics ---
+def _new_operator_stats(destroy_operators, repair_operators):
+    """
+    Empty per-operator statistics:
+    { 'destroy': {name: {...}}, 'repair': {name: {...}} } where each entry has
+    calls, time_sec (total runtime), accepted, improved (better than current)
+    and new_best (new global best).
+    """
+    def entry():
+        return {'calls': 0, 'time_sec': 0.0, 'accepted': 0, 'improved': 0, 'new_best': 0}
+    return {
+        'destroy': {op.__name__: entry() for op in destroy_operators},
+        'repair': {op.__name__: entry() for op in repair_operators}
+    }
+
+def print_operator_stats(operator_stats):
+    """Prints one line per ALNS operator: calls, runtime and success counts."""
+    for kind in ('destroy', 'repair'):
+        for name, st in operator_stats.get(kind, {}).items():
+            if not st['calls']:
+                continue
+            avg_ms = 1000.0 * st['time_sec'] / st['calls']
+            weight = operator_stats.get('final_weights', {}).get(kind, {}).get(name)
+            weight_str = f", weight={weight:.2f}" if weight is not None else ""
+            print(f"    {kind:7s} {name:18s} calls={st['calls']:5d} avg={avg_ms:7.2f} ms "
+                  f"accepted={st['accepted']:4d} improved={st['improved']:4d} new_best={st['new_best']:3d}{weight_str}")
+    if 'duplicates_of_current' in operator_stats:
+        print(f"    {operator_stats['duplicates_of_current']} candidates identical to the current solution skipped")
+
 # --- Main ALNS Function ---
 def run_alns_optimization(current_routes_input, pending_orders_input, time_matrix, distance_matrix,
                           num_vehicles, vehicle_capacity, max_route_duration_mins,
                           fixed_cost_per_truck, variable_cost_per_km, # Add cost params
-                          alns_iterations=ALNS_ITERATIONS):
+                          alns_iterations=ALNS_ITERATIONS, operator_stats=None,
+                          deadline=None, max_non_improving=ALNS_MAX_NON_IMPROVING,
+                          on_new_best=None, temp_start=ALNS_TEMP_START, cooling_rate=ALNS_COOLING_RATE,
+                          destroy_min_percent=ALNS_DESTROY_MIN_PERCENT,
+                          destroy_max_percent=ALNS_DESTROY_MAX_PERCENT,
+                          migrate=None, migration_interval=ALNS_MIGRATION_INTERVAL,
+                          alns_state=None, lower_bound=None, gap_tolerance=ALNS_GAP_TOLERANCE,
+                          cancel_token=None, clock=None):
     """
     Performs Adaptive Large Neighborhood Search (ALNS) to optimize routes.
-    Starts with the provided routes/pending orders and tries to improve them.
+    Starts from the provided (incumbent) routes with the pending orders
+    inserted greedily, and tries to improve them.
+    If operator_stats (a dict) is given, it is filled with per-operator
+    call counts, runtime and success counts (see _new_operator_stats).
+
+    Anytime behaviour:
+    - deadline: wall-clock time (time.time()) after which the search stops,
+      whatever alns_iterations says.
+    - max_non_improving: stop after this many iterations without a new best.
+    - on_new_best(routes, unassigned, cost): called with the initial solution
+      and with every new best, so a caller can take the best-so-far at any time.
+    - lower_bound (see lower_bounds.objective_lower_bound): stop once the best
+      objective is within gap_tolerance of it.
+    - cancel_token (see portfolio.CancellationToken): every new best
+      objective is reported to it, and the search stops once it is cancelled.
+    - clock (see portfolio.WorkClock): run on simulated time. It ticks once
+      per iteration; deadline is a simulated time and the cancel token is
+      polled and reported to with clock.now(), so where the search stops
+      does not depend on the speed of the machine.
+    temp_start, cooling_rate and destroy_min/max_percent override the module
+    defaults (used by the multi-start runner to diversify its searches).
+
+    Island model: if migrate is given, every migration_interval iterations it
+    is called as migrate(best_routes, best_unassigned, best_objective) and may
+    return an immigrant (routes, unassigned, objective) or None. A better
+    immigrant replaces the current (and, if better, the best) solution.
+
+    Continuation: alns_state is a dict carried from one call to the next.
+    It is read at the start (operator weights, temperature, elite pool; the
+    elites are reconciled with the current orders and the best of them and
+    the incumbent becomes the initial solution) and written back at the end.
+    Pass an empty dict on the first cycle.
     Returns the best solution found (routes_dict, unassigned_orders_list).
     """
-    print(f"--- [LAYER 3 ALNS] Starting optimization for {alns_iterations} iterations... ---")
+    now = clock.now if clock is not None else time.time
+    clock_now = clock.now if clock is not None else lambda: None # Simulated time for the cancel token
+    deadline_str = f", deadline in {deadline - now():.1f}s" if deadline is not None else ""
+    print(f"--- [LAYER 3 ALNS] Starting optimization for up to {alns_iterations} iterations{deadline_str}... ---")
     start_time_alns = time.time()
+    refresh_matrix_versions(time_matrix, distance_matrix)
+    time_matrix = with_service_time(time_matrix)
 
     # --- Initialize ---
-    # Combine all orders into one pool for the initial insertion attempt
-    initial_pending = pending_orders_input[:]
-    initial_routes = copy.deepcopy(current_routes_input)
-    for route in initial_routes.values():
-        initial_pending.extend(route)
-    
-    # Try a simple initial solution: Greedily insert all pending orders
-    # Start with empty routes
-    initial_solution_routes = {v_id: [] for v_id in range(num_vehicles)}
-    initial_solution_routes, initial_unassigned = _repair_greedy(
-        initial_solution_routes, initial_pending, time_matrix, distance_matrix,
-        vehicle_capacity, max_route_duration_mins, num_vehicles
-    )
-    
-    # If initial greedy insert fails badly, fall back to input routes + try inserting pending
-    if len(initial_unassigned) > len(pending_orders_input):
-         print("--- [LAYER 3 ALNS] Initial greedy insertion performed poorly, starting from input routes... ---")
-         initial_solution_routes = copy.deepcopy(current_routes_input)
-         initial_solution_routes, initial_unassigned = _repair_greedy(
-             initial_solution_routes, pending_orders_input[:], time_matrix, distance_matrix,
-             vehicle_capacity, max_route_duration_mins, num_vehicles
-        )
+    if alns_state is None:
+        alns_state = {}
+    all_orders_by_id = {o['id']: o for o in pending_orders_input}
+    for route in current_routes_input.values():
+        for o in route:
+            all_orders_by_id[o['id']] = o
+
+    # Warm start: refine the incumbent instead of rebuilding from empty routes
+    start_candidates = [(_clone_routes(current_routes_input), pending_orders_input[:])]
+    for elite in alns_state.get('elite_pool', []):
+        start_candidates.append(_reconcile_elite(elite['routes'], all_orders_by_id, num_vehicles))
 
-    print(f"--- [LAYER 3 ALNS] Initial solution created with {len(initial_unassigned)} unassigned orders. ---")
+    initial_solution_routes, initial_unassigned, initial_objective = None, None, float('inf')
+    for start_routes, start_bank in start_candidates:
+        if start_bank:
+            start_routes, start_bank = _repair_greedy(
+                start_routes, start_bank, time_matrix, distance_matrix,
+                vehicle_capacity, max_route_duration_mins, num_vehicles
+            )
+        start_cost, _, _ = calculate_total_fleet_cost(start_routes, distance_matrix, fixed_cost_per_truck, variable_cost_per_km)
+        start_objective = calculate_alns_objective(start_cost, start_bank, fixed_cost_per_truck)
+        if start_objective < initial_objective:
+            initial_solution_routes, initial_unassigned, initial_objective = start_routes, start_bank, start_objective
+
+    print(f"--- [LAYER 3 ALNS] Initial solution created with {len(initial_unassigned)} unassigned orders "
+          f"(best of incumbent and {len(start_candidates) - 1} carried elite(s)). ---")
 
     current_solution_routes = initial_solution_routes
     current_unassigned = initial_unassigned
     current_cost, _, _ = calculate_total_fleet_cost(current_solution_routes, distance_matrix, fixed_cost_per_truck, variable_cost_per_km)
     # Add penalty for unassigned orders to guide the search
-    current_objective = current_cost + (len(current_unassigned) * fixed_cost_per_truck * 10) # Heavy penalty
+    current_objective = calculate_alns_objective(current_cost, current_unassigned, fixed_cost_per_truck)
+    # A candidate identical to the current solution is neither accepted nor
+    # rewarded. Fingerprinting every candidate costs more than evaluating it,
+    # so only candidates that tie with the current objective are fingerprinted
+    # (current_fingerprint is None until needed after current changed).
+    current_fingerprint = None
+    duplicates_of_current = 0
+    elite_pool = []
+    _update_elite_pool(elite_pool, current_solution_routes, current_unassigned, current_objective,
+                       solution_fingerprint(current_solution_routes))
 
     best_solution_routes = current_solution_routes
     best_unassigned = current_unassigned
     best_cost = current_cost
     best_objective = current_objective
+    if on_new_best:
+        on_new_best(best_solution_routes, best_unassigned, best_cost)
+    if cancel_token is not None:
+        cancel_token.report(best_objective, at=clock_now())
 
     # --- Operators ---
-    # For now, only one of each. Extend these lists later.
-    destroy_operators = [_destroy_random]
-    repair_operators = [_repair_greedy]
+    destroy_operators = [_destroy_random, _destroy_worst, _destroy_shaw, _destroy_route]
+    repair_operators = [_repair_greedy, _repair_regret_2, _repair_regret_3]
+    if operator_stats is None:
+        operator_stats = {}
+    operator_stats.clear()
+    operator_stats.update(_new_operator_stats(destroy_operators, repair_operators))
     
     # --- Operator Weights & Scores ---
-    destroy_weights = [1.0] * len(destroy_operators)
-    repair_weights = [1.0] * len(repair_operators)
+    # Continued searches keep the weights learned in earlier cycles
+    carried_weights = alns_state.get('weights', {})
+    destroy_weights = [carried_weights.get('destroy', {}).get(op.__name__, 1.0) for op in destroy_operators]
+    repair_weights = [carried_weights.get('repair', {}).get(op.__name__, 1.0) for op in repair_operators]
     destroy_scores = [0.0] * len(destroy_operators)
     repair_scores = [0.0] * len(repair_operators)
     destroy_counts = [0] * len(destroy_operators)
     repair_counts = [0] * len(repair_operators)
 
     # --- Temperature for Acceptance ---
-    temperature = ALNS_TEMP_START
+    # Continue the cooling schedule, reheated a little since new orders changed the problem
+    temperature = temp_start
+    if 'temperature' in alns_state:
+        temperature = max(alns_state['temperature'], temp_start * ALNS_WARM_REHEAT_FRACTION)
 
     # --- ALNS Main Loop ---
+    iterations_done = 0
+    last_best_iteration = 0
+    stop_reason = "iteration limit"
     for i in range(alns_iterations):
+
+        # --- 0. Check Time Budget and Stagnation ---
+        if deadline is not None and now() >= deadline:
+            stop_reason = "deadline"
+            break
+        if max_non_improving is not None and i - last_best_iteration >= max_non_improving:
+            stop_reason = f"no new best for {max_non_improving} iterations"
+            break
+        if lower_bound is not None and best_objective - lower_bound <= gap_tolerance * best_objective:
+            stop_reason = f"within {gap_tolerance:.1%} of the lower bound"
+            break
+        if cancel_token is not None and cancel_token.cancelled(at=clock_now()):
+            stop_reason = "cancelled"
+            break
+        iterations_done = i + 1
+        if clock is not None:
+            clock.tick()
         
         # --- 1. Select Operators ---
         destroy_op_idx = _roulette_wheel_selection(destroy_weights)
@@ -714,10 +1844,15 @@ def run_alns_optimization(current_routes_input, pending_orders_input, time_matri
         total_assigned_now = sum(len(r) for r in current_solution_routes.values())
         if total_assigned_now == 0: continue # Skip if no orders are assigned
 
-        destroy_percent = random.uniform(ALNS_DESTROY_MIN_PERCENT, ALNS_DESTROY_MAX_PERCENT)
+        destroy_percent = random.uniform(destroy_min_percent, destroy_max_percent)
         num_to_remove = max(1, int(total_assigned_now * destroy_percent))
 
-        partial_routes, request_bank = destroy_op(current_solution_routes, num_to_remove)
+        op_start = time.perf_counter()
+        partial_routes, request_bank = destroy_op(current_solution_routes, num_to_remove,
+                                                  time_matrix, distance_matrix)
+        destroy_stats = operator_stats['destroy'][destroy_op.__name__]
+        destroy_stats['calls'] += 1
+        destroy_stats['time_sec'] += time.perf_counter() - op_start
         
         # Add any currently unassigned orders to the request bank too
         request_bank.extend(current_unassigned)
@@ -725,35 +1860,59 @@ def run_alns_optimization(current_routes_input, pending_orders_input, time_matri
         if not request_bank: continue # Nothing to repair
 
         # --- 3. Repair ---
+        op_start = time.perf_counter()
         new_solution_routes, new_unassigned = repair_op(
             partial_routes, request_bank, time_matrix, distance_matrix,
             vehicle_capacity, max_route_duration_mins, num_vehicles
         )
+        repair_stats = operator_stats['repair'][repair_op.__name__]
+        repair_stats['calls'] += 1
+        repair_stats['time_sec'] += time.perf_counter() - op_start
 
         # --- 4. Evaluate New Solution ---
+        accepted = False
+        new_best_found = False
+        score_update = 0
+
         new_cost, _, _ = calculate_total_fleet_cost(new_solution_routes, distance_matrix, fixed_cost_per_truck, variable_cost_per_km)
-        new_objective = new_cost + (len(new_unassigned) * fixed_cost_per_truck * 10) # Apply penalty
+        new_objective = calculate_alns_objective(new_cost, new_unassigned, fixed_cost_per_truck)
 
         # --- 5. Acceptance Criterion ---
-        accepted = False
-        score_update = 0
-        
         delta_objective = new_objective - current_objective
 
-        if delta_objective < 0:
+        new_fingerprint = None
+        if delta_objective == 0:
+            if current_fingerprint is None:
+                current_fingerprint = solution_fingerprint(current_solution_routes)
+            new_fingerprint = solution_fingerprint(new_solution_routes)
+        is_current = new_fingerprint is not None and new_fingerprint == current_fingerprint
+
+        if is_current:
+            # Destroy/repair rebuilt the current solution: nothing to accept
+            duplicates_of_current += 1
+        elif delta_objective < 0:
             # Improvement found
             current_solution_routes = new_solution_routes
             current_unassigned = new_unassigned
             current_objective = new_objective
+            current_fingerprint = new_fingerprint
             accepted = True
             
             if new_objective < best_objective:
                 # New global best found
-                best_solution_routes = copy.deepcopy(new_solution_routes) # Deep copy best
+                best_solution_routes = new_solution_routes # Route lists are never mutated, no copy needed
                 best_unassigned = new_unassigned[:]
                 best_objective = new_objective
                 best_cost = new_cost # Store the actual cost without penalty
+                new_best_found = True
+                last_best_iteration = i
                 score_update = ALNS_SIGMA1
+                _update_elite_pool(elite_pool, best_solution_routes, best_unassigned, best_objective,
+                                   solution_fingerprint(best_solution_routes))
+                if on_new_best:
+                    on_new_best(best_solution_routes, best_unassigned, best_cost)
+                if cancel_token is not None:
+                    cancel_token.report(best_objective, at=clock_now())
                 # print(f"Iter {i}: New best found! Cost={best_cost:.2f}, Unassigned={len(best_unassigned)}") # Optional: Log improvements
             else:
                 score_update = ALNS_SIGMA2
@@ -764,6 +1923,7 @@ def run_alns_optimization(current_routes_input, pending_orders_input, time_matri
                 current_solution_routes = new_solution_routes
                 current_unassigned = new_unassigned
                 current_objective = new_objective
+                current_fingerprint = new_fingerprint
                 accepted = True
                 score_update = ALNS_SIGMA3
 
@@ -771,17 +1931,24 @@ def run_alns_optimization(current_routes_input, pending_orders_input, time_matri
         if accepted:
              destroy_scores[destroy_op_idx] += score_update
              repair_scores[repair_op_idx] += score_update
+             for op_stats in (destroy_stats, repair_stats):
+                 op_stats['accepted'] += 1
+                 if delta_objective < 0:
+                     op_stats['improved'] += 1
+                 if new_best_found:
+                     op_stats['new_best'] += 1
 
         # --- 7. Update Temperature ---
-        temperature *= ALNS_COOLING_RATE
+        temperature *= cooling_rate
 
         # --- 8. Update Operator Weights Periodically ---
         if (i + 1) % ALNS_SEGMENT_LENGTH == 0:
             for op_idx in range(len(destroy_operators)):
                 if destroy_counts[op_idx] > 0:
                      avg_score = destroy_scores[op_idx] / destroy_counts[op_idx]
-                     destroy_weights[op_idx] = (1 - ALNS_REACTION_FACTOR) * destroy_weights[op_idx] + \
-                                               ALNS_REACTION_FACTOR * avg_score
+                     destroy_weights[op_idx] = max(ALNS_MIN_OPERATOR_WEIGHT,
+                                                   (1 - ALNS_REACTION_FACTOR) * destroy_weights[op_idx] +
+                                                   ALNS_REACTION_FACTOR * avg_score)
                 # Reset scores/counts for next segment
                 destroy_scores[op_idx] = 0.0
                 destroy_counts[op_idx] = 0
@@ -789,17 +1956,48 @@ def run_alns_optimization(current_routes_input, pending_orders_input, time_matri
             for op_idx in range(len(repair_operators)):
                 if repair_counts[op_idx] > 0:
                      avg_score = repair_scores[op_idx] / repair_counts[op_idx]
-                     repair_weights[op_idx] = (1 - ALNS_REACTION_FACTOR) * repair_weights[op_idx] + \
-                                              ALNS_REACTION_FACTOR * avg_score
+                     repair_weights[op_idx] = max(ALNS_MIN_OPERATOR_WEIGHT,
+                                                  (1 - ALNS_REACTION_FACTOR) * repair_weights[op_idx] +
+                                                  ALNS_REACTION_FACTOR * avg_score)
                 # Reset scores/counts
                 repair_scores[op_idx] = 0.0
                 repair_counts[op_idx] = 0
             # print(f"Iter {i}: Updated operator weights. D:{destroy_weights}, R:{repair_weights}") # Optional debug
 
+        # --- 9. Exchange Elites With Other Islands ---
+        if migrate and (i + 1) % migration_interval == 0:
+            immigrant = migrate(best_solution_routes, best_unassigned, best_objective)
+            if immigrant is not None and immigrant[2] < current_objective:
+                current_solution_routes, current_unassigned, current_objective = immigrant
+                current_fingerprint = None
+                if current_objective < best_objective:
+                    best_solution_routes = current_solution_routes
+                    best_unassigned = current_unassigned[:]
+                    best_objective = current_objective
+                    best_cost, _, _ = calculate_total_fleet_cost(best_solution_routes, distance_matrix, fixed_cost_per_truck, variable_cost_per_km)
+                    last_best_iteration = i
+                    _update_elite_pool(elite_pool, best_solution_routes, best_unassigned, best_objective,
+                                       solution_fingerprint(best_solution_routes))
+                    if on_new_best:
+                        on_new_best(best_solution_routes, best_unassigned, best_cost)
+                    if cancel_token is not None:
+                        cancel_token.report(best_objective, at=clock_now())
+
     # --- End of ALNS Loop ---
     end_time_alns = time.time()
-    print(f"--- [LAYER 3 ALNS] Finished {alns_iterations} iterations in {end_time_alns - start_time_alns:.2f} seconds. ---")
+    print(f"--- [LAYER 3 ALNS] Finished {iterations_done} iterations in {end_time_alns - start_time_alns:.2f} seconds (stopped: {stop_reason}). ---")
     print(f"--- [LAYER 3 ALNS] Best solution found: Cost={best_cost:.2f}, Unassigned={len(best_unassigned)} ---")
+    operator_stats['final_weights'] = {
+        'destroy': {op.__name__: w for op, w in zip(destroy_operators, destroy_weights)},
+        'repair': {op.__name__: w for op, w in zip(repair_operators, repair_weights)}
+    }
+    # Hand the learned state to the next cycle
+    alns_state['weights'] = operator_stats['final_weights']
+    alns_state['temperature'] = temperature
+    alns_state['elite_pool'] = elite_pool
+    alns_state['cycles'] = alns_state.get('cycles', 0) + 1
+    operator_stats['duplicates_of_current'] = duplicates_of_current
+    print_operator_stats(operator_stats)
 
     # Return the best solution found during the search
     return best_solution_routes, best_unassigned
\ No newline at end of file
@@ -0,0 +1,176 @@
+import math
+
+import numpy as np
+
+from hybrid_solver_layers import ALNS_UNASSIGNED_PENALTY_TRUCKS
+
+# --- Lower Bounds ---
+# A cheap bound on the ALNS objective (fleet cost + unassigned penalty, see
+# calculate_alns_objective) of any solution for a set of orders, so the
+# solvers can tell how far from optimal they still are (the gap) and stop
+# early once it is small enough. Computed in milliseconds, once per cycle.
+
+LOWER_BOUND_SUBGRADIENT_ITERATIONS = 100 # Held-Karp subgradient iterations
+LOWER_BOUND_POLYAK_TARGET = 1.1          # Step towards this multiple of the best bound so far
+LOWER_BOUND_STEP_DECAY = 0.97
+
+
+def _metric_closure(distance_matrix, nodes):
+    """
+    Symmetric shortest-path distances between nodes (min of both directions,
+    then Floyd-Warshall), so the triangle inequality holds. Every route is at
+    least as long under these distances as under distance_matrix.
+    """
+    sub = np.asarray(distance_matrix, dtype=float)[np.ix_(nodes, nodes)]
+    closure = np.minimum(sub, sub.T)
+    for k in range(len(nodes)):
+        closure = np.minimum(closure, closure[:, k:k + 1] + closure[k:k + 1, :])
+    return closure
+
+
+def _mst(weights):
+    """Prim's algorithm on a dense symmetric matrix. Returns: the n - 1 MST edges as (i, j, weight)."""
+    n = len(weights)
+    in_tree = np.zeros(n, dtype=bool)
+    in_tree[0] = True
+    best = weights[0].copy()
+    parent = np.zeros(n, dtype=int)
+    edges = []
+    for _ in range(n - 1):
+        candidates = np.where(in_tree, np.inf, best)
+        nxt = int(candidates.argmin())
+        edges.append((int(parent[nxt]), nxt, candidates[nxt]))
+        in_tree[nxt] = True
+        closer = weights[nxt] < best
+        best = np.where(closer, weights[nxt], best)
+        parent = np.where(closer, nxt, parent)
+    return edges
+
+
+def _held_karp_bound(closure, iterations=LOWER_BOUND_SUBGRADIENT_ITERATIONS):
+    """
+    Held-Karp (1-tree) bound on the shortest tour through all nodes of
+    closure. With the triangle inequality any set of routes can be merged
+    into one tour through the depot that is no longer, so this bounds the
+    total distance of every solution, whatever its number of trucks.
+    The 1-tree (MST over the stops plus the two cheapest depot edges, a
+    stop may take both) has degree 2 at every stop in a tour; Lagrange
+    multipliers on the degrees, updated with Polyak subgradient steps
+    towards LOWER_BOUND_POLYAK_TARGET times the best bound, tighten it.
+    Returns: the best bound found.
+    """
+    num_stops = len(closure) - 1
+    stops = closure[1:, 1:]
+    depot = closure[0, 1:]
+    multipliers = np.zeros(num_stops)
+    best = 0.0
+    step_scale = 1.0
+    for _ in range(iterations):
+        weights = stops + multipliers[:, None] + multipliers[None, :]
+        degree = np.zeros(num_stops)
+        value = 0.0
+        if num_stops > 1:
+            for i, j, weight in _mst(weights):
+                degree[i] += 1
+                degree[j] += 1
+                value += weight
+        depot_ends = np.argsort(np.repeat(depot + multipliers, 2), kind='stable')[:2] // 2
+        np.add.at(degree, depot_ends, 1)
+        value += (depot + multipliers)[depot_ends].sum() - 2 * multipliers.sum()
+        best = max(best, value)
+
+        subgradient = degree - 2
+        norm = (subgradient ** 2).sum()
+        if norm == 0: # Every stop has degree 2: the 1-tree is an optimal tour
+            break
+        multipliers += step_scale * (LOWER_BOUND_POLYAK_TARGET * best - value) / norm * subgradient
+        step_scale *= LOWER_BOUND_STEP_DECAY
+    return best
+
+
+def fleet_cost_lower_bound(orders, distance_matrix, num_vehicles, vehicle_capacity,
+                           fixed_cost_per_truck, variable_cost_per_km):
+    """
+    Lower bound on calculate_total_fleet_cost of any solution serving all
+    the given orders.
+    Trucks: at least ceil(total demand / capacity) (bin packing), and at
+    least one per order larger than half the capacity.
+    Distance: at least the Held-Karp bound of depot + stops
+    (_held_karp_bound), and at least 2 * sum(demand * depot distance) /
+    capacity, since every unit of demand rides to its stop and back on a
+    truck carrying at most vehicle_capacity units (the radial bound).
+    Distances are taken from the metric closure of distance_matrix, so
+    asymmetric matrices and detours shorter than the direct road are fine.
+    Returns: (fleet_cost_bound, trucks, distance_bound); all None if the
+    orders cannot all be served by num_vehicles trucks.
+    """
+    if not orders:
+        return 0.0, 0, 0.0
+    total_demand = sum(o['demand'] for o in orders)
+    trucks = max(math.ceil(total_demand / vehicle_capacity),
+                 sum(1 for o in orders if 2 * o['demand'] > vehicle_capacity))
+    if trucks > num_vehicles:
+        return None, None, None
+
+    # Orders at the depot itself need a truck but no driving
+    stops = sorted({o['index'] for o in orders} - {0})
+    distance = 0.0
+    if stops:
+        closure = _metric_closure(distance_matrix, [0] + stops)
+        closure[np.isinf(closure)] = 0.0 # No road either way: nothing is known about that leg
+        position = {loc: i + 1 for i, loc in enumerate(stops)}
+        radial = 2.0 * sum(o['demand'] * closure[0, position[o['index']]] for o in orders
+                           if o['index'] != 0) / vehicle_capacity
+        distance = float(max(_held_karp_bound(closure), radial))
+    return float(fixed_cost_per_truck * trucks + variable_cost_per_km * distance), trucks, distance
+
+
+def objective_lower_bound(orders, distance_matrix, num_vehicles, vehicle_capacity,
+                          fixed_cost_per_truck, variable_cost_per_km):
+    """
+    Lower bound on the ALNS objective of any solution for these orders.
+    If the fleet capacity cannot take them all, at least m orders (the
+    fewest, largest, whose demand covers the excess) stay unassigned.
+    A solution leaving exactly m unassigned pays m penalties plus at least
+    the trucks for the demand left; one leaving more pays at least m + 1
+    penalties; with m == 0, serving everything costs at least
+    fleet_cost_lower_bound.
+    Returns: dict with 'objective', 'fleet_cost', 'trucks', 'distance'
+    and 'forced_unassigned'.
+    """
+    penalty = fixed_cost_per_truck * ALNS_UNASSIGNED_PENALTY_TRUCKS
+    excess = sum(o['demand'] for o in orders) - num_vehicles * vehicle_capacity
+    forced = 0
+    dropped_demand = 0
+    for demand in sorted((o['demand'] for o in orders), reverse=True):
+        if dropped_demand >= excess:
+            break
+        dropped_demand += demand
+        forced += 1
+
+    if forced == 0:
+        fleet_cost, trucks, distance = fleet_cost_lower_bound(
+            orders, distance_matrix, num_vehicles, vehicle_capacity,
+            fixed_cost_per_truck, variable_cost_per_km
+        )
+        if fleet_cost is None: # Enough capacity in total, but not in whole trucks
+            fleet_cost, trucks, distance = penalty, None, None
+    else:
+        served_demand = sum(o['demand'] for o in orders) - dropped_demand
+        trucks = math.ceil(served_demand / vehicle_capacity) if served_demand > 0 else 0
+        fleet_cost, distance = fixed_cost_per_truck * trucks, 0.0
+
+    return {
+        'objective': min(forced * penalty + fleet_cost, (forced + 1) * penalty),
+        'fleet_cost': fleet_cost,
+        'trucks': trucks,
+        'distance': distance,
+        'forced_unassigned': forced
+    }
+
+
+def optimality_gap(objective, lower_bound):
+    """Returns: (objective - lower_bound) / objective, 0.0 for a zero objective."""
+    if objective <= 0:
+        return 0.0
+    return max(0.0, (objective - lower_bound) / objective)
@@ -5,12 +5,153 @@ import os
 from datetime import datetime, timedelta
 import time
 import math # NEW: Import the math library
+import numpy as np
 from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
 
 # The fixed time in minutes spent at each customer location for the delivery.
 SERVICE_TIME_MINUTES = 5
 
+# --- Layer 2 Engine Configuration ---
+# Register the time matrix and demands as precomputed OR-Tools transits instead
+# of Python callbacks, so the C++ search never calls back into the interpreter
+L2_PRECOMPUTED_TRANSITS = True
+
+# --- Layer 2 Search Budget ---
+L2_TIME_PER_NODE_SEC = 0.05       # Time limit grows with the model: 100 nodes -> 5 s
+L2_MIN_TIME_LIMIT_SEC = 1.0
+L2_MAX_TIME_LIMIT_SEC = 30.0
+L2_SHARE_OF_TIME_LEFT = 0.5       # Never plan past this share of the time left before the deadline
+L2_SOLUTION_LIMIT_PER_NODE = 50   # Stop after this many solutions per node
+L2_STAGNATION_SOLUTIONS = 200     # Stop after this many solutions without a new best
+L2_ANYTIME_LOG_POINTS = 6         # Points of the cost-over-time curve printed per solve
+
+
+def l2_time_limit_seconds(num_nodes, deadline=None, now=None):
+    """
+    Time limit of one L2 solve: L2_TIME_PER_NODE_SEC per node, clamped to
+    [L2_MIN_TIME_LIMIT_SEC, L2_MAX_TIME_LIMIT_SEC], and with a deadline
+    at most L2_SHARE_OF_TIME_LEFT of the time left (but never below the
+    minimum, a solve always gets to produce a solution). The time left is
+    counted from now (time.time() by default, or a simulated time).
+    """
+    limit = min(max(num_nodes * L2_TIME_PER_NODE_SEC, L2_MIN_TIME_LIMIT_SEC), L2_MAX_TIME_LIMIT_SEC)
+    if deadline is not None:
+        now = time.time() if now is None else now
+        limit = min(limit, max((deadline - now) * L2_SHARE_OF_TIME_LEFT, L2_MIN_TIME_LIMIT_SEC))
+    return limit
+
+
+def set_search_limits(search_parameters, num_nodes, deadline=None, deterministic=False, clock=None):
+    """
+    Sets the time limit (l2_time_limit_seconds) and the solution limit of
+    the search parameters for a model of num_nodes nodes.
+    With deterministic, the time limit is only a safety net
+    (L2_MAX_TIME_LIMIT_SEC): the solution and stagnation limits end the
+    search, so its result does not depend on the speed of the machine.
+    With a clock (see portfolio.WorkClock, one unit per solution), the time
+    limit is sized in simulated time against deadline and becomes a
+    solution limit; the real time limit is again only the safety net.
+    Returns: the time limit in seconds (simulated with a clock).
+    """
+    solution_limit = max(1, num_nodes * L2_SOLUTION_LIMIT_PER_NODE)
+    if clock is not None:
+        limit = l2_time_limit_seconds(num_nodes, deadline, clock.now())
+        solution_limit = max(1, min(solution_limit, int(limit / clock.seconds_per_unit)))
+        search_parameters.time_limit.FromMilliseconds(int(L2_MAX_TIME_LIMIT_SEC * 1000))
+    else:
+        limit = L2_MAX_TIME_LIMIT_SEC if deterministic else l2_time_limit_seconds(num_nodes, deadline)
+        search_parameters.time_limit.FromMilliseconds(int(limit * 1000))
+    search_parameters.solution_limit = solution_limit
+    return limit
+
+
+class AnytimeMonitor:
+    """
+    At-solution callback (routing.AddAtSolutionCallback) of an L2 solve.
+    Records the anytime curve, [(seconds since start, best cost), ...] at each
+    new best, and finishes the search after stagnation_solutions solutions
+    without one. With a clock (see portfolio.WorkClock), every solution
+    ticks it and the curve is in simulated seconds. With yield_gil, it also gives the other threads (tick loop,
+    Layer 3) a turn at every solution: without Python transit callbacks the
+    solve would otherwise hold the GIL for its whole time limit.
+    stop_check (optional, needs manager) is called with the routes of every
+    new best (one list of location indices per vehicle, depot excluded) and
+    finishes the search when it returns True (e.g. the optimality gap is
+    small enough). should_stop (optional) is polled at every solution and
+    finishes the search when it returns True (cooperative cancellation).
+    """
+
+    def __init__(self, routing, stagnation_solutions=L2_STAGNATION_SOLUTIONS, yield_gil=True,
+                 manager=None, stop_check=None, should_stop=None, clock=None):
+        self.routing = routing
+        self.stagnation_solutions = stagnation_solutions
+        self.yield_gil = yield_gil
+        self.manager = manager
+        self.stop_check = stop_check
+        self.should_stop = should_stop
+        self.clock = clock
+        self.start = time.perf_counter()
+        self.clock_start = clock.now() if clock is not None else None
+        self.curve = []
+        self.num_solutions = 0
+        self.since_best = 0
+        self.stop_reason = None
+
+    def _stop(self, reason):
+        if self.stop_reason is None:
+            self.stop_reason = reason
+            self.routing.solver().FinishCurrentSearch()
+
+    def current_routes(self):
+        """Returns: the routes of the solution being reported (only valid inside the callback)."""
+        routes = []
+        for vehicle_id in range(self.routing.vehicles()):
+            route = []
+            index = self.routing.NextVar(self.routing.Start(vehicle_id)).Value()
+            while not self.routing.IsEnd(index):
+                route.append(self.manager.IndexToNode(index))
+                index = self.routing.NextVar(index).Value()
+            routes.append(route)
+        return routes
+
+    def _elapsed(self):
+        if self.clock is not None:
+            return self.clock.now() - self.clock_start
+        return time.perf_counter() - self.start
+
+    def __call__(self):
+        self.num_solutions += 1
+        if self.clock is not None:
+            self.clock.tick()
+        cost = self.routing.CostVar().Max()
+        if not self.curve or cost < self.curve[-1][1]:
+            self.curve.append((self._elapsed(), cost))
+            self.since_best = 0
+            if self.stop_check is not None and self.stop_check(self.current_routes()):
+                self._stop("stop check")
+        else:
+            self.since_best += 1
+            if self.since_best >= self.stagnation_solutions:
+                self._stop("stagnation")
+        if self.should_stop is not None and self.should_stop():
+            self._stop("cancellation")
+        if self.yield_gil:
+            time.sleep(0)
+
+    def summary(self, max_points=L2_ANYTIME_LOG_POINTS):
+        """Returns: one line with the number of solutions and a sample of the anytime curve."""
+        points = self.curve
+        if len(points) > max_points:
+            step = (len(points) - 1) / (max_points - 1)
+            points = [points[round(i * step)] for i in range(max_points)]
+        curve_str = " -> ".join(f"{t:.2f}s:{cost}" for t, cost in points)
+        stop_str = f", stopped on {self.stop_reason}" if self.stop_reason else ""
+        simulated_str = f" ({self._elapsed():.2f}s simulated)" if self.clock is not None else ""
+        return (f"{self.num_solutions} solutions in {time.perf_counter() - self.start:.2f}s{simulated_str}{stop_str}; "
+                f"best cost over time: {curve_str}")
+
+
 # Traffic and Departure Time Configuration
 PLANNING_DAY_OFFSET = 1
 PLANNING_HOUR = 11
@@ -35,13 +176,35 @@ def save_cache():
 # --- NEW FUNCTION (from hybrid_solver) ---
 # This is the VRP engine for the Layer 2 dynamic simulation
 def solve_vrp_with_capacity(time_matrix, demands, vehicle_capacities, 
-                          vehicle_max_durations_mins, num_vehicles):
+                          vehicle_max_durations_mins, num_vehicles, drop_penalties=None,
+                          precomputed_transits=L2_PRECOMPUTED_TRANSITS, solver_stats=None,
+                          initial_routes=None, deadline=None, stop_check=None, should_stop=None,
+                          arc_cost_matrix=None, vehicle_fixed_cost=0, deterministic=False, clock=None):
     """
     Solves a Capacitated Vehicle Routing Problem (CVRP).
     This is the low-level OR-Tools engine for Layer 2.
     
     All time values (time_matrix, vehicle_max_durations_mins) 
     are expected to be in MINUTES.
+    time_matrix may be a list of lists or a 2-D integer NumPy array.
+    drop_penalties (optional, one per location, depot entry ignored) is the
+    cost of leaving a location unserved; 1000000 each by default.
+    The objective is the total travel time, or, with arc_cost_matrix (an
+    integer cost per arc, e.g. the scaled distance cost), the sum of the arc
+    costs plus vehicle_fixed_cost per vehicle used. Either way the Time
+    dimension limits each route to vehicle_max_durations_mins.
+    precomputed_transits=False falls back to Python callbacks (kept for
+    benchmarking). If solver_stats (a dict) is given, it is filled with
+    'branches', 'failures', 'wall_time_ms' and 'objective' of the search.
+    initial_routes (optional, one list of location indices per vehicle, depot
+    excluded) warm-starts the search from those routes instead of building a
+    first solution; if OR-Tools rejects them, the search starts cold.
+    The time and solution limits scale with the number of locations and the
+    time left before deadline, or only the former with deterministic; with
+    a clock the search runs on simulated time (see set_search_limits). The
+    anytime curve of the search is printed, and also stored in
+    solver_stats['anytime'].
+    stop_check, should_stop, clock: see AnytimeMonitor.
     """
     
     try:
@@ -64,25 +227,50 @@ def solve_vrp_with_capacity(time_matrix, demands, vehicle_capacities,
         # --- 3. Create Routing Model ---
         routing = pywrapcp.RoutingModel(manager)
 
-        # --- 4. Create Callbacks ---
-        
-        # a) Time Callback (for travel time in MINUTES)
-        def time_callback(from_index, to_index):
-            from_node = manager.IndexToNode(from_index)
-            to_node = manager.IndexToNode(to_index)
-            # We add 1 minute service time for each stop (except depot)
-            service_time = 1 if from_node != 0 else 0
-            return int(data['time_matrix'][from_node][to_node]) + service_time
+        # --- 4. Create Transits ---
+        # The time matrix as given: batch_optimization_vrp has already folded
+        # the service time into it (hybrid_solver_layers.with_service_time),
+        # the same matrix L1 and ALNS time their routes with, so all three
+        # layers agree on which routes fit vehicle_max_durations_mins.
+        transit_rows = np.asarray(data['time_matrix'], dtype=np.int64).tolist()
+
+        if arc_cost_matrix is not None:
+            arc_cost_rows = np.asarray(arc_cost_matrix, dtype=np.int64).tolist()
+
+        if precomputed_transits:
+            # a) Time and b) demand as precomputed integer transits (evaluated in C++)
+            transit_callback_index = routing.RegisterTransitMatrix(transit_rows)
+            demand_callback_index = routing.RegisterUnaryTransitVector([int(d) for d in data['demands']])
+            if arc_cost_matrix is not None:
+                arc_cost_callback_index = routing.RegisterTransitMatrix(arc_cost_rows)
+        else:
+            # a) Time Callback (for travel time in MINUTES)
+            def time_callback(from_index, to_index):
+                from_node = manager.IndexToNode(from_index)
+                to_node = manager.IndexToNode(to_index)
+                return transit_rows[from_node][to_node]
+
+            transit_callback_index = routing.RegisterTransitCallback(time_callback)
 
-        transit_callback_index = routing.RegisterTransitCallback(time_callback)
-        routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+            # b) Demand Callback (for capacity)
+            def demand_callback(from_index):
+                from_node = manager.IndexToNode(from_index)
+                return data['demands'][from_node]
 
-        # b) Demand Callback (for capacity)
-        def demand_callback(from_index):
-            from_node = manager.IndexToNode(from_index)
-            return data['demands'][from_node]
+            demand_callback_index = routing.RegisterUnaryTransitCallback(demand_callback)
 
-        demand_callback_index = routing.RegisterUnaryTransitCallback(demand_callback)
+            if arc_cost_matrix is not None:
+                def arc_cost_callback(from_index, to_index):
+                    return arc_cost_rows[manager.IndexToNode(from_index)][manager.IndexToNode(to_index)]
+
+                arc_cost_callback_index = routing.RegisterTransitCallback(arc_cost_callback)
+
+        # c) Objective: travel time, or the fleet cost (fixed cost per vehicle used + arc costs)
+        if arc_cost_matrix is not None:
+            routing.SetArcCostEvaluatorOfAllVehicles(arc_cost_callback_index)
+            routing.SetFixedCostOfAllVehicles(int(vehicle_fixed_cost))
+        else:
+            routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
 
         # --- 5. Add Dimensions (Constraints) ---
         
@@ -106,16 +294,15 @@ def solve_vrp_with_capacity(time_matrix, demands, vehicle_capacities,
         )
         time_dimension = routing.GetDimensionOrDie(time_dimension_name)
         
-        # Add max duration constraint for each vehicle (in MINUTES)
+        # Max duration of each route (end - start, the start cumul is free)
         for i in range(data['num_vehicles']):
-            time_dimension.SetCumulVarSoftUpperBound(
-                routing.End(i), vehicle_max_durations_mins[i], 0 
-            )
+            time_dimension.SetSpanUpperBoundForVehicle(int(vehicle_max_durations_mins[i]), i)
 
         # --- 6. Set Penalties for Dropped Nodes ---
         # Allow nodes to be dropped
         for node in range(1, num_locations): # For all nodes except depot
-            routing.AddDisjunction([manager.NodeToIndex(node)], 1000000)
+            penalty = drop_penalties[node] if drop_penalties is not None else 1000000
+            routing.AddDisjunction([manager.NodeToIndex(node)], penalty)
 
         # --- 7. Set Search Parameters and Solve ---
         search_parameters = pywrapcp.DefaultRoutingSearchParameters()
@@ -125,10 +312,41 @@ def solve_vrp_with_capacity(time_matrix, demands, vehicle_capacities,
         search_parameters.local_search_metaheuristic = (
             routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
         )
-        # Give L2 a short time limit
-        search_parameters.time_limit.FromSeconds(3) 
+        # Size the L2 budget to the model and the time left in the cycle
+        time_limit_sec = set_search_limits(search_parameters, num_locations, deadline, deterministic, clock)
+        monitor = AnytimeMonitor(routing, yield_gil=precomputed_transits, manager=manager, stop_check=stop_check,
+                                 should_stop=should_stop, clock=clock)
+        routing.AddAtSolutionCallback(monitor)
 
-        solution = routing.SolveWithParameters(search_parameters)
+        initial_assignment = None
+        if initial_routes is not None:
+            # Warm start: the model must be closed before reading routes into it
+            routing.CloseModelWithParameters(search_parameters)
+            initial_assignment = routing.ReadAssignmentFromRoutes(
+                [[manager.NodeToIndex(node) for node in route] for route in initial_routes],
+                True # ignore inactive indices
+            )
+            if initial_assignment is None:
+                print("OR-Tools: Initial routes rejected, starting from scratch.")
+        if solver_stats is not None:
+            solver_stats['warm_start'] = initial_assignment is not None
+            solver_stats['initial_objective'] = (
+                initial_assignment.ObjectiveValue() if initial_assignment is not None else None
+            )
+
+        if initial_assignment is not None:
+            solution = routing.SolveFromAssignmentWithParameters(initial_assignment, search_parameters)
+        else:
+            solution = routing.SolveWithParameters(search_parameters)
+        print(f"OR-Tools: {monitor.summary()} (limit {time_limit_sec:.2f}s)")
+        if solver_stats is not None:
+            solver_stats['time_limit_sec'] = time_limit_sec
+            solver_stats['num_solutions'] = monitor.num_solutions
+            solver_stats['anytime'] = monitor.curve
+            solver_stats['branches'] = routing.solver().Branches()
+            solver_stats['failures'] = routing.solver().Failures()
+            solver_stats['wall_time_ms'] = routing.solver().WallTime()
+            solver_stats['objective'] = solution.ObjectiveValue() if solution else None
 
         # --- 8. Parse and Return the Solution ---
         solution_routes = []
@@ -297,8 +515,11 @@ def get_solution_for_restaurant(restaurant_name):
     search_parameters = pywrapcp.DefaultRoutingSearchParameters()
     search_parameters.first_solution_strategy = (routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
     search_parameters.local_search_metaheuristic = (routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH)
-    search_parameters.time_limit.FromSeconds(10)
+    set_search_limits(search_parameters, num_locations)
+    monitor = AnytimeMonitor(routing, yield_gil=False)
+    routing.AddAtSolutionCallback(monitor)
     solution = routing.SolveWithParameters(search_parameters)
+    print(f"OR-Tools: {monitor.summary()}")
     if solution:
         processed_solution = []
         for vehicle_id in range(num_vehicles):
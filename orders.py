@@ -0,0 +1,93 @@
+# --- Order Records ---
+# One immutable, slotted record per order, interned by ID in a registry, so
+# every layer shares the same object: no per-order dicts, hashing and
+# equality by ID, and `order in pending_orders` / `.remove()` hit the
+# identity fast path. Dict-style access (order['id']) is kept so the
+# solver layers and the report work unchanged.
+
+_ORDER_FIELDS = ('id', 'index', 'demand', 'arrival_minute')
+
+
+class Order:
+    """
+    Immutable order record.
+    Fields: id (original order ID), index (location index), demand,
+    arrival_minute, and key, a dense integer assigned by the registry
+    (0, 1, 2, ... in creation order; local to the process).
+    """
+    __slots__ = ('key',) + _ORDER_FIELDS
+
+    def __init__(self, key, order_id, index, demand, arrival_minute):
+        set_field = object.__setattr__
+        set_field(self, 'key', key)
+        set_field(self, 'id', order_id)
+        set_field(self, 'index', index)
+        set_field(self, 'demand', demand)
+        set_field(self, 'arrival_minute', arrival_minute)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Order is immutable (cannot set '{name}')")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Order is immutable (cannot delete '{name}')")
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if isinstance(other, Order):
+            return self.id == other.id
+        return NotImplemented
+
+    def __reduce__(self):
+        # Unpickling (e.g. in a worker process) goes through the registry there
+        return (make_order, (self.id, self.index, self.demand, self.arrival_minute))
+
+    def __repr__(self):
+        return (f"Order(id={self.id!r}, index={self.index}, demand={self.demand}, "
+                f"arrival_minute={self.arrival_minute})")
+
+    # --- Dict-style access, for code written against {'id', 'index', ...} ---
+    def __getitem__(self, name):
+        # Hot path of every solver layer: no field check, an unknown name raises AttributeError
+        return getattr(self, name)
+
+    def get(self, name, default=None):
+        return getattr(self, name) if name in _ORDER_FIELDS else default
+
+    def keys(self):
+        return _ORDER_FIELDS
+
+    def to_dict(self):
+        """Returns: a plain {'id', 'index', 'demand', 'arrival_minute'} dict."""
+        return {name: getattr(self, name) for name in _ORDER_FIELDS}
+
+
+_order_registry = {}
+
+
+def make_order(order_id, index, demand, arrival_minute=0):
+    """
+    Returns the registered Order with this ID, creating it on first use.
+    An ID that comes back with different data is a caller bug, reported
+    with ValueError instead of silently returning the old record.
+    """
+    order = _order_registry.get(order_id)
+    if order is None:
+        order = Order(len(_order_registry), order_id, index, demand, arrival_minute)
+        _order_registry[order_id] = order
+    elif (order.index, order.demand, order.arrival_minute) != (index, demand, arrival_minute):
+        raise ValueError(f"Order {order_id!r} is already registered with different data: {order!r}")
+    return order
+
+
+def get_order(order_id):
+    """Returns the registered Order with this ID, or None."""
+    return _order_registry.get(order_id)
+
+
+def clear_order_registry():
+    """Forgets every registered order (e.g. before simulating another day)."""
+    _order_registry.clear()
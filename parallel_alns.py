@@ -0,0 +1,579 @@
+import functools
+import os
+import queue
+import random
+import time
+import multiprocessing
+
+import hybrid_solver_layers as hsl
+from shared_matrices import SharedMatrix, attach_shared_matrix
+from solution_arrays import build_order_table, routes_to_giant_tour, giant_tour_to_routes
+
+# --- Multi-Start ALNS Parameters ---
+ALNS_MULTISTART_WORKERS = os.cpu_count() or 1 # Worker processes in the pool
+ALNS_MULTISTART_BASE_SEED = 42                 # Start k uses seed BASE_SEED + k
+# Operator settings cycled across the starts (empty dict = module defaults)
+ALNS_MULTISTART_PROFILES = [
+    {},
+    {'destroy_min_percent': 0.05, 'destroy_max_percent': 0.20},
+    {'destroy_min_percent': 0.30, 'destroy_max_percent': 0.60},
+    {'temp_start': 5000, 'cooling_rate': 0.998},
+]
+
+# --- Island Model Parameters ---
+ALNS_ISLAND_MIGRATION_INTERVAL = hsl.ALNS_MIGRATION_INTERVAL # Iterations between elite exchanges
+
+# --- Task Payloads ---
+# Routes and orders cross the process boundary as a giant tour over an
+# OrderTable (see solution_arrays), which pickles far smaller than nested
+# dicts. The main process decodes results with its own table, so callers
+# get their original order objects back.
+def _encode_input(current_routes, pending_orders):
+    """Returns the payload fields shared by every task of one call."""
+    table = build_order_table(current_routes, pending_orders)
+    tour, vehicle_ids = routes_to_giant_tour(current_routes, table)
+    return {'order_table': table, 'tour': tour, 'vehicle_ids': vehicle_ids,
+            'pending_keys': table.keys(pending_orders)}
+
+
+def _decode_input(task):
+    """Returns: (current_routes, pending_orders) of a task, inside the worker."""
+    table = task['order_table']
+    return (giant_tour_to_routes(task['tour'], task['vehicle_ids'], table),
+            table.order_list(task['pending_keys']))
+
+
+def _encode_solution(routes, unassigned, table):
+    tour, vehicle_ids = routes_to_giant_tour(routes, table)
+    return tour, vehicle_ids, table.keys(unassigned)
+
+
+def _decode_solution(result, table):
+    """Returns: (routes, unassigned) of a worker result, with the caller's order objects."""
+    return (giant_tour_to_routes(result['tour'], result['vehicle_ids'], table),
+            table.order_list(result['unassigned_keys']))
+
+
+# A task runs on a copy of the caller's WorkClock (see portfolio). The
+# worker records its new bests with the clock's units when asked to, and
+# the caller replays them: its on_new_best sees each best with its own
+# clock set to when it was found, as if the search had run in-process.
+def _best_recorder(task, bests):
+    """Returns: the on_new_best hook of a worker, or None if the task records no bests."""
+    if not task['record_bests']:
+        return None
+
+    def record_best(routes, unassigned, cost):
+        tour, vehicle_ids, unassigned_keys = _encode_solution(routes, unassigned, task['order_table'])
+        bests.append({'units': task['clock'].units if task['clock'] is not None else None,
+                      'tour': tour, 'vehicle_ids': vehicle_ids, 'unassigned_keys': unassigned_keys, 'cost': cost})
+    return record_best
+
+
+def _replay_bests(result, table, clock, on_new_best):
+    """Hands a task's recorded bests to on_new_best; clock ends where the worker's did."""
+    for best in result['bests']:
+        if clock is not None:
+            clock.units = best['units']
+        routes, unassigned = _decode_solution(best, table)
+        if on_new_best:
+            on_new_best(routes, unassigned, best['cost'])
+    if clock is not None:
+        clock.units = result['clock_units']
+
+
+# --- Worker Process State ---
+# Set once per worker by the pool initializer, so every task only ships the
+# (small) routes and orders, never the matrices.
+_worker_time_matrix = None
+_worker_distance_matrix = None
+_worker_shared_blocks = [] # Attached shared-memory blocks, kept alive with the worker
+
+
+def _matrix_init_arg(matrix):
+    # A SharedMatrix travels as its handle, anything else (nested lists) as is
+    if isinstance(matrix, SharedMatrix):
+        return ('shared', matrix.handle())
+    return ('value', matrix)
+
+
+def _attach_matrix(init_arg):
+    kind, value = init_arg
+    if kind == 'shared':
+        shm, rows = attach_shared_matrix(value)
+        _worker_shared_blocks.append(shm)
+        return rows
+    return value
+
+
+def _init_alns_worker(time_matrix_arg, distance_matrix_arg):
+    """Pool initializer: attaches (or keeps) the read-only matrices in the worker process."""
+    global _worker_time_matrix, _worker_distance_matrix
+    _worker_time_matrix = _attach_matrix(time_matrix_arg)
+    _worker_distance_matrix = _attach_matrix(distance_matrix_arg)
+
+
+def create_alns_pool(time_matrix, distance_matrix, num_workers=ALNS_MULTISTART_WORKERS):
+    """
+    Creates a persistent process pool for the optimizer searches. The
+    matrices are either nested lists, handed to each worker once at start-up
+    (inherited without a copy when the platform forks), or SharedMatrix
+    blocks, which the workers attach to and read in place. Reuse the pool
+    across optimizer cycles and close() it at the end of the simulation
+    (before closing any SharedMatrix).
+    """
+    return multiprocessing.Pool(
+        processes=num_workers,
+        initializer=_init_alns_worker,
+        initargs=(_matrix_init_arg(time_matrix), _matrix_init_arg(distance_matrix))
+    )
+
+
+def _detaches_cancel_token(worker):
+    """
+    Wraps a pool worker so the CancellationToken unpickled with its task
+    (a mapping of the race's shared block) is detached when the task ends,
+    instead of staying mapped in the long-lived worker process.
+    """
+    @functools.wraps(worker)
+    def run(task):
+        try:
+            return worker(task)
+        finally:
+            if task['cancel_token'] is not None:
+                task['cancel_token'].detach()
+    return run
+
+
+@_detaches_cancel_token
+def _alns_start_worker(task):
+    """
+    Runs one independent ALNS search inside a worker process.
+    The global random module is re-seeded with the task's seed, so a given
+    (seed, profile, input) always gives the same result when the search is
+    bounded by iterations rather than by a deadline.
+    """
+    random.seed(task['seed'])
+    start_time = time.time()
+    current_routes, pending_orders = _decode_input(task)
+    operator_stats = {}
+    bests = []
+    routes, unassigned = hsl.run_alns_optimization(
+        current_routes, pending_orders,
+        _worker_time_matrix, _worker_distance_matrix,
+        task['num_vehicles'], task['vehicle_capacity'], task['max_route_duration_mins'],
+        task['fixed_cost_per_truck'], task['variable_cost_per_km'],
+        alns_iterations=task['alns_iterations'], deadline=task['deadline'],
+        on_new_best=_best_recorder(task, bests),
+        operator_stats=operator_stats, alns_state=task['alns_state'], lower_bound=task['lower_bound'],
+        cancel_token=task['cancel_token'], clock=task['clock'], **task['profile']
+    )
+    cost, trucks, distance = hsl.calculate_total_fleet_cost(
+        routes, _worker_distance_matrix, task['fixed_cost_per_truck'], task['variable_cost_per_km']
+    )
+    tour, vehicle_ids, unassigned_keys = _encode_solution(routes, unassigned, task['order_table'])
+    return {
+        'seed': task['seed'],
+        'profile': task['profile'],
+        'tour': tour,
+        'vehicle_ids': vehicle_ids,
+        'unassigned_keys': unassigned_keys,
+        'num_unassigned': len(unassigned),
+        'cost': cost,
+        'objective': hsl.calculate_alns_objective(cost, unassigned, task['fixed_cost_per_truck']),
+        'alns_state': task['alns_state'],
+        'operator_stats': operator_stats,
+        'bests': bests,
+        'clock_units': task['clock'].units if task['clock'] is not None else None,
+        'runtime': time.time() - start_time
+    }
+
+
+def run_alns_multistart(pool, current_routes, pending_orders,
+                        num_vehicles, vehicle_capacity, max_route_duration_mins,
+                        fixed_cost_per_truck, variable_cost_per_km,
+                        num_starts=ALNS_MULTISTART_WORKERS, base_seed=ALNS_MULTISTART_BASE_SEED,
+                        alns_iterations=hsl.ALNS_ITERATIONS, deadline=None, alns_state=None,
+                        lower_bound=None, cancel_token=None, clock=None):
+    """
+    Launches num_starts independent ALNS searches on the pool, each with its
+    own seed (base_seed + k) and operator profile, and returns the best one.
+    Every start continues from alns_state (see run_alns_optimization) and
+    alns_state is replaced by the winner's state on return.
+    With a clock, every start runs on its own copy of it; the best start is
+    only known once the last one is done, so clock ends at the latest.
+    Returns: (best_routes, best_unassigned, start_results) where start_results
+    lists seed, profile, cost, objective and runtime of every start.
+    """
+    if alns_state is None:
+        alns_state = {}
+    payload = _encode_input(current_routes, pending_orders)
+    tasks = []
+    for k in range(num_starts):
+        tasks.append({
+            'seed': base_seed + k,
+            'profile': ALNS_MULTISTART_PROFILES[k % len(ALNS_MULTISTART_PROFILES)],
+            **payload,
+            'num_vehicles': num_vehicles,
+            'vehicle_capacity': vehicle_capacity,
+            'max_route_duration_mins': max_route_duration_mins,
+            'fixed_cost_per_truck': fixed_cost_per_truck,
+            'variable_cost_per_km': variable_cost_per_km,
+            'alns_iterations': alns_iterations,
+            'deadline': deadline,
+            'alns_state': alns_state,
+            'lower_bound': lower_bound,
+            'cancel_token': cancel_token,
+            'clock': clock,
+            'record_bests': False
+        })
+
+    results = pool.map(_alns_start_worker, tasks)
+    if clock is not None:
+        clock.units = max(r['clock_units'] for r in results)
+
+    # Lowest objective wins; ties go to the lowest seed so the result is reproducible
+    best = min(results, key=lambda r: (r['objective'], r['seed']))
+    alns_state.clear()
+    alns_state.update(best['alns_state'])
+    start_results = [
+        {key: r[key] for key in ('seed', 'profile', 'cost', 'objective', 'runtime')}
+        for r in results
+    ]
+    print(f"--- [LAYER 3 ALNS x{num_starts}] Best start: seed={best['seed']}, "
+          f"Cost={best['cost']:.2f}, Unassigned={best['num_unassigned']} ---")
+    best_routes, best_unassigned = _decode_solution(best, payload['order_table'])
+    return best_routes, best_unassigned, start_results
+
+
+# --- Island Model ---
+def _island_migrate(island_id, inbox, outbox, sent, table):
+    """
+    Builds the migrate() hook of one island (ring topology): the island's best
+    is sent to the next island whenever it improved since the last send, and
+    the best solution waiting in its own inbox is returned as the immigrant.
+    Queue operations never block, so a slow neighbour cannot stall the search.
+    """
+    def migrate(best_routes, best_unassigned, best_objective):
+        if best_objective < sent['objective']:
+            outbox.put((island_id, _encode_solution(best_routes, best_unassigned, table), best_objective))
+            sent['objective'] = best_objective
+
+        immigrant = None
+        while True:
+            try:
+                _, encoded, objective = inbox.get_nowait()
+            except queue.Empty:
+                break
+            if immigrant is None or objective < immigrant[1]:
+                immigrant = (encoded, objective)
+        if immigrant is None:
+            return None
+        sent['received'] += 1
+        (tour, vehicle_ids, unassigned_keys), objective = immigrant
+        return (giant_tour_to_routes(tour, vehicle_ids, table), table.order_list(unassigned_keys), objective)
+    return migrate
+
+
+@_detaches_cancel_token
+def _alns_island_worker(task):
+    """Runs one island inside a worker process and records its best-cost trajectory."""
+    random.seed(task['seed'])
+    start_time = time.time()
+    current_routes, pending_orders = _decode_input(task)
+    trajectory = []
+    sent = {'objective': float('inf'), 'received': 0}
+
+    def record_best(routes, unassigned, cost):
+        trajectory.append((time.time() - start_time, cost, len(unassigned)))
+
+    migrate = None
+    if task['num_islands'] > 1:
+        migrate = _island_migrate(task['island_id'], task['inboxes'][task['island_id']],
+                                  task['inboxes'][(task['island_id'] + 1) % task['num_islands']], sent,
+                                  task['order_table'])
+
+    routes, unassigned = hsl.run_alns_optimization(
+        current_routes, pending_orders,
+        _worker_time_matrix, _worker_distance_matrix,
+        task['num_vehicles'], task['vehicle_capacity'], task['max_route_duration_mins'],
+        task['fixed_cost_per_truck'], task['variable_cost_per_km'],
+        alns_iterations=task['alns_iterations'], deadline=task['deadline'],
+        on_new_best=record_best, migrate=migrate, migration_interval=task['migration_interval'],
+        alns_state=task['alns_state'], lower_bound=task['lower_bound'],
+        cancel_token=task['cancel_token'], clock=task['clock'], **task['profile']
+    )
+    cost, trucks, distance = hsl.calculate_total_fleet_cost(
+        routes, _worker_distance_matrix, task['fixed_cost_per_truck'], task['variable_cost_per_km']
+    )
+    tour, vehicle_ids, unassigned_keys = _encode_solution(routes, unassigned, task['order_table'])
+    return {
+        'seed': task['seed'],
+        'island_id': task['island_id'],
+        'tour': tour,
+        'vehicle_ids': vehicle_ids,
+        'unassigned_keys': unassigned_keys,
+        'num_unassigned': len(unassigned),
+        'cost': cost,
+        'objective': hsl.calculate_alns_objective(cost, unassigned, task['fixed_cost_per_truck']),
+        'alns_state': task['alns_state'],
+        'immigrants_received': sent['received'],
+        'trajectory': trajectory,
+        'clock_units': task['clock'].units if task['clock'] is not None else None,
+        'runtime': time.time() - start_time
+    }
+
+
+def run_alns_islands(pool, current_routes, pending_orders,
+                     num_vehicles, vehicle_capacity, max_route_duration_mins,
+                     fixed_cost_per_truck, variable_cost_per_km,
+                     num_islands=ALNS_MULTISTART_WORKERS, base_seed=ALNS_MULTISTART_BASE_SEED,
+                     alns_iterations=hsl.ALNS_ITERATIONS, deadline=None,
+                     migration_interval=ALNS_ISLAND_MIGRATION_INTERVAL, alns_state=None,
+                     lower_bound=None, cancel_token=None, clock=None):
+    """
+    Island-model ALNS: num_islands cooperating searches, one per pool worker,
+    each with its own seed and operator profile. Every migration_interval
+    iterations an island sends its best to its ring neighbour and adopts a
+    better incumbent from its own inbox. The pool should have at least
+    num_islands processes, otherwise islands run one after the other and
+    only see each other's results once they happen to overlap.
+    As in run_alns_multistart, alns_state is continued and replaced by the
+    state of the best island, and clock ends at the latest island's.
+    Returns: (best_routes, best_unassigned, island_results) where
+    island_results lists seed, cost, objective, immigrants_received,
+    trajectory [(elapsed_sec, cost, num_unassigned), ...] and runtime.
+    """
+    if alns_state is None:
+        alns_state = {}
+    # Manager queues are picklable, so they can travel with the pool tasks
+    with multiprocessing.Manager() as manager:
+        inboxes = [manager.Queue() for _ in range(num_islands)]
+        payload = _encode_input(current_routes, pending_orders)
+        tasks = []
+        for k in range(num_islands):
+            tasks.append({
+                'island_id': k,
+                'num_islands': num_islands,
+                'inboxes': inboxes,
+                'migration_interval': migration_interval,
+                'seed': base_seed + k,
+                'profile': ALNS_MULTISTART_PROFILES[k % len(ALNS_MULTISTART_PROFILES)],
+                **payload,
+                'num_vehicles': num_vehicles,
+                'vehicle_capacity': vehicle_capacity,
+                'max_route_duration_mins': max_route_duration_mins,
+                'fixed_cost_per_truck': fixed_cost_per_truck,
+                'variable_cost_per_km': variable_cost_per_km,
+                'alns_iterations': alns_iterations,
+                'deadline': deadline,
+                'alns_state': alns_state,
+                'lower_bound': lower_bound,
+                'cancel_token': cancel_token,
+                'clock': clock
+            })
+        # chunksize=1 so every island gets its own worker as soon as one is free
+        results = pool.map(_alns_island_worker, tasks, chunksize=1)
+    if clock is not None:
+        clock.units = max(r['clock_units'] for r in results)
+
+    best = min(results, key=lambda r: (r['objective'], r['island_id']))
+    alns_state.clear()
+    alns_state.update(best['alns_state'])
+    island_results = [
+        {key: r[key] for key in ('seed', 'cost', 'objective', 'immigrants_received', 'trajectory', 'runtime')}
+        for r in results
+    ]
+    print(f"--- [LAYER 3 ALNS x{num_islands} islands] Best island: {best['island_id']}, "
+          f"Cost={best['cost']:.2f}, Unassigned={best['num_unassigned']} ---")
+    best_routes, best_unassigned = _decode_solution(best, payload['order_table'])
+    return best_routes, best_unassigned, island_results
+
+
+# --- Process-Isolated Layer 2 / Layer 3 ---
+# One L2 solve or one ALNS search as a pool task, so the optimizer cycle
+# runs outside the simulator process: the calling thread only waits on the
+# result (without holding the GIL) and the L1 tick loop is never stalled.
+@_detaches_cancel_token
+def _l2_worker(task):
+    """Runs one Layer 2 (OR-Tools) solve inside a worker process."""
+    start_time = time.time()
+    current_routes, pending_orders = _decode_input(task)
+    solver_stats = {}
+    bests = []
+    routes, unassigned = hsl.batch_optimization_vrp(
+        current_routes, pending_orders, _worker_time_matrix,
+        task['num_vehicles'], task['vehicle_capacity'], task['max_route_duration_mins'],
+        warm_start=task['warm_start'], deadline=task['deadline'], solver_stats=solver_stats,
+        lower_bound=task['lower_bound'], distance_matrix=_worker_distance_matrix,
+        fixed_cost_per_truck=task['fixed_cost_per_truck'], variable_cost_per_km=task['variable_cost_per_km'],
+        cancel_token=task['cancel_token'], deterministic=task['deterministic'],
+        clock=task['clock'], on_new_best=_best_recorder(task, bests)
+    )
+    tour, vehicle_ids, unassigned_keys = _encode_solution(routes, unassigned, task['order_table'])
+    return {
+        'tour': tour,
+        'vehicle_ids': vehicle_ids,
+        'unassigned_keys': unassigned_keys,
+        'solver_stats': solver_stats,
+        'bests': bests,
+        'clock_units': task['clock'].units if task['clock'] is not None else None,
+        'runtime': time.time() - start_time
+    }
+
+
+def _l2_task(current_routes, pending_orders, num_vehicles, vehicle_capacity, max_route_duration_mins,
+             warm_start, deadline, lower_bound, fixed_cost_per_truck, variable_cost_per_km,
+             cancel_token, deterministic, clock=None, record_bests=False):
+    """Returns: (payload, task) of one _l2_worker solve."""
+    payload = _encode_input(current_routes, pending_orders)
+    return payload, {
+        **payload,
+        'num_vehicles': num_vehicles,
+        'vehicle_capacity': vehicle_capacity,
+        'max_route_duration_mins': max_route_duration_mins,
+        'warm_start': warm_start,
+        'deadline': deadline,
+        'lower_bound': lower_bound,
+        'fixed_cost_per_truck': fixed_cost_per_truck,
+        'variable_cost_per_km': variable_cost_per_km,
+        'cancel_token': cancel_token,
+        'deterministic': deterministic,
+        'clock': clock,
+        'record_bests': record_bests
+    }
+
+
+def run_l2_in_pool(pool, current_routes, pending_orders,
+                   num_vehicles, vehicle_capacity, max_route_duration_mins, deadline=None,
+                   lower_bound=None, fixed_cost_per_truck=None, variable_cost_per_km=None,
+                   cancel_token=None, deterministic=False, clock=None, on_new_best=None):
+    """
+    batch_optimization_vrp on a pool worker (lower_bound, cancel_token,
+    deterministic, clock, on_new_best: see there; on_new_best is called once
+    the task returns, see _replay_bests).
+    Returns: (routes, unassigned, solver_stats), with the caller's order objects.
+    """
+    payload, task = _l2_task(current_routes, pending_orders, num_vehicles, vehicle_capacity,
+                             max_route_duration_mins, hsl.L2_WARM_START, deadline, lower_bound,
+                             fixed_cost_per_truck, variable_cost_per_km, cancel_token, deterministic,
+                             clock=clock, record_bests=on_new_best is not None)
+    result = pool.apply(_l2_worker, (task,))
+    _replay_bests(result, payload['order_table'], clock, on_new_best)
+    routes, unassigned = _decode_solution(result, payload['order_table'])
+    return routes, unassigned, result['solver_stats']
+
+
+def run_l2_many_in_pool(pool, problems, vehicle_capacity, max_route_duration_mins,
+                        warm_start=hsl.L2_WARM_START, deadline=None,
+                        fixed_cost_per_truck=None, variable_cost_per_km=None, lower_bounds=None,
+                        cancel_token=None, deterministic=False):
+    """
+    Independent batch_optimization_vrp solves spread over the pool workers,
+    e.g. the clusters of a decomposed instance. problems is a list of
+    (current_routes, pending_orders, num_vehicles); lower_bounds, if given,
+    holds the lower bound of each problem (None for none).
+    Returns: one (routes, unassigned, solver_stats) per problem, in order.
+    """
+    if lower_bounds is None:
+        lower_bounds = [None] * len(problems)
+    payloads = []
+    tasks = []
+    for (current_routes, pending_orders, num_vehicles), lower_bound in zip(problems, lower_bounds):
+        payload, task = _l2_task(current_routes, pending_orders, num_vehicles, vehicle_capacity,
+                                 max_route_duration_mins, warm_start, deadline, lower_bound,
+                                 fixed_cost_per_truck, variable_cost_per_km, cancel_token, deterministic)
+        payloads.append(payload)
+        tasks.append(task)
+    results = pool.map(_l2_worker, tasks, chunksize=1)
+    solutions = []
+    for payload, result in zip(payloads, results):
+        routes, unassigned = _decode_solution(result, payload['order_table'])
+        solutions.append((routes, unassigned, result['solver_stats']))
+    return solutions
+
+
+def run_alns_in_pool(pool, current_routes, pending_orders,
+                     num_vehicles, vehicle_capacity, max_route_duration_mins,
+                     fixed_cost_per_truck, variable_cost_per_km,
+                     alns_iterations=hsl.ALNS_ITERATIONS, deadline=None, alns_state=None,
+                     lower_bound=None, cancel_token=None, seed=None, clock=None, on_new_best=None):
+    """
+    One run_alns_optimization (module defaults) on a pool worker, seeded
+    with seed (None: unseeded).
+    alns_state is continued and updated as with an in-process search, and
+    so are clock and on_new_best once the task returns (see _replay_bests).
+    Returns: (routes, unassigned, operator_stats), with the caller's order objects.
+    """
+    if alns_state is None:
+        alns_state = {}
+    payload = _encode_input(current_routes, pending_orders)
+    result = pool.apply(_alns_start_worker, ({
+        'seed': seed,
+        'profile': {},
+        **payload,
+        'num_vehicles': num_vehicles,
+        'vehicle_capacity': vehicle_capacity,
+        'max_route_duration_mins': max_route_duration_mins,
+        'fixed_cost_per_truck': fixed_cost_per_truck,
+        'variable_cost_per_km': variable_cost_per_km,
+        'alns_iterations': alns_iterations,
+        'deadline': deadline,
+        'alns_state': alns_state,
+        'lower_bound': lower_bound,
+        'cancel_token': cancel_token,
+        'clock': clock,
+        'record_bests': on_new_best is not None
+    },))
+    _replay_bests(result, payload['order_table'], clock, on_new_best)
+    alns_state.clear()
+    alns_state.update(result['alns_state'])
+    routes, unassigned = _decode_solution(result, payload['order_table'])
+    return routes, unassigned, result['operator_stats']
+
+
+def run_alns_many_in_pool(pool, problems, vehicle_capacity, max_route_duration_mins,
+                          fixed_cost_per_truck, variable_cost_per_km,
+                          alns_iterations=hsl.ALNS_ITERATIONS, deadline=None, alns_state=None,
+                          base_seed=None, clock=None):
+    """
+    Independent run_alns_optimization searches spread over the pool workers,
+    e.g. the clusters of a decomposed instance. problems is a list of
+    (current_routes, pending_orders, num_vehicles); problem k is seeded with
+    base_seed + k (None: unseeded) and continues from a copy of alns_state.
+    With a clock, every search runs on its own copy of it and clock ends at
+    the latest.
+    Returns: one (routes, unassigned, alns_state) per problem, in order.
+    """
+    if alns_state is None:
+        alns_state = {}
+    payloads = []
+    tasks = []
+    for k, (current_routes, pending_orders, num_vehicles) in enumerate(problems):
+        payload = _encode_input(current_routes, pending_orders)
+        payloads.append(payload)
+        tasks.append({
+            'seed': None if base_seed is None else base_seed + k,
+            'profile': {},
+            **payload,
+            'num_vehicles': num_vehicles,
+            'vehicle_capacity': vehicle_capacity,
+            'max_route_duration_mins': max_route_duration_mins,
+            'fixed_cost_per_truck': fixed_cost_per_truck,
+            'variable_cost_per_km': variable_cost_per_km,
+            'alns_iterations': alns_iterations,
+            'deadline': deadline,
+            'alns_state': alns_state,
+            'lower_bound': None,
+            'cancel_token': None,
+            'clock': clock,
+            'record_bests': False
+        })
+    results = pool.map(_alns_start_worker, tasks, chunksize=1)
+    if clock is not None:
+        clock.units = max(r['clock_units'] for r in results)
+    solutions = []
+    for payload, result in zip(payloads, results):
+        routes, unassigned = _decode_solution(result, payload['order_table'])
+        solutions.append((routes, unassigned, result['alns_state']))
+    return solutions
@@ -0,0 +1,183 @@
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+# --- Solver Portfolio ---
+# L2 and L3 race on the same cycle and share a CancellationToken holding
+# the best objective any of them has reported so far. Once a result clears
+# the acceptance threshold, or the deadline passes, the token is cancelled
+# and the other solvers stop cooperatively with their best-so-far: ALNS at
+# its next iteration, OR-Tools at its next solution (see AnytimeMonitor).
+# The token lives in a small shared-memory block, so it can travel with a
+# pool task and the solvers in worker processes see the same flag.
+#
+# On a simulated clock (see WorkClock) the race does not depend on timing:
+# each solver counts its own work, and an acceptance is published with the
+# simulated time it happened at. The cycle then takes every solver's best
+# at the earliest acceptance (or the deadline), see best_at.
+
+PORTFOLIO_ACCEPT_GAP = 0.01   # Accept a result at most this share above the cycle's lower bound
+PORTFOLIO_POLL_SECONDS = 0.01 # How often the race checks the token and the deadline
+
+# Slots of the shared block (one float64 each)
+_CANCELLED, _BEST_OBJECTIVE, _ACCEPT_OBJECTIVE, _ACCEPTED_AT = range(4)
+_NUM_SLOTS = 4
+_SLOT = struct.Struct('d')
+
+
+class WorkClock:
+    """
+    Simulated time of one solver: starts at start (seconds) and advances by
+    seconds_per_unit for every unit of work the solver ticks (an ALNS
+    iteration, an OR-Tools solution), however fast the machine is.
+    A pool task gets a copy; the pool helpers set units back on the
+    caller's clock once the task returns.
+    """
+
+    def __init__(self, start, seconds_per_unit):
+        self.start = start
+        self.seconds_per_unit = seconds_per_unit
+        self.units = 0
+
+    def tick(self, units=1):
+        self.units += units
+
+    def now(self):
+        return self.start + self.units * self.seconds_per_unit
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation shared by the solvers of one race.
+    report(objective) records a solver's new best and cancels the race once
+    it is at or below accept_objective (None: never accept early); solvers
+    poll cancelled() and return their best-so-far when it is set.
+    On a simulated clock, solvers pass their WorkClock time as at: an
+    acceptance then only publishes the earliest time it happened at
+    (accepted_at()), and cancelled(at) holds from that time on.
+    Picklable: a worker process gets a token attached to the same block,
+    which it releases with detach() once its task is done. The creating
+    process frees the block with close().
+    """
+
+    def __init__(self, accept_objective=None):
+        self._shm = shared_memory.SharedMemory(create=True, size=_NUM_SLOTS * _SLOT.size)
+        self._owner = True
+        self._set(_CANCELLED, 0.0)
+        self._set(_BEST_OBJECTIVE, float('inf'))
+        self._set(_ACCEPT_OBJECTIVE, float('-inf') if accept_objective is None else accept_objective)
+        self._set(_ACCEPTED_AT, float('inf'))
+
+    def __reduce__(self):
+        return (_attach_token, (self._shm.name,))
+
+    def _get(self, slot):
+        return _SLOT.unpack_from(self._shm.buf, slot * _SLOT.size)[0]
+
+    def _set(self, slot, value):
+        _SLOT.pack_into(self._shm.buf, slot * _SLOT.size, value)
+
+    def cancel(self):
+        self._set(_CANCELLED, 1.0)
+
+    def cancelled(self, at=None):
+        return self._get(_CANCELLED) != 0.0 or (at is not None and at >= self._get(_ACCEPTED_AT))
+
+    def best_objective(self):
+        return self._get(_BEST_OBJECTIVE)
+
+    def accepted_at(self):
+        return self._get(_ACCEPTED_AT)
+
+    def report(self, objective, at=None):
+        # Not atomic across processes: a lost update only delays the acceptance
+        # (and a lost accepted_at only lets a solver run on past it, see best_at)
+        if objective < self._get(_BEST_OBJECTIVE):
+            self._set(_BEST_OBJECTIVE, objective)
+        if objective <= self._get(_ACCEPT_OBJECTIVE):
+            if at is None:
+                self.cancel()
+            elif at < self._get(_ACCEPTED_AT):
+                self._set(_ACCEPTED_AT, at)
+
+    def close(self):
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def detach(self):
+        # For the copy a worker process unpickled: the owner's token stays open
+        if not self._owner:
+            self._shm.close()
+
+
+def _attach_token(name):
+    token = CancellationToken.__new__(CancellationToken)
+    token._shm = shared_memory.SharedMemory(name=name)
+    token._owner = False
+    return token
+
+
+def run_portfolio(solvers, token, deadline=None, grace_seconds=0.0, poll_interval=PORTFOLIO_POLL_SECONDS):
+    """
+    Races solvers ({name: callable}), each in its own thread; the callables
+    store their own results and should poll token (see CancellationToken).
+    Returns as soon as all of them have finished, or the token is cancelled
+    (a result was accepted, or deadline (time.time()) passed, which cancels
+    it), after giving the others up to grace_seconds to return their
+    best-so-far. The token is closed once the last solver has finished.
+    Returns: names of the solvers still running (their results are not awaited).
+    """
+    remaining = [len(solvers)]
+    remaining_lock = threading.Lock()
+
+    def run(solver):
+        try:
+            solver()
+        finally:
+            with remaining_lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    token.close()
+
+    threads = {name: threading.Thread(target=run, args=(solver,), name=f"portfolio-{name}", daemon=True)
+               for name, solver in solvers.items()}
+    for thread in threads.values():
+        thread.start()
+
+    while True:
+        with remaining_lock: # The token is closed once remaining reaches 0
+            if not remaining[0] or token.cancelled():
+                break
+            if deadline is not None and time.time() >= deadline:
+                token.cancel()
+                break
+        time.sleep(poll_interval)
+
+    wind_down = time.time() + grace_seconds
+    for thread in threads.values():
+        thread.join(timeout=max(0.0, wind_down - time.time()))
+    return [name for name, thread in threads.items() if thread.is_alive()]
+
+
+def best_at(trajectory, cut):
+    """
+    trajectory: a solver's new bests on a simulated clock, [(time,
+    objective, result), ...] in time order.
+    Returns: the result of the last best at or before cut (None if none).
+    A solver always runs until the published acceptance, which is never
+    earlier than the final cut, so this does not depend on timing.
+    """
+    result = None
+    for time_found, _, found in trajectory:
+        if time_found > cut:
+            break
+        result = found
+    return result
+
+
+def acceptance_time(trajectory, accept_objective):
+    """Returns: the time of the first best at or below accept_objective (inf if none)."""
+    return next((time_found for time_found, objective, _ in trajectory if objective <= accept_objective),
+                float('inf'))
@@ -0,0 +1,129 @@
+import math
+
+import hybrid_solver_layers as hsl
+
+# --- Rolling Horizon ---
+# Vehicles load every order at the depot, so once a vehicle has been
+# dispatched the orders on board are committed: nothing can be added to its
+# trip and none of its orders can move to another vehicle. Only those
+# orders (dispatched, or served already) are frozen; L1 and the L2/L3
+# cycles see the vehicles at the depot plus the pending orders, so the
+# active problem stays as large as the near-term workload instead of
+# everything assigned so far today.
+# A dispatched vehicle is back at the depot once its trip (travel plus
+# service time) is done. The trip is archived and the vehicle rejoins the
+# free fleet for another one. A truck's fixed cost is paid once a day
+# however many trips it makes, so new routes go to trucks that already
+# made a trip before fresh ones (see merge_active_solution), and the day's
+# cost counts every trip (see day_fleet_cost).
+# The runner dispatches right after each optimizer cycle, so a trip is
+# never committed before the optimizers have seen it.
+
+ROLLING_HORIZON_MAX_HOLD_MINUTES = 120    # Dispatch once the oldest order on board has waited this long
+ROLLING_HORIZON_DISPATCH_LOAD_FRACTION = 1.0 # ... or once the load reaches this share of the capacity
+
+
+def vehicles_to_dispatch(routes, dispatched, minute, vehicle_capacity,
+                         max_hold_minutes=ROLLING_HORIZON_MAX_HOLD_MINUTES,
+                         dispatch_load_fraction=ROLLING_HORIZON_DISPATCH_LOAD_FRACTION):
+    """
+    Returns: IDs of the vehicles (not yet in dispatched, with a non-empty
+    route) that leave the depot at this minute: the oldest order on board
+    arrived max_hold_minutes ago or more, or the vehicle is loaded to
+    dispatch_load_fraction of its capacity.
+    """
+    leaving = []
+    for v_id, route in routes.items():
+        if v_id in dispatched or not route:
+            continue
+        oldest_arrival = min(order['arrival_minute'] for order in route)
+        load = sum(order['demand'] for order in route)
+        if minute - oldest_arrival >= max_hold_minutes or load >= vehicle_capacity * dispatch_load_fraction:
+            leaving.append(v_id)
+    return leaving
+
+
+def free_fleet(routes, dispatched, used_vehicles=()):
+    """
+    Returns: the routes of the vehicles at the depot (not in dispatched),
+    those of used_vehicles first, so that L1 opens a new route on a truck
+    that already made a trip today before a fresh one.
+    """
+    free_ids = [v_id for v_id in routes if v_id not in dispatched]
+    free_ids.sort(key=lambda v_id: v_id not in used_vehicles)
+    return {v_id: routes[v_id] for v_id in free_ids}
+
+
+def active_subproblem(routes, dispatched):
+    """
+    The part of the fleet the optimizers may change, renumbered 0..k-1
+    (batch_optimization_vrp and ALNS expect consecutive vehicle IDs).
+    Returns: (active_routes, active_vehicle_ids) where active_routes[k] is
+    the route of vehicle active_vehicle_ids[k].
+    """
+    active_vehicle_ids = [v_id for v_id in routes if v_id not in dispatched]
+    active_routes = {k: list(routes[v_id]) for k, v_id in enumerate(active_vehicle_ids)}
+    return active_routes, active_vehicle_ids
+
+
+def trip_return_minute(route, minute, time_matrix):
+    """
+    Returns: the minute a vehicle leaving the depot at minute with route is
+    back, after driving it and serving every stop (SERVICE_TIME_PER_STOP).
+    """
+    return minute + math.ceil(hsl.calculate_route_cost(route, hsl.with_service_time(time_matrix)))
+
+
+def merge_active_solution(routes, dispatched, active_vehicle_ids, active_routes, unassigned, used_vehicles=()):
+    """
+    Writes an optimized active sub-problem back into the full fleet state.
+    Vehicles dispatched while the optimizer ran keep their committed route
+    (the optimizer's route for them is dropped), and orders on a committed
+    route are removed from every other route and from the unassigned list.
+    The vehicles at the depot are interchangeable, so a route the optimizer
+    put on a truck that has not made a trip today moves to an idle truck of
+    used_vehicles (which did: its fixed cost is paid already).
+    Returns: (routes, pending_orders)
+    """
+    committed_ids = {order['id'] for v_id in dispatched for order in routes.get(v_id, [])}
+    merged = dict(routes)
+    for local_id, v_id in enumerate(active_vehicle_ids):
+        if v_id in dispatched:
+            continue
+        merged[v_id] = [order for order in active_routes.get(local_id, []) if order['id'] not in committed_ids]
+    free_ids = [v_id for v_id in active_vehicle_ids if v_id not in dispatched]
+    idle_used_ids = [v_id for v_id in free_ids if v_id in used_vehicles and not merged[v_id]]
+    for v_id in free_ids:
+        if idle_used_ids and v_id not in used_vehicles and merged[v_id]:
+            merged[idle_used_ids.pop(0)], merged[v_id] = merged[v_id], []
+    pending = [order for order in unassigned if order['id'] not in committed_ids]
+
+    # An order of a vehicle dispatched mid-cycle that the optimizer dropped
+    # from that vehicle's route is neither committed nor placed elsewhere
+    placed_ids = committed_ids | {order['id'] for route in merged.values() for order in route}
+    pending_ids = {order['id'] for order in pending}
+    for local_id, v_id in enumerate(active_vehicle_ids):
+        if v_id not in dispatched:
+            continue
+        for order in active_routes.get(local_id, []):
+            if order['id'] not in placed_ids and order['id'] not in pending_ids:
+                pending.append(order)
+                pending_ids.add(order['id'])
+    return merged, pending
+
+
+def day_fleet_cost(routes, completed_trips, distance_matrix, fixed_cost_per_truck, variable_cost_per_km):
+    """
+    Fleet cost of the day like calculate_total_fleet_cost, over the current
+    routes and the completed trips [(vehicle_id, route), ...]: every truck
+    that made a trip counts once, and every trip's distance counts.
+    Returns: (total_cost, num_trucks_used, total_distance)
+    """
+    _, _, distance = hsl.calculate_total_fleet_cost(routes, distance_matrix, fixed_cost_per_truck, variable_cost_per_km)
+    for v_id, route in completed_trips:
+        _, _, trip_distance = hsl.calculate_total_fleet_cost(
+            {v_id: route}, distance_matrix, fixed_cost_per_truck, variable_cost_per_km
+        )
+        distance += trip_distance
+    trucks = len({v_id for v_id, route in routes.items() if route} | {v_id for v_id, _ in completed_trips})
+    return fixed_cost_per_truck * trucks + variable_cost_per_km * distance, trucks, distance
@@ -1,7 +1,9 @@
 import time
+import math
+import heapq
 import random
+import itertools
 import json
-import threading
 import pandas as pd
 from datetime import datetime, timedelta
 from hybrid_solver_layers import (
@@ -9,10 +11,19 @@ from hybrid_solver_layers import (
     calculate_route_cost, 
     batch_optimization_vrp,
     calculate_total_fleet_cost,
-    run_alns_optimization
+    calculate_alns_objective,
+    run_alns_optimization,
+    route_cost_cache_stats
 )
-
-random.seed(42)
+from orders import make_order, clear_order_registry
+from parallel_alns import create_alns_pool, run_alns_multistart, run_alns_islands, run_l2_in_pool, run_alns_in_pool
+from lower_bounds import objective_lower_bound, optimality_gap
+from portfolio import (PORTFOLIO_ACCEPT_GAP, CancellationToken, WorkClock, acceptance_time, best_at,
+                       run_portfolio)
+from shared_matrices import SharedMatrix
+from decomposition import DECOMPOSITION_MIN_ORDERS, decomposed_alns_optimization, decomposed_optimization_vrp
+from rolling_horizon import (vehicles_to_dispatch, free_fleet, active_subproblem, trip_return_minute,
+                             merge_active_solution, day_fleet_cost)
 
 # --- Configuration ---
 SIMULATION_START_HOUR = 9
@@ -27,7 +38,16 @@ PREPROCESSED_ORDER_FILE = 'preprocessed_orders.csv'
 # SIMULATION_DAY_OF_YEAR = 254
 SIMULATION_DAY_OF_YEAR = 358
 
-LAYER_2_INTERVAL_SECONDS = 60
+OPTIMIZER_INTERVAL_MINUTES = 30   # Simulated minutes between two L2/L3 optimizer cycles
+OPTIMIZER_CYCLE_SECONDS = 60      # Simulated solver time of one cycle (the old wall-clock L2 interval)
+LAYER_3_BUDGET_FRACTION = 0.8     # Share of the cycle the race may use: both layers stop at this deadline
+L2_SECONDS_PER_SOLUTION = 0.0075  # Simulated time one OR-Tools solution costs (measured in the racing cycle)
+L3_SECONDS_PER_ITERATION = 0.0015 # Simulated time one ALNS iteration costs (measured in the racing cycle)
+SIMULATION_RANDOM_SEED = 42       # Seeds L1 and the L3 searches: the same day always gives the same result
+LAYER_3_NUM_PROCESSES = 1         # >1 runs that many seeded ALNS starts on a process pool (multi-start)
+LAYER_3_ISLAND_MODEL = False      # With a pool: let the starts exchange elites (island model) instead of running independently
+OPTIMIZER_PROCESS_ISOLATION = True # Run L2 and L3 in pool processes (matrices in shared memory), off the simulator's GIL
+ROLLING_HORIZON_ENABLED = True    # Dispatch vehicles during the day; they come back for more trips (see rolling_horizon.py)
 OUTPUT_HTML_FILE = 'outputs/hybrid_simulation_live_capacity.html'
 
 FIXED_COST_PER_TRUCK = 5000
@@ -39,11 +59,14 @@ distance_matrix = []
 # --- Shared State ---
 current_routes = {}
 pending_orders = []
-state_lock = threading.Lock()
-simulation_running = True
 simulation_events = []
 all_locations = []
 time_matrix = []
+alns_pool = None  # Process pool for the optimizers (OPTIMIZER_PROCESS_ISOLATION or LAYER_3_NUM_PROCESSES > 1)
+shared_matrices = []  # SharedMatrix blocks the pool workers read the matrices from
+alns_state = {}   # ALNS weights, temperature and elite pool carried from cycle to cycle
+dispatched_vehicles = set()  # Vehicles that left the depot: their routes are committed
+completed_trips = []  # (vehicle_id, route) of every trip a vehicle came back from
 global_order_assignments_log = []
 simulation_start_time = None
 
@@ -51,6 +74,7 @@ simulation_start_time = None
 optimization_performance_log = []  # Track each optimization cycle performance
 vehicle_utilization_history = []  # Track vehicle usage over time
 order_wait_times = {}  # Track how long orders waited before assignment
+l1_latencies_ms = []  # Wall-clock time of every L1 assignment call
 
 # --- HTML Generation Functions ---
 def format_time(minutes_from_start):
@@ -104,16 +128,15 @@ def generate_html_report():
     
     map_routes = []
     try:
-        with state_lock:
-            for v_id in sorted(current_routes.keys()):
-                route_orders = current_routes[v_id]
-                if route_orders:
-                    coords = generate_route_coordinates(route_orders, all_locations)
-                    map_routes.append({
-                        'vehicle_id': v_id,
-                        'coordinates': coords,
-                        'color': ['#667eea', '#28a745', '#ffc107', '#dc3545'][v_id % 4]
-                    })
+        # Trips already driven, then the routes of the final state
+        for v_id, route_orders in completed_trips + sorted(current_routes.items()):
+            if route_orders:
+                coords = generate_route_coordinates(route_orders, all_locations)
+                map_routes.append({
+                    'vehicle_id': v_id,
+                    'coordinates': coords,
+                    'color': ['#667eea', '#28a745', '#ffc107', '#dc3545'][v_id % 4]
+                })
     except Exception as e:
         print(f"Warning: Could not generate map routes: {e}")
         map_routes = []
@@ -135,17 +158,16 @@ def generate_html_report():
     # Calculate success rate
     success_rate = (assigned_orders / total_orders * 100) if total_orders > 0 else 0
     
-    with state_lock:
-        active_vehicles = len([r for r in current_routes.values() if r])
-        avg_duration = 0
-        if active_vehicles > 0:
-            total_duration = sum([calculate_route_cost(r, time_matrix) for r in current_routes.values() if r])
-            avg_duration = int(total_duration / active_vehicles) if total_duration > 0 else 0
-        
-        # NEW: Calculate utilization metrics
-        total_capacity_used = sum([sum(order['demand'] for order in route) for route in current_routes.values() if route])
-        total_capacity_available = NUM_VEHICLES * VEHICLE_CAPACITY
-        fleet_utilization = (total_capacity_used / total_capacity_available * 100) if total_capacity_available > 0 else 0
+    active_vehicles = len([r for r in current_routes.values() if r])
+    avg_duration = 0
+    if active_vehicles > 0:
+        total_duration = sum([calculate_route_cost(r, time_matrix) for r in current_routes.values() if r])
+        avg_duration = int(total_duration / active_vehicles) if total_duration > 0 else 0
+    
+    # NEW: Calculate utilization metrics
+    total_capacity_used = sum([sum(order['demand'] for order in route) for route in current_routes.values() if route])
+    total_capacity_available = NUM_VEHICLES * VEHICLE_CAPACITY
+    fleet_utilization = (total_capacity_used / total_capacity_available * 100) if total_capacity_available > 0 else 0
     
     html_template = """
 <!DOCTYPE html>
@@ -1093,51 +1115,50 @@ def generate_html_report():
         pending_section = pending_html
     
     vehicle_cards_html = ""
-    with state_lock:
-        for v_id in sorted(current_routes.keys()):
-            route_orders = current_routes[v_id]
-            if route_orders:
-                route_cost = calculate_route_cost(route_orders, time_matrix)
-                total_demand = sum(order['demand'] for order in route_orders)
-                unique_stops = list(dict.fromkeys([order['index'] for order in route_orders]))
-                
-                stops_html = ""
-                for stop_num, stop_index in enumerate(unique_stops, 1):
-                    loc_name = all_locations[stop_index]['original_address'].split(',')[0]
-                    stops_html += f"""
-                    <div class="route-stop" 
-                         onclick="highlightStop(this, {v_id}, {stop_num})">
-                        {stop_num}. {loc_name}
-                    </div>
-                    """
-                
-                vehicle_cards_html += f"""
-                <div class="vehicle-card">
-                    <div class="vehicle-header">Vehicle {v_id}</div>
-                    {stops_html}
-                    <div class="route-metrics">
-                        <div class="metric">
-                            <div class="metric-value">{len(unique_stops)}</div>
-                            <div class="metric-label">Stops</div>
-                        </div>
-                        <div class="metric">
-                            <div class="metric-value">{total_demand} / {VEHICLE_CAPACITY}</div>
-                            <div class="metric-label">Capacity</div>
-                        </div>
-                        <div class="metric">
-                            <div class="metric-value">{route_cost:.0f}</div>
-                            <div class="metric-label">Minutes</div>
-                        </div>
-                    </div>
+    for v_id in sorted(current_routes.keys()):
+        route_orders = current_routes[v_id]
+        if route_orders:
+            route_cost = calculate_route_cost(route_orders, time_matrix)
+            total_demand = sum(order['demand'] for order in route_orders)
+            unique_stops = list(dict.fromkeys([order['index'] for order in route_orders]))
+            
+            stops_html = ""
+            for stop_num, stop_index in enumerate(unique_stops, 1):
+                loc_name = all_locations[stop_index]['original_address'].split(',')[0]
+                stops_html += f"""
+                <div class="route-stop" 
+                     onclick="highlightStop(this, {v_id}, {stop_num})">
+                    {stop_num}. {loc_name}
                 </div>
                 """
-            else:
-                vehicle_cards_html += f"""
-                <div class="vehicle-card">
-                    <div class="vehicle-header">Vehicle {v_id}</div>
-                    <p style="text-align: center; opacity: 0.7; padding: 20px;">No route assigned</p>
+            
+            vehicle_cards_html += f"""
+            <div class="vehicle-card">
+                <div class="vehicle-header">Vehicle {v_id}</div>
+                {stops_html}
+                <div class="route-metrics">
+                    <div class="metric">
+                        <div class="metric-value">{len(unique_stops)}</div>
+                        <div class="metric-label">Stops</div>
+                    </div>
+                    <div class="metric">
+                        <div class="metric-value">{total_demand} / {VEHICLE_CAPACITY}</div>
+                        <div class="metric-label">Capacity</div>
+                    </div>
+                    <div class="metric">
+                        <div class="metric-value">{route_cost:.0f}</div>
+                        <div class="metric-label">Minutes</div>
+                    </div>
                 </div>
-                """
+            </div>
+            """
+        else:
+            vehicle_cards_html += f"""
+            <div class="vehicle-card">
+                <div class="vehicle-header">Vehicle {v_id}</div>
+                <p style="text-align: center; opacity: 0.7; padding: 20px;">No route assigned</p>
+            </div>
+            """
     
     timeline_html = ""
     for event in simulation_events:
@@ -1244,34 +1265,33 @@ def generate_analytics_section():
     heatmap_html = "<div class='chart-container'><div class='chart-title'>📊 Vehicle Capacity Utilization Heatmap</div>"
     heatmap_html += "<div class='heatmap-container'>"
     
-    with state_lock:
-        for v_id in sorted(current_routes.keys()):
-            route_orders = current_routes[v_id]
-            if route_orders:
-                total_demand = sum(order['demand'] for order in route_orders)
-                utilization_pct = (total_demand / VEHICLE_CAPACITY) * 100
-                
-                # Color based on utilization
-                if utilization_pct >= 80:
-                    color = '#f87171'  # Red - high utilization
-                elif utilization_pct >= 50:
-                    color = '#fbbf24'  # Yellow - medium
-                else:
-                    color = '#4ade80'  # Green - low
-                
-                heatmap_html += f"""
-                <div class="heatmap-cell" style="background: {color};" 
-                     title="Vehicle {v_id}: {utilization_pct:.1f}% utilized ({total_demand}/{VEHICLE_CAPACITY})">
-                    V{v_id}<br>{utilization_pct:.0f}%
-                </div>
-                """
+    for v_id in sorted(current_routes.keys()):
+        route_orders = current_routes[v_id]
+        if route_orders:
+            total_demand = sum(order['demand'] for order in route_orders)
+            utilization_pct = (total_demand / VEHICLE_CAPACITY) * 100
+            
+            # Color based on utilization
+            if utilization_pct >= 80:
+                color = '#f87171'  # Red - high utilization
+            elif utilization_pct >= 50:
+                color = '#fbbf24'  # Yellow - medium
             else:
-                heatmap_html += f"""
-                <div class="heatmap-cell" style="background: #94a3b8;"
-                     title="Vehicle {v_id}: Unused">
-                    V{v_id}<br>0%
-                </div>
-                """
+                color = '#4ade80'  # Green - low
+            
+            heatmap_html += f"""
+            <div class="heatmap-cell" style="background: {color};" 
+                 title="Vehicle {v_id}: {utilization_pct:.1f}% utilized ({total_demand}/{VEHICLE_CAPACITY})">
+                V{v_id}<br>{utilization_pct:.0f}%
+            </div>
+            """
+        else:
+            heatmap_html += f"""
+            <div class="heatmap-cell" style="background: #94a3b8;"
+                 title="Vehicle {v_id}: Unused">
+                V{v_id}<br>0%
+            </div>
+            """
     
     heatmap_html += "</div>"
     heatmap_html += """
@@ -1286,7 +1306,7 @@ def generate_analytics_section():
     if optimization_performance_log:
         comparison_html = "<div class='chart-container'><div class='chart-title'>⚡ Optimization Layer Comparison</div>"
         comparison_html += "<table class='comparison-table'><thead><tr>"
-        comparison_html += "<th>Cycle #</th><th>Time</th><th>Layer 2 (OR-Tools)</th><th>Layer 3 (ALNS)</th><th>Winner</th><th>Improvement</th>"
+        comparison_html += "<th>Cycle #</th><th>Time</th><th>Layer 2 (OR-Tools)</th><th>Layer 3 (ALNS)</th><th>Winner</th><th>Improvement</th><th>Gap to Bound (L2 / L3)</th>"
         comparison_html += "</tr></thead><tbody>"
         
         for idx, log_entry in enumerate(optimization_performance_log[:10], 1):  # Show last 10
@@ -1295,7 +1315,8 @@ def generate_analytics_section():
             comparison_html += f"<td>{log_entry['l2_cost']:.2f}</td>"
             comparison_html += f"<td>{log_entry['l3_cost']:.2f}</td>"
             comparison_html += f"<td>{log_entry['winner']} <span class='winner-badge'>✓</span></td>"
-            comparison_html += f"<td>{log_entry['improvement']:.1f}%</td></tr>"
+            comparison_html += f"<td>{log_entry['improvement']:.1f}%</td>"
+            comparison_html += f"<td>{log_entry['l2_gap']:.1%} / {log_entry['l3_gap']:.1%}</td></tr>"
         
         comparison_html += "</tbody></table></div>"
     else:
@@ -1306,344 +1327,671 @@ def generate_analytics_section():
     insights_html += "<ul style='line-height: 2; font-size: 1.05em;'>"
     
     # Calculate insights
-    with state_lock:
-        used_vehicles = len([r for r in current_routes.values() if r])
-        unused_vehicles = NUM_VEHICLES - used_vehicles
-        
-        if unused_vehicles > 0:
-            insights_html += f"<li>🚚 <strong>{unused_vehicles} vehicles</strong> remained unused - potential for fleet optimization</li>"
-        
-        overutilized = sum(1 for route in current_routes.values() if route and sum(o['demand'] for o in route) > VEHICLE_CAPACITY * 0.9)
-        if overutilized > 0:
-            insights_html += f"<li>⚠️ <strong>{overutilized} vehicles</strong> are operating near capacity (>90%) - consider load balancing</li>"
-        
-        underutilized = sum(1 for route in current_routes.values() if route and sum(o['demand'] for o in route) < VEHICLE_CAPACITY * 0.5)
-        if underutilized > 0:
-            insights_html += f"<li>📉 <strong>{underutilized} vehicles</strong> are underutilized (<50%) - consolidation opportunity</li>"
-        
-        if pending_orders:
-            insights_html += f"<li>❌ <strong>{len(pending_orders)} orders</strong> could not be fulfilled - consider expanding fleet or capacity</li>"
-        else:
-            insights_html += "<li>✅ <strong>All orders</strong> successfully assigned to the standard fleet</li>"
-        
-        total_assignments = len(global_order_assignments_log)
-        l1_assignments = len([log for log in global_order_assignments_log if log['method'] in ['greedy_insert', 'cheapest_insert']])
-        if total_assignments > 0:
-            l1_percentage = (l1_assignments / total_assignments) * 100
-            insights_html += f"<li>⚡ <strong>{l1_percentage:.1f}%</strong> of orders assigned in real-time (Layer 1) - excellent responsiveness</li>"
+    used_vehicles = len([r for r in current_routes.values() if r])
+    unused_vehicles = NUM_VEHICLES - used_vehicles
+    
+    if unused_vehicles > 0:
+        insights_html += f"<li>🚚 <strong>{unused_vehicles} vehicles</strong> remained unused - potential for fleet optimization</li>"
+    
+    overutilized = sum(1 for route in current_routes.values() if route and sum(o['demand'] for o in route) > VEHICLE_CAPACITY * 0.9)
+    if overutilized > 0:
+        insights_html += f"<li>⚠️ <strong>{overutilized} vehicles</strong> are operating near capacity (>90%) - consider load balancing</li>"
+    
+    underutilized = sum(1 for route in current_routes.values() if route and sum(o['demand'] for o in route) < VEHICLE_CAPACITY * 0.5)
+    if underutilized > 0:
+        insights_html += f"<li>📉 <strong>{underutilized} vehicles</strong> are underutilized (<50%) - consolidation opportunity</li>"
+    
+    if pending_orders:
+        insights_html += f"<li>❌ <strong>{len(pending_orders)} orders</strong> could not be fulfilled - consider expanding fleet or capacity</li>"
+    else:
+        insights_html += "<li>✅ <strong>All orders</strong> successfully assigned to the standard fleet</li>"
+    
+    total_assignments = len(global_order_assignments_log)
+    l1_assignments = len([log for log in global_order_assignments_log if log['method'] in ['greedy_insert', 'cheapest_insert']])
+    if total_assignments > 0:
+        l1_percentage = (l1_assignments / total_assignments) * 100
+        insights_html += f"<li>⚡ <strong>{l1_percentage:.1f}%</strong> of orders assigned in real-time (Layer 1) - excellent responsiveness</li>"
     
     insights_html += "</ul></div>"
     
     return heatmap_html + comparison_html + insights_html
 
-def parallel_optimization_worker():
-    """Background thread to run Layer 2 (OR-Tools) and Layer 3 (ALNS) in parallel"""
+def run_optimization_cycle(minute, cycle):
+    """
+    One Layer 2 (OR-Tools) / Layer 3 (ALNS) optimizer cycle at simulated
+    minute (cycle counts the cycles of the day). Optimizes the vehicles still
+    at the depot and the pending orders; the better of the two results
+    replaces their routes at the same minute.
+    The two layers race on simulated time: each has a WorkClock started at
+    the cycle's minute that its work advances (L2_SECONDS_PER_SOLUTION,
+    L3_SECONDS_PER_ITERATION). Both stop at the deadline,
+    LAYER_3_BUDGET_FRACTION of OPTIMIZER_CYCLE_SECONDS in, which also sizes
+    the L2 limits, or once either has a result at most
+    PORTFOLIO_ACCEPT_GAP above the lower bound. Each layer's anytime hook
+    records its new bests, and the cycle compares the bests the layers had
+    at the earliest acceptance (or the deadline). A cycle thus gives the
+    same result on any machine.
+    """
     global current_routes, simulation_events, pending_orders, global_order_assignments_log, optimization_performance_log
-    
-    while simulation_running:
-        time.sleep(LAYER_2_INTERVAL_SECONDS)
-        
-        with state_lock:
-            routes_to_optimize = {vid: r[:] for vid, r in current_routes.items()}
-            pending_to_optimize = pending_orders[:]
-        
-        if not any(routes_to_optimize.values()) and not pending_to_optimize:
-            continue
 
-        print(f"\n{'='*10} [OPTIMIZER WORKER @ {datetime.now().strftime('%I:%M:%S %p')}] Starting Parallel Optimization {'='*10}")
-        print(f"Optimizing {sum(len(r) for r in routes_to_optimize.values())} assigned orders and {len(pending_to_optimize)} pending orders.")
+    # Only vehicles still at the depot (renumbered 0..k-1) and the pending orders
+    routes_to_optimize, active_vehicle_ids = active_subproblem(current_routes, dispatched_vehicles)
+    pending_to_optimize = pending_orders[:]
+    num_active_vehicles = len(active_vehicle_ids)
 
-        l2_results = {}
-        l3_results = {}
-        
-        def run_layer2():
-            print("--- [LAYER 2 OR-Tools] Starting optimization... ---")
-            start_time = time.time()
-            try:
+    if not num_active_vehicles or (not any(routes_to_optimize.values()) and not pending_to_optimize):
+        return
+
+    log_time = format_time(minute - SIMULATION_START_HOUR * 60)
+    print(f"\n{'='*10} [OPTIMIZER CYCLE {cycle} @ {log_time}] Starting Parallel Optimization {'='*10}")
+    print(f"Optimizing {sum(len(r) for r in routes_to_optimize.values())} assigned orders on {num_active_vehicles} vehicles at the depot and {len(pending_to_optimize)} pending orders.")
+
+    l2_results = {}
+    l3_results = {}
+    cycle_start = time.time()
+    race_start = minute * 60  # Simulated seconds of the day
+    deadline = race_start + OPTIMIZER_CYCLE_SECONDS * LAYER_3_BUDGET_FRACTION
+    l2_clock = WorkClock(race_start, L2_SECONDS_PER_SOLUTION)
+    l3_clock = WorkClock(race_start, L3_SECONDS_PER_ITERATION)
+    # New bests of each layer: [(simulated time, objective, (routes, unassigned)), ...]
+    l2_trajectory = []
+    l3_trajectory = []
+
+    def record_best(trajectory, clock):
+        def on_new_best(routes, unassigned, cost):
+            trajectory.append((clock.now(), calculate_alns_objective(cost, unassigned, FIXED_COST_PER_TRUCK),
+                               (routes, unassigned)))
+        return on_new_best
+
+    def record_result(trajectory, found_at, routes, unassigned):
+        # For solves without an anytime hook: their result counts as found at found_at
+        cost, _, _ = calculate_total_fleet_cost(routes, distance_matrix, FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM)
+        trajectory.append((found_at, calculate_alns_objective(cost, unassigned, FIXED_COST_PER_TRUCK),
+                           (routes, unassigned)))
+
+    # Bound on the best achievable objective: both layers stop once they are close enough to it
+    bound = objective_lower_bound(
+        [order for route in routes_to_optimize.values() for order in route] + pending_to_optimize,
+        distance_matrix, num_active_vehicles, VEHICLE_CAPACITY, FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM
+    )
+    lower_bound = bound['objective']
+    print(f"Lower bound: {lower_bound:.2f} (at least {bound['trucks']} trucks, {bound['forced_unassigned']} orders unassignable)")
+    accept_objective = lower_bound * (1 + PORTFOLIO_ACCEPT_GAP)
+    cancel_token = CancellationToken(accept_objective=accept_objective)
+    l3_seed = SIMULATION_RANDOM_SEED + cycle * LAYER_3_NUM_PROCESSES
+    # The search state L3 carries to the next cycle, in case it ran past the cut (see below)
+    alns_state_before = dict(alns_state)
+
+    def run_layer2():
+        print("--- [LAYER 2 OR-Tools] Starting optimization... ---")
+        start_time = time.time()
+        solver_stats = {}
+        l2_results['solver_stats'] = solver_stats
+        num_orders = sum(len(r) for r in routes_to_optimize.values()) + len(pending_to_optimize)
+        try:
+            if num_orders >= DECOMPOSITION_MIN_ORDERS:
+                # Too large for one solve per cycle: cluster first, route second.
+                # The clusters are solved on their own limits; the stitched
+                # result only counts as found at the deadline.
+                opt_routes, unassigned = decomposed_optimization_vrp(
+                    routes_to_optimize, pending_to_optimize, time_matrix, distance_matrix, all_locations,
+                    num_active_vehicles, VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS,
+                    FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM,
+                    pool=alns_pool if OPTIMIZER_PROCESS_ISOLATION else None, deterministic=True
+                )
+                record_result(l2_trajectory, deadline, opt_routes, unassigned)
+            elif alns_pool is not None and OPTIMIZER_PROCESS_ISOLATION:
+                opt_routes, unassigned, worker_stats = run_l2_in_pool(
+                    alns_pool, routes_to_optimize, pending_to_optimize,
+                    num_active_vehicles, VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS, deadline=deadline,
+                    lower_bound=lower_bound, fixed_cost_per_truck=FIXED_COST_PER_TRUCK,
+                    variable_cost_per_km=VARIABLE_COST_PER_KM, cancel_token=cancel_token,
+                    clock=l2_clock, on_new_best=record_best(l2_trajectory, l2_clock)
+                )
+                solver_stats.update(worker_stats)
+            else:
                 opt_routes, unassigned = batch_optimization_vrp(
                     current_routes=routes_to_optimize, pending_orders=pending_to_optimize, time_matrix=time_matrix,distance_matrix=distance_matrix,
-                    num_vehicles=NUM_VEHICLES, vehicle_capacity=VEHICLE_CAPACITY, max_route_duration_mins=MAX_ROUTE_DURATION_MINS,
-                    variable_cost_per_km=VARIABLE_COST_PER_KM, fixed_cost_per_truck=FIXED_COST_PER_TRUCK
+                    num_vehicles=num_active_vehicles, vehicle_capacity=VEHICLE_CAPACITY, max_route_duration_mins=MAX_ROUTE_DURATION_MINS,
+                    variable_cost_per_km=VARIABLE_COST_PER_KM, fixed_cost_per_truck=FIXED_COST_PER_TRUCK,
+                    deadline=deadline, solver_stats=solver_stats, lower_bound=lower_bound,
+                    cancel_token=cancel_token, clock=l2_clock, on_new_best=record_best(l2_trajectory, l2_clock)
+                )
+            l2_results['error'] = None
+        except Exception as e:
+            print(f"--- [LAYER 2 OR-Tools] Error during optimization: {e} ---")
+            l2_results['error'] = e
+        end_time = time.time()
+        l2_results['runtime'] = end_time - start_time
+        print(f"--- [LAYER 2 OR-Tools] Finished in {l2_results['runtime']:.2f} seconds "
+              f"({l2_clock.now() - race_start:.2f}s simulated). ---")
+
+    def run_layer3():
+        print("--- [LAYER 3 ALNS] Starting optimization... ---")
+        start_time = time.time()
+        operator_stats = {}
+        l3_results['operator_stats'] = operator_stats
+        num_orders = sum(len(r) for r in routes_to_optimize.values()) + len(pending_to_optimize)
+        try:
+            if num_orders >= DECOMPOSITION_MIN_ORDERS:
+                # Cluster first, route second, like L2. The clusters' searches
+                # share the time to the deadline; the stitched result counts
+                # as found when the last of them stops
+                opt_routes, unassigned = decomposed_alns_optimization(
+                    routes_to_optimize, pending_to_optimize, time_matrix, distance_matrix, all_locations,
+                    num_active_vehicles, VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS,
+                    FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM,
+                    pool=alns_pool if OPTIMIZER_PROCESS_ISOLATION else None, deadline=deadline,
+                    alns_state=alns_state, seed=l3_seed, clock=l3_clock
+                )
+            elif alns_pool is not None and LAYER_3_ISLAND_MODEL:
+                # Island model: cooperating searches that periodically share their best solution
+                # (not reproducible: what an island receives depends on the timing of the others)
+                opt_routes, unassigned, island_results = run_alns_islands(
+                    alns_pool, routes_to_optimize, pending_to_optimize,
+                    num_active_vehicles, VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS,
+                    FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM,
+                    num_islands=LAYER_3_NUM_PROCESSES, base_seed=l3_seed, deadline=deadline, alns_state=alns_state,
+                    lower_bound=lower_bound, cancel_token=cancel_token, clock=l3_clock
                 )
-                l2_results['routes'] = opt_routes
-                l2_results['unassigned'] = unassigned
-                l2_results['error'] = None
-            except Exception as e:
-                print(f"--- [LAYER 2 OR-Tools] Error during optimization: {e} ---")
-                l2_results['error'] = e
-            end_time = time.time()
-            l2_results['runtime'] = end_time - start_time
-            print(f"--- [LAYER 2 OR-Tools] Finished in {l2_results['runtime']:.2f} seconds. Found {len(l2_results.get('unassigned',[]))} unassigned. ---")
-
-        def run_layer3():
-            print("--- [LAYER 3 ALNS] Starting optimization... ---")
-            start_time = time.time()
-            try:
+                operator_stats['islands'] = island_results
+            elif alns_pool is not None and OPTIMIZER_PROCESS_ISOLATION and LAYER_3_NUM_PROCESSES == 1:
+                # Single search in a worker process: its new bests are replayed to the hook on return
+                opt_routes, unassigned, worker_stats = run_alns_in_pool(
+                    alns_pool, routes_to_optimize, pending_to_optimize,
+                    num_active_vehicles, VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS,
+                    FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM, deadline=deadline,
+                    alns_state=alns_state, lower_bound=lower_bound, cancel_token=cancel_token, seed=l3_seed,
+                    clock=l3_clock, on_new_best=record_best(l3_trajectory, l3_clock)
+                )
+                operator_stats.update(worker_stats)
+            elif alns_pool is not None and LAYER_3_NUM_PROCESSES > 1:
+                # Multi-start: independent seeded searches in worker processes, best one wins
+                opt_routes, unassigned, start_results = run_alns_multistart(
+                    alns_pool, routes_to_optimize, pending_to_optimize,
+                    num_active_vehicles, VEHICLE_CAPACITY, MAX_ROUTE_DURATION_MINS,
+                    FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM,
+                    num_starts=LAYER_3_NUM_PROCESSES, base_seed=l3_seed, deadline=deadline, alns_state=alns_state,
+                    lower_bound=lower_bound, cancel_token=cancel_token, clock=l3_clock
+                )
+                operator_stats['multistart'] = start_results
+            else:
+                # Seeded like the pool search, so both modes give the same result
+                random.seed(l3_seed)
                 opt_routes, unassigned = run_alns_optimization(
                     current_routes_input=routes_to_optimize, pending_orders_input=pending_to_optimize, time_matrix=time_matrix, distance_matrix=distance_matrix,
-                    num_vehicles=NUM_VEHICLES, vehicle_capacity=VEHICLE_CAPACITY, max_route_duration_mins=MAX_ROUTE_DURATION_MINS , fixed_cost_per_truck=FIXED_COST_PER_TRUCK, variable_cost_per_km=VARIABLE_COST_PER_KM
+                    num_vehicles=num_active_vehicles, vehicle_capacity=VEHICLE_CAPACITY, max_route_duration_mins=MAX_ROUTE_DURATION_MINS , fixed_cost_per_truck=FIXED_COST_PER_TRUCK, variable_cost_per_km=VARIABLE_COST_PER_KM,
+                    operator_stats=operator_stats, deadline=deadline, on_new_best=record_best(l3_trajectory, l3_clock),
+                    alns_state=alns_state, lower_bound=lower_bound, cancel_token=cancel_token, clock=l3_clock
                 )
-                l3_results['routes'] = opt_routes
-                l3_results['unassigned'] = unassigned
-                l3_results['error'] = None
-            except Exception as e:
-                print(f"--- [LAYER 3 ALNS] Error during optimization: {e} ---")
-                l3_results['error'] = e
-            end_time = time.time()
-            l3_results['runtime'] = end_time - start_time
-            print(f"--- [LAYER 3 ALNS] Finished in {l3_results['runtime']:.2f} seconds. Found {len(l3_results.get('unassigned',[]))} unassigned. ---")
-
-        thread_l2 = threading.Thread(target=run_layer2)
-        thread_l3 = threading.Thread(target=run_layer3)
-        
-        thread_l2.start()
-        thread_l3.start()
-        
-        thread_l2.join()
-        thread_l3.join()
+            if not l3_trajectory:
+                # Several searches: the best one is only known once the last has finished
+                record_result(l3_trajectory, l3_clock.now(), opt_routes, unassigned)
+            l3_results['error'] = None
+        except Exception as e:
+            print(f"--- [LAYER 3 ALNS] Error during optimization: {e} ---")
+            l3_results['error'] = e
+        end_time = time.time()
+        l3_results['runtime'] = end_time - start_time
+        print(f"--- [LAYER 3 ALNS] Finished in {l3_results['runtime']:.2f} seconds "
+              f"({l3_clock.now() - race_start:.2f}s simulated). ---")
 
-        print("--- [OPTIMIZER WORKER] Both optimization layers completed. Comparing results... ---")
+    # Run L2 and L3 side by side. Both stop on their own clocks, at the
+    # deadline or at the earliest acceptance published on the token, so this
+    # waits for both without a wall-clock deadline
+    run_portfolio({'L2': run_layer2, 'L3': run_layer3}, cancel_token)
+    race_seconds = time.time() - cycle_start
+    # Each layer ran at least until the earliest acceptance: their bests at that time are final
+    cut = min(acceptance_time(l2_trajectory, accept_objective), acceptance_time(l3_trajectory, accept_objective),
+              deadline)
+    for results, trajectory in ((l2_results, l2_trajectory), (l3_results, l3_trajectory)):
+        if results.get('error') is None:
+            results['routes'], results['unassigned'] = best_at(trajectory, cut) or (None, None)
+    if cut < deadline and l3_clock.now() > cut:
+        # L3 was stopped past the acceptance at a point that depends on timing: keep its previous state
+        alns_state.clear()
+        alns_state.update(alns_state_before)
+    cut_str = "deadline" if cut == deadline else "acceptance"
+    print(f"--- [OPTIMIZER CYCLE {cycle}] Both optimization layers completed in {race_seconds:.2f}s; "
+          f"results taken at the {cut_str}, {cut - race_start:.2f}s simulated. Comparing results... ---")
 
-        best_solution = None
-        best_cost = float('inf')
-        selected_layer = "None"
+    best_solution = None
+    best_cost = float('inf')
+    selected_layer = "None"
+    
+    cost_l2 = float('inf')
+    trucks_l2 = 0
+    dist_l2 = 0
+    if l2_results.get('routes') is not None and l2_results.get('error') is None:
+        cost_l2, trucks_l2, dist_l2 = calculate_total_fleet_cost(
+            l2_results['routes'], distance_matrix,
+            FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM
+        )
+        print(f"    L2 (OR-Tools) Result: Cost={cost_l2:.2f}, Trucks={trucks_l2}, Dist={dist_l2:.2f} km, Unassigned={len(l2_results['unassigned'])}, Time={l2_results['runtime']:.2f}s")
+        if cost_l2 < best_cost:
+            best_cost = cost_l2
+            best_solution = l2_results
+            selected_layer = "Layer 2 (OR-Tools)"
+    else:
+         print(f"    L2 (OR-Tools) Result: Failed or produced no solution.")
+
+    cost_l3 = float('inf')
+    trucks_l3 = 0
+    dist_l3 = 0
+    if l3_results.get('routes') is not None and l3_results.get('error') is None:
+        cost_l3, trucks_l3, dist_l3 = calculate_total_fleet_cost(
+            l3_results['routes'], distance_matrix,
+            FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM
+        )
+        print(f"    L3 (ALNS) Result: Cost={cost_l3:.2f}, Trucks={trucks_l3}, Dist={dist_l3:.2f} km, Unassigned={len(l3_results['unassigned'])}, Time={l3_results['runtime']:.2f}s")
+        if cost_l3 < best_cost:
+            best_cost = cost_l3
+            best_solution = l3_results
+            selected_layer = "Layer 3 (ALNS)"
+        elif cost_l3 == best_cost and len(l3_results['unassigned']) < len(best_solution['unassigned']):
+             best_solution = l3_results
+             selected_layer = "Layer 3 (ALNS) - Tie Break on Unassigned"
+    else:
+         print(f"    L3 (ALNS) Result: Failed or produced no solution.")
+
+    # NEW: Log optimization performance for analytics
+    if cost_l2 != float('inf') and cost_l3 != float('inf'):
+        improvement = ((max(cost_l2, cost_l3) - min(cost_l2, cost_l3)) / max(cost_l2, cost_l3)) * 100
+        optimization_performance_log.append({
+            'time': log_time,
+            'l2_cost': cost_l2,
+            'l3_cost': cost_l3,
+            'winner': 'L2' if cost_l2 < cost_l3 else 'L3',
+            'improvement': improvement,
+            'l3_operator_stats': l3_results.get('operator_stats'),
+            'l2_anytime': l2_results['solver_stats'].get('anytime'),
+            'lower_bound': lower_bound,
+            'l2_gap': optimality_gap(
+                calculate_alns_objective(cost_l2, l2_results['unassigned'], FIXED_COST_PER_TRUCK), lower_bound
+            ),
+            'l3_gap': optimality_gap(
+                calculate_alns_objective(cost_l3, l3_results['unassigned'], FIXED_COST_PER_TRUCK), lower_bound
+            ),
+            'race_seconds': race_seconds,
+            'race_simulated_seconds': cut - race_start
+        })
+
+    if best_solution:
+        print(f"--- [OPTIMIZER CYCLE {cycle}] Selected solution from: {selected_layer} with Cost: {best_cost:.2f} ---")
+        current_routes, pending_orders = merge_active_solution(
+            current_routes, dispatched_vehicles, active_vehicle_ids,
+            best_solution['routes'], best_solution['unassigned'], used_vehicles()
+        )
+
+        simulation_events.append({
+            'type': 'optimization',
+            'time': log_time,
+            'description': f"[Parallel Opt.] Selected {selected_layer}. New Cost={best_cost:.2f}. {len(pending_orders)} orders pending."
+        })
+    else:
+        print(f"--- [OPTIMIZER CYCLE {cycle}] Warning: Neither optimization layer produced a valid solution. State not updated. ---")
         
-        cost_l2 = float('inf')
-        trucks_l2 = 0
-        dist_l2 = 0
-        if l2_results.get('routes') is not None and l2_results.get('error') is None:
-            cost_l2, trucks_l2, dist_l2 = calculate_total_fleet_cost(
-                l2_results['routes'], distance_matrix,
-                FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM
-            )
-            print(f"    L2 (OR-Tools) Result: Cost={cost_l2:.2f}, Trucks={trucks_l2}, Dist={dist_l2:.2f} km, Unassigned={len(l2_results['unassigned'])}, Time={l2_results['runtime']:.2f}s")
-            if cost_l2 < best_cost:
-                best_cost = cost_l2
-                best_solution = l2_results
-                selected_layer = "Layer 2 (OR-Tools)"
-        else:
-             print(f"    L2 (OR-Tools) Result: Failed or produced no solution.")
-
-        cost_l3 = float('inf')
-        trucks_l3 = 0
-        dist_l3 = 0
-        if l3_results.get('routes') is not None and l3_results.get('error') is None:
-            cost_l3, trucks_l3, dist_l3 = calculate_total_fleet_cost(
-                l3_results['routes'], distance_matrix,
-                FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM
-            )
-            print(f"    L3 (ALNS) Result: Cost={cost_l3:.2f}, Trucks={trucks_l3}, Dist={dist_l3:.2f} km, Unassigned={len(l3_results['unassigned'])}, Time={l3_results['runtime']:.2f}s")
-            if cost_l3 < best_cost:
-                best_cost = cost_l3
-                best_solution = l3_results
-                selected_layer = "Layer 3 (ALNS)"
-            elif cost_l3 == best_cost and len(l3_results['unassigned']) < len(best_solution['unassigned']):
-                 best_solution = l3_results
-                 selected_layer = "Layer 3 (ALNS) - Tie Break on Unassigned"
-        else:
-             print(f"    L3 (ALNS) Result: Failed or produced no solution.")
-
-        # NEW: Log optimization performance for analytics
-        if cost_l2 != float('inf') and cost_l3 != float('inf'):
-            improvement = ((max(cost_l2, cost_l3) - min(cost_l2, cost_l3)) / max(cost_l2, cost_l3)) * 100
-            optimization_performance_log.append({
-                'time': datetime.now().strftime("%I:%M:%S %p"),
-                'l2_cost': cost_l2,
-                'l3_cost': cost_l3,
-                'winner': 'L2' if cost_l2 < cost_l3 else 'L3',
-                'improvement': improvement
-            })
+    print(f"{'='*10} [OPTIMIZER CYCLE {cycle}] Finished {'='*10}")
 
-        if best_solution:
-            print(f"--- [OPTIMIZER WORKER] Selected solution from: {selected_layer} with Cost: {best_cost:.2f} ---")
-            with state_lock:
-                current_routes = best_solution['routes']
-                pending_orders = best_solution['unassigned']
-                
-                log_time = datetime.now().strftime("%I:%M:%S %p")
-                simulation_events.append({
-                    'type': 'optimization',
-                    'time': log_time,
-                    'description': f"[Parallel Opt.] Selected {selected_layer}. New Cost={best_cost:.2f}. {len(pending_orders)} orders pending."
+# --- Discrete-Event Simulation ---
+# The day runs on a simulated clock (minute of the day) instead of 10-minute
+# wall-clock ticks and sleeps: order arrivals (at their own minute), ticks
+# (dispatch checks and L1 on the pending orders) and optimizer cycles are
+# events in a priority queue, handled in (minute, kind, sequence) order. The clock only advances once an event is
+# handled, so an optimizer cycle takes no simulated time and the day runs as
+# fast as the CPU allows. With the random module seeded and all solver
+# budgets counted in work, not seconds, a day always replays the same way.
+EVENT_ORDER_ARRIVAL, EVENT_VEHICLE_RETURN, EVENT_TICK, EVENT_OPTIMIZER_CYCLE = range(4)  # Also the order of events at the same minute
+
+
+def receive_order(order_data, minute):
+    """
+    Turns a historical order record arriving at minute into a pending order
+    (L1 picks it up at the next tick).
+    Returns: the new order, or None if the record has no valid location.
+    """
+    try:
+        location_idx = int(order_data['location_index'])
+        if location_idx >= len(all_locations):
+            print(f"Warning: Skipping order with invalid location_index {location_idx}")
+            return None
+    except ValueError:
+        print(f"Warning: Skipping order with non-numeric location_index {order_data['location_index']}")
+        return None
+
+    new_order = make_order(
+        order_data.get('order_id', f"ord_{order_data['timestamp']}"),
+        location_idx,
+        int(order_data['demand']),
+        minute  # NEW: Track arrival time
+    )
+
+    pending_orders.append(new_order)
+
+    order_location = all_locations[new_order['index']]['original_address'].split(',')[0]
+    print(f"EVENT: New historical order #{new_order['id']} received for {order_location} (Demand: {new_order['demand']})")
+
+    simulation_events.append({
+        'type': 'new_order',
+        'time': format_time(minute - SIMULATION_START_HOUR * 60),
+        'description': f"<strong>Order #{new_order['id']}</strong> (Demand: {new_order['demand']}) received for <strong>{order_location}</strong>"
+    })
+    return new_order
+
+
+def used_vehicles():
+    """Returns: IDs of the vehicles that came back from a trip today (their fixed cost is paid)."""
+    return {v_id for v_id, _ in completed_trips}
+
+
+def dispatch_vehicles(minute):
+    """
+    Sends the vehicles that are due (see rolling_horizon.vehicles_to_dispatch) off at minute.
+    Returns: [(vehicle_id, return_minute), ...] of the vehicles that left.
+    """
+    leaving = vehicles_to_dispatch(current_routes, dispatched_vehicles, minute, VEHICLE_CAPACITY)
+    dispatched_vehicles.update(leaving)
+    trips = []
+    for v_id in leaving:
+        return_minute = trip_return_minute(current_routes[v_id], minute, time_matrix)
+        trips.append((v_id, return_minute))
+        print(f"DISPATCH: Vehicle {v_id} leaves the depot with {len(current_routes[v_id])} orders; its route is now committed.")
+        simulation_events.append({
+            'type': 'optimization',
+            'time': format_time(minute - SIMULATION_START_HOUR * 60),
+            'description': f"🚚 Vehicle {v_id} dispatched with {len(current_routes[v_id])} orders (route committed), "
+                           f"back at {format_time(return_minute - SIMULATION_START_HOUR * 60)}."
+        })
+    return trips
+
+
+def return_vehicle(v_id, minute):
+    """Vehicle v_id is back at the depot at minute: its trip is archived and it rejoins the free fleet."""
+    global current_routes
+    completed_trips.append((v_id, current_routes[v_id]))
+    current_routes = {**current_routes, v_id: []}
+    dispatched_vehicles.discard(v_id)
+    print(f"RETURN: Vehicle {v_id} is back at the depot after delivering {len(completed_trips[-1][1])} orders.")
+    simulation_events.append({
+        'type': 'optimization',
+        'time': format_time(minute - SIMULATION_START_HOUR * 60),
+        'description': f"🏁 Vehicle {v_id} back at the depot, free for another trip."
+    })
+
+
+def assign_orders_l1(orders, minute):
+    """Layer 1: tries to insert each of the (pending) orders into a vehicle still at the depot at minute."""
+    global current_routes, pending_orders
+
+    for order_to_assign in orders:
+        if order_to_assign not in pending_orders:
+            continue
+
+        print(f"\n[LAYER 1] Attempting to assign Order #{order_to_assign['id']} (Demand: {order_to_assign['demand']})...")
+        # Dispatched vehicles cannot take more orders
+        l1_start = time.perf_counter()
+        final_routes, method = assign_new_order_realtime(
+            order_to_assign, 
+            free_fleet(current_routes, dispatched_vehicles, used_vehicles()), 
+            time_matrix,
+            VEHICLE_CAPACITY, 
+            MAX_ROUTE_DURATION_MINS
+        )
+        l1_latencies_ms.append((time.perf_counter() - l1_start) * 1000)
+
+        if final_routes:
+            order_location = all_locations[order_to_assign['index']]['original_address'].split(',')[0]
+            print(f"SUCCESS (L1): Order #{order_to_assign['id']} assigned via {method} method.")
+            
+            assigned_vehicle_id = -1
+            newly_assigned_order_id = order_to_assign['id']
+            
+            for v_id, new_route in final_routes.items():
+                new_route_ids = [o['id'] for o in new_route]
+                if newly_assigned_order_id in new_route_ids:
+                    assigned_vehicle_id = v_id
+                    break
+
+            # NEW: Calculate wait time
+            wait_time = minute - order_to_assign['arrival_minute']
+            order_wait_times[order_to_assign['id']] = wait_time
+
+            if assigned_vehicle_id != -1:
+                global_order_assignments_log.append({
+                    "timestamp": format_time(minute - SIMULATION_START_HOUR * 60),
+                    "order_id": order_to_assign['id'],
+                    "demand": order_to_assign['demand'],
+                    "location": order_location,
+                    "assigned_vehicle": assigned_vehicle_id,
+                    "method": method
                 })
-        else:
-            print("--- [OPTIMIZER WORKER] Warning: Neither optimization layer produced a valid solution. State not updated. ---")
             
-        print(f"{'='*10} [OPTIMIZER WORKER] Cycle Finished {'='*10}")
+            current_routes = {**current_routes, **final_routes}
+            if order_to_assign in pending_orders:
+                pending_orders.remove(order_to_assign)
+            
+            simulation_events.append({
+                'type': 'assignment',
+                'time': format_time(minute - SIMULATION_START_HOUR * 60),
+                'description': f"<span style='color:green;'>✓ ASSIGNED (L1)</span> Order #{order_to_assign['id']} via <strong>{method}</strong>. Dest: {order_location}. Wait: {wait_time} min",
+                'success': True
+            })
+        else:
+            print(f"FAILURE (L1): Order #{order_to_assign['id']} could not be assigned. Awaiting Layer 2.")
+            simulation_events.append({
+                'type': 'assignment',
+                'time': format_time(minute - SIMULATION_START_HOUR * 60),
+                'description': f"<span style='color:red;'>✗ FAILED (L1)</span> Could not find immediate fit for Order #{order_to_assign['id']}.",
+                'success': False
+            })
 
-def run_hybrid_simulation():
-    global current_routes, pending_orders, simulation_running, all_locations, time_matrix, simulation_events, simulation_start_time
-    global distance_matrix, order_wait_times
-    print("--- Starting HYBRID DYNAMIC Delivery Simulation (Capacity Aware, Trace-Based) ---")
-    
+def percentile(values, fraction):
+    """Nearest-rank percentile of values (fraction in [0, 1]); 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+def simulation_kpis(day_of_year, runtime_sec):
+    """
+    KPIs of the simulated day from the final state: fleet cost, trucks and
+    distance of the routes and completed trips (see
+    rolling_horizon.day_fleet_cost), trips driven, orders left unassigned, wait from arrival to L1
+    assignment (minutes, L1-assigned orders) and L1 latency (wall-clock ms
+    per assignment call).
+    Returns: dict, one row of the batch KPI table (see batch_simulation.py).
+    """
+    cost, trucks, distance = day_fleet_cost(
+        current_routes, completed_trips, distance_matrix, FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM
+    )
+    waits = list(order_wait_times.values())
+    return {
+        'day': day_of_year,
+        'orders': len([e for e in simulation_events if e['type'] == 'new_order']),
+        'unassigned': len(pending_orders),
+        'l1_assigned': len(waits),
+        'trucks': trucks,
+        'trips': len(completed_trips) + sum(1 for route in current_routes.values() if route),
+        'distance_km': distance,
+        'cost': cost,
+        'avg_wait_min': sum(waits) / len(waits) if waits else 0.0,
+        'max_wait_min': max(waits) if waits else 0,
+        'l1_calls': len(l1_latencies_ms),
+        'l1_p50_ms': percentile(l1_latencies_ms, 0.5),
+        'l1_p95_ms': percentile(l1_latencies_ms, 0.95),
+        'l1_max_ms': max(l1_latencies_ms) if l1_latencies_ms else 0.0,
+        'runtime_sec': runtime_sec,
+        'l1_latencies_ms': list(l1_latencies_ms)
+    }
+
+def load_simulation_data():
+    """
+    Loads the master locations, time matrix and distance matrix from TIME_MATRIX_FILE.
+    Returns: (locations, time_matrix, distance_matrix), or None if the file cannot be used.
+    """
     try:
         with open(TIME_MATRIX_FILE, 'r') as f: 
             data = json.load(f)
-        all_locations, time_matrix = data['locations'], data['time_matrix']
-        distance_matrix = data['distance_matrix']
-        print(f"✅ Master time matrix loaded ({len(time_matrix)}x{len(time_matrix)}).")
-        print(f"✅ Master distance matrix loaded ({len(distance_matrix)}x{len(distance_matrix)}).")
-        print(f"✅ {len(all_locations)} locations loaded.")
+        locations, loaded_time_matrix = data['locations'], data['time_matrix']
+        loaded_distance_matrix = data['distance_matrix']
+        print(f"✅ Master time matrix loaded ({len(loaded_time_matrix)}x{len(loaded_time_matrix)}).")
+        print(f"✅ Master distance matrix loaded ({len(loaded_distance_matrix)}x{len(loaded_distance_matrix)}).")
+        print(f"✅ {len(locations)} locations loaded.")
         
-        if not all_locations or not time_matrix or not distance_matrix:
+        if not locations or not loaded_time_matrix or not loaded_distance_matrix:
              raise ValueError("Loaded data is missing locations, time_matrix, or distance_matrix.")
-        if len(time_matrix) != len(all_locations) or len(distance_matrix) != len(all_locations):
-             raise ValueError(f"Matrix dimensions ({len(time_matrix)} / {len(distance_matrix)}) don't match location count ({len(all_locations)}).")
+        if len(loaded_time_matrix) != len(locations) or len(loaded_distance_matrix) != len(locations):
+             raise ValueError(f"Matrix dimensions ({len(loaded_time_matrix)} / {len(loaded_distance_matrix)}) don't match location count ({len(locations)}).")
         
     except FileNotFoundError:
         print(f"FATAL Error: '{TIME_MATRIX_FILE}' not found. Run the 'build_and_save_matrix_custom.py' script first.")
-        return
+        return None
     except KeyError as e:
         print(f"FATAL Error: Missing key '{e}' in '{TIME_MATRIX_FILE}'. Ensure the file contains 'locations', 'time_matrix', and 'distance_matrix'.")
-        return
+        return None
     except ValueError as e:
          print(f"FATAL Error: Data validation failed - {e}")
-         return
+         return None
     except Exception as e:
         print(f"FATAL Error loading data from '{TIME_MATRIX_FILE}': {e}")
-        return
-        
+        return None
+    return locations, loaded_time_matrix, loaded_distance_matrix
+
+def load_order_history():
+    """Returns: all orders of PREPROCESSED_ORDER_FILE as a DataFrame, or None if it cannot be read."""
     try:
-        all_orders_df = pd.read_csv(PREPROCESSED_ORDER_FILE)
-        sim_orders_df = all_orders_df[
-            all_orders_df['day_of_year'] == SIMULATION_DAY_OF_YEAR
-        ].sort_values(by='minute_of_day')
-        
-        historical_orders = sim_orders_df.to_dict('records')
-        historical_orders.reverse()
-        print(f"✅ Loaded {len(historical_orders)} orders for simulation day {SIMULATION_DAY_OF_YEAR}.")
-        
+        return pd.read_csv(PREPROCESSED_ORDER_FILE)
     except FileNotFoundError:
         print(f"FATAL Error: '{PREPROCESSED_ORDER_FILE}' not found. Run 'preprocess_order_history.py' first.")
-        return
     except Exception as e:
         print(f"Error loading orders: {e}")
-        return
+    return None
+
+def release_optimizer_pool():
+    """Stops the optimizer pool and frees the shared matrices (nothing to do if there are none)."""
+    global alns_pool, shared_matrices
+    if alns_pool is not None:
+        # Like leaving a Pool's with block: no task is outstanding after a cycle,
+        # and a failed day must not wait on one
+        alns_pool.terminate()
+        alns_pool.join()
+        alns_pool = None
+    # After the pool: its workers read the matrices in place
+    for shared_matrix in shared_matrices:
+        shared_matrix.close()
+    shared_matrices = []
+
+def run_hybrid_simulation(day_of_year=SIMULATION_DAY_OF_YEAR, generate_report=True,
+                          simulation_data=None, all_orders_df=None):
+    """
+    Simulates one day of orders. simulation_data (see load_simulation_data)
+    and all_orders_df (see load_order_history) are loaded from disk unless
+    given, so a batch of days can share them (see batch_simulation.py).
+    generate_report=False skips the HTML dashboard.
+    Returns: the day's KPIs (see simulation_kpis), or None if the data cannot be loaded.
+    """
+    global current_routes, pending_orders, all_locations, time_matrix, simulation_events, simulation_start_time
+    global distance_matrix, order_wait_times, alns_pool, alns_state, shared_matrices, dispatched_vehicles, completed_trips
+    global global_order_assignments_log, optimization_performance_log, l1_latencies_ms
+    print("--- Starting HYBRID DYNAMIC Delivery Simulation (Capacity Aware, Trace-Based) ---")
+    
+    if simulation_data is None:
+        simulation_data = load_simulation_data()
+        if simulation_data is None:
+            return None
+    all_locations, time_matrix, distance_matrix = simulation_data
+
+    if all_orders_df is None:
+        all_orders_df = load_order_history()
+        if all_orders_df is None:
+            return None
+    sim_orders_df = all_orders_df[
+        all_orders_df['day_of_year'] == day_of_year
+    ].sort_values(by='minute_of_day')
+    
+    historical_orders = sim_orders_df.to_dict('records')
+    print(f"✅ Loaded {len(historical_orders)} orders for simulation day {day_of_year}.")
 
     current_routes = {i: [] for i in range(NUM_VEHICLES)}
     pending_orders = []
     simulation_events = []
     order_wait_times = {}
+    alns_state = {}
+    dispatched_vehicles = set()
+    completed_trips = []
+    global_order_assignments_log = []
+    optimization_performance_log = []
+    l1_latencies_ms = []
+    clear_order_registry()
+    random.seed(SIMULATION_RANDOM_SEED)
     simulation_start_time = datetime.now()
 
-    optimizer_thread = threading.Thread(target=parallel_optimization_worker, daemon=True)
-    optimizer_thread.start()
-    print(f"✅ Parallel Optimizer (L2/L3) thread started (Interval: {LAYER_2_INTERVAL_SECONDS}s).")
-    print(f"✅ Simulating {NUM_VEHICLES} vehicles with {VEHICLE_CAPACITY} capacity each.")
-    print(f"--- Simulating Day {SIMULATION_DAY_OF_YEAR} from {SIMULATION_START_HOUR}:00 to {SIMULATION_END_HOUR}:00 ---")
+    try:
+        if OPTIMIZER_PROCESS_ISOLATION or LAYER_3_NUM_PROCESSES > 1:
+            # With isolation, one extra worker runs L2 next to the L3 search(es)
+            num_pool_workers = LAYER_3_NUM_PROCESSES + (1 if OPTIMIZER_PROCESS_ISOLATION else 0)
+            for matrix in (time_matrix, distance_matrix):
+                shared_matrices.append(SharedMatrix(matrix))  # One at a time, so the finally frees any already made
+            alns_pool = create_alns_pool(shared_matrices[0], shared_matrices[1], num_pool_workers)
+            print(f"✅ Optimizer process pool started ({num_pool_workers} processes, matrices in shared memory).")
 
-    for minute in range(SIMULATION_START_HOUR * 60, SIMULATION_END_HOUR * 60, MINUTES_PER_TICK):
-        current_time_str = f"Day {SIMULATION_DAY_OF_YEAR}, {minute//60:02d}:{minute%60:02d}"
-        print(f"\n{'='*15} {current_time_str} (Tick: {minute} - {minute + MINUTES_PER_TICK}) {'='*15}")
-        
-        orders_this_tick = 0
-        while historical_orders and historical_orders[-1]['minute_of_day'] < (minute + MINUTES_PER_TICK):
-            order_data = historical_orders.pop()
-            orders_this_tick += 1
-            
-            try:
-                location_idx = int(order_data['location_index'])
-                if location_idx >= len(all_locations):
-                    print(f"Warning: Skipping order with invalid location_index {location_idx}")
-                    continue
-            except ValueError:
-                print(f"Warning: Skipping order with non-numeric location_index {order_data['location_index']}")
-                continue
-
-            new_order = {
-                'id': order_data.get('order_id', f"ord_{order_data['timestamp']}"),
-                'index': location_idx,
-                'demand': int(order_data['demand']),
-                'arrival_minute': minute  # NEW: Track arrival time
-            }
-            
-            with state_lock:
-                pending_orders.append(new_order)
-            
-            order_location = all_locations[new_order['index']]['original_address'].split(',')[0]
-            print(f"EVENT: New historical order #{new_order['id']} received for {order_location} (Demand: {new_order['demand']})")
-            
-            simulation_events.append({
-                'type': 'new_order',
-                'time': format_time(minute - SIMULATION_START_HOUR * 60),
-                'description': f"<strong>Order #{new_order['id']}</strong> (Demand: {new_order['demand']}) received for <strong>{order_location}</strong>"
-            })
+        print(f"✅ Simulating {NUM_VEHICLES} vehicles with {VEHICLE_CAPACITY} capacity each.")
+        print(f"--- Simulating Day {day_of_year} from {SIMULATION_START_HOUR}:00 to {SIMULATION_END_HOUR}:00 "
+              f"(optimizer every {OPTIMIZER_INTERVAL_MINUTES} simulated minutes) ---")
 
-        if orders_this_tick > 0:
-            print(f"Total {orders_this_tick} new orders this tick. Total pending: {len(pending_orders)}")
-        
-        if pending_orders:
-            for order_to_assign in pending_orders[:]:
-                if order_to_assign not in pending_orders:
-                    continue
-                    
-                print(f"\n[LAYER 1] Attempting to assign Order #{order_to_assign['id']} (Demand: {order_to_assign['demand']})...")
-                
-                with state_lock:
-                    final_routes, method = assign_new_order_realtime(
-                        order_to_assign, 
-                        current_routes, 
-                        time_matrix,
-                        VEHICLE_CAPACITY, 
-                        MAX_ROUTE_DURATION_MINS
-                    )
-
-                if final_routes:
-                    order_location = all_locations[order_to_assign['index']]['original_address'].split(',')[0]
-                    print(f"SUCCESS (L1): Order #{order_to_assign['id']} assigned via {method} method.")
-                    
-                    assigned_vehicle_id = -1
-                    newly_assigned_order_id = order_to_assign['id']
-                    
-                    for v_id, new_route in final_routes.items():
-                        new_route_ids = [o['id'] for o in new_route]
-                        if newly_assigned_order_id in new_route_ids:
-                            assigned_vehicle_id = v_id
-                            break
-
-                    # NEW: Calculate wait time
-                    wait_time = minute - order_to_assign['arrival_minute']
-                    order_wait_times[order_to_assign['id']] = wait_time
-
-                    with state_lock:
-                        if assigned_vehicle_id != -1:
-                            global_order_assignments_log.append({
-                                "timestamp": format_time(minute - SIMULATION_START_HOUR * 60),
-                                "order_id": order_to_assign['id'],
-                                "demand": order_to_assign['demand'],
-                                "location": order_location,
-                                "assigned_vehicle": assigned_vehicle_id,
-                                "method": method
-                            })
-                        
-                        current_routes = final_routes
-                        if order_to_assign in pending_orders:
-                            pending_orders.remove(order_to_assign)
-                    
-                    simulation_events.append({
-                        'type': 'assignment',
-                        'time': format_time(minute - SIMULATION_START_HOUR * 60),
-                        'description': f"<span style='color:green;'>✓ ASSIGNED (L1)</span> Order #{order_to_assign['id']} via <strong>{method}</strong>. Dest: {order_location}. Wait: {wait_time} min",
-                        'success': True
-                    })
-                else:
-                    print(f"FAILURE (L1): Order #{order_to_assign['id']} could not be assigned. Awaiting Layer 2.")
-                    simulation_events.append({
-                        'type': 'assignment',
-                        'time': format_time(minute - SIMULATION_START_HOUR * 60),
-                        'description': f"<span style='color:red;'>✗ FAILED (L1)</span> Could not find immediate fit for Order #{order_to_assign['id']}.",
-                        'success': False
-                    })
-        
-        if not pending_orders:
-            print("All pending orders assigned.")
-            
-        time.sleep(0.1)
+        start_minute = SIMULATION_START_HOUR * 60
+        end_minute = SIMULATION_END_HOUR * 60
+        events = []
+        sequence = itertools.count()  # FIFO among events of the same minute and kind
+
+        def schedule(minute, kind, payload=None):
+            heapq.heappush(events, (minute, kind, next(sequence), payload))
+
+        for order_data in historical_orders:
+            # Orders placed before opening arrive at opening; the day ends at closing
+            if order_data['minute_of_day'] < end_minute:
+                schedule(max(int(order_data['minute_of_day']), start_minute), EVENT_ORDER_ARRIVAL, order_data)
+        # Ticks and cycles repeat until closing time, and both always run once
+        # at closing, so every order that arrived before it is handled
+        schedule(start_minute, EVENT_TICK)
+        schedule(min(start_minute + OPTIMIZER_INTERVAL_MINUTES, end_minute), EVENT_OPTIMIZER_CYCLE, 0)
+
+        wall_start = time.perf_counter()
+        while events:
+            minute, kind, _, payload = heapq.heappop(events)
+
+            if kind == EVENT_ORDER_ARRIVAL:
+                receive_order(payload, minute)
+
+            elif kind == EVENT_VEHICLE_RETURN:
+                return_vehicle(payload, minute)
+
+            elif kind == EVENT_TICK:
+                current_time_str = f"Day {day_of_year}, {minute//60:02d}:{minute%60:02d}"
+                print(f"\n{'='*15} {current_time_str} (Tick: {minute} - {minute + MINUTES_PER_TICK}) {'='*15}")
+                # L1 places the orders that arrived since the last tick and retries the ones it could not place
+                assign_orders_l1(pending_orders[:], minute)
+                if not pending_orders:
+                    print("All pending orders assigned.")
+                if minute < end_minute:
+                    schedule(min(minute + MINUTES_PER_TICK, end_minute), EVENT_TICK)
+
+            elif kind == EVENT_OPTIMIZER_CYCLE:
+                run_optimization_cycle(minute, payload)
+                if ROLLING_HORIZON_ENABLED:
+                    # Right after the cycle: only routes the optimizers have seen are committed
+                    for v_id, return_minute in dispatch_vehicles(minute):
+                        # A vehicle back after closing ends the day on its trip
+                        if return_minute < end_minute:
+                            schedule(return_minute, EVENT_VEHICLE_RETURN, v_id)
+                if minute < end_minute:
+                    schedule(min(minute + OPTIMIZER_INTERVAL_MINUTES, end_minute), EVENT_OPTIMIZER_CYCLE, payload + 1)
 
-    simulation_running = False
-    print("\n--- Dynamic Simulation Ended ---")
-    print("Waiting for Parallel Optimizer thread to finish last cycle...")
-    time.sleep(LAYER_2_INTERVAL_SECONDS + 5)
+        print("\n--- Dynamic Simulation Ended ---")
+        runtime_sec = time.perf_counter() - wall_start
+        print(f"Simulated {(end_minute - start_minute) / 60:.0f} hours in {runtime_sec:.1f}s of wall-clock time.")
+    finally:
+        release_optimizer_pool()
 
     if pending_orders:
         print(f"\n--- {len(pending_orders)} orders remained unassigned at end of day ---")
@@ -1665,7 +2013,7 @@ def run_hybrid_simulation():
     total_assignments_logged = len(global_order_assignments_log)
     final_pending_count = len(pending_orders)
     
-    print(f"Simulation Period: {SIMULATION_START_HOUR}:00 - {SIMULATION_END_HOUR}:00 (Day {SIMULATION_DAY_OF_YEAR})")
+    print(f"Simulation Period: {SIMULATION_START_HOUR}:00 - {SIMULATION_END_HOUR}:00 (Day {day_of_year})")
     print(f"Fleet Size: {NUM_VEHICLES} vehicles, Capacity: {VEHICLE_CAPACITY} units each")
     print("-" * 60)
     print(f"Total Orders Processed: {total_orders_processed}")
@@ -1673,27 +2021,35 @@ def run_hybrid_simulation():
     print(f"Orders Pending at End of Day: {final_pending_count}")
     print("-" * 60)
 
-    final_cost, final_trucks_used, final_total_distance = calculate_total_fleet_cost(
-        current_routes, distance_matrix, FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM
+    final_cost, final_trucks_used, final_total_distance = day_fleet_cost(
+        current_routes, completed_trips, distance_matrix, FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM
     )
     
-    final_route_durations = [calculate_route_cost(r, time_matrix) for r in current_routes.values() if r]
+    final_route_durations = [calculate_route_cost(r, time_matrix)
+                             for r in [route for _, route in completed_trips] + list(current_routes.values()) if r]
     avg_final_duration = sum(final_route_durations) / len(final_route_durations) if final_route_durations else 0
 
     print(f"Final Fleet State:")
     print(f"  - Vehicles Used: {final_trucks_used} out of {NUM_VEHICLES}")
     print(f"  - Total Distance Traveled: {final_total_distance:.2f} km")
-    print(f"  - Average Route Duration (used vehicles): {avg_final_duration:.2f} min")
+    print(f"  - Trips Driven: {len(final_route_durations)}")
+    print(f"  - Average Trip Duration: {avg_final_duration:.2f} min")
     print(f"  - Estimated Total Cost: {final_cost:.2f}")
     print("-" * 60)
     
     opt_events = [e for e in simulation_events if e['type'] == 'optimization']
     print(f"Parallel Optimization Cycles Triggered: {len(opt_events)}")
+    cache = route_cost_cache_stats()
+    print(f"Route Cost Cache: {cache['hits']} hits / {cache['misses']} misses ({100.0 * cache['hit_rate']:.1f}% hit rate)")
+    kpis = simulation_kpis(day_of_year, runtime_sec)
+    print(f"Layer 1 Latency: p50 {kpis['l1_p50_ms']:.2f} ms, p95 {kpis['l1_p95_ms']:.2f} ms over {kpis['l1_calls']} calls")
 
     print("=" * 60)
     
-    print("\n--- Generating Enhanced HTML Dashboard ---")
-    generate_html_report()
+    if generate_report:
+        print("\n--- Generating Enhanced HTML Dashboard ---")
+        generate_html_report()
+    return kpis
 
 if __name__ == "__main__":
     run_hybrid_simulation()
\ No newline at end of file
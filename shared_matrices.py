@@ -0,0 +1,54 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# --- Shared-Memory Matrices ---
+# The simulator publishes each master matrix once in a shared-memory block;
+# worker processes attach to it by name and read it in place (zero copy).
+# Inside a worker a matrix is a list of per-row memoryviews, so the solver
+# layers keep indexing it as matrix[i][j] and get plain Python numbers back.
+
+# memoryview format of each supported NumPy dtype
+_MEMORYVIEW_FORMATS = {np.dtype(np.int64): 'q', np.dtype(np.float64): 'd'}
+
+
+class SharedMatrix:
+    """
+    Owner of one square matrix in shared memory. Create it in the main
+    process, hand handle() to the workers (see attach_shared_matrix), and
+    close() it once they are done: that also frees the block.
+    Integer matrices are stored as int64, anything else as float64.
+    """
+
+    def __init__(self, matrix):
+        array = np.asarray(matrix)
+        dtype = np.int64 if np.issubdtype(array.dtype, np.integer) else np.float64
+        array = array.astype(dtype, copy=False)
+        self.shape = array.shape
+        self.dtype = np.dtype(dtype)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)[...] = array
+
+    def handle(self):
+        """Returns: a small picklable (name, shape, dtype name) descriptor of the block."""
+        return (self._shm.name, self.shape, self.dtype.name)
+
+    def close(self):
+        self._shm.close()
+        self._shm.unlink()
+
+
+def attach_shared_matrix(handle):
+    """
+    Attaches to the block described by handle (from SharedMatrix.handle()).
+    Returns: (shm, rows) where rows[i][j] reads the matrix in place. Keep shm
+    referenced for as long as rows is in use.
+    """
+    name, shape, dtype_name = handle
+    shm = shared_memory.SharedMemory(name=name)
+    num_rows, num_cols = shape
+    flat = shm.buf[:num_rows * num_cols * np.dtype(dtype_name).itemsize].cast(
+        _MEMORYVIEW_FORMATS[np.dtype(dtype_name)]
+    )
+    rows = [flat[i * num_cols:(i + 1) * num_cols] for i in range(num_rows)]
+    return shm, rows
@@ -0,0 +1,133 @@
+from array import array
+
+from orders import make_order
+
+# --- Array-Backed Solution Representation ---
+# Orders live once in an OrderTable (struct of arrays, one row per order) and
+# a solution is a giant tour: one array('i') of order keys (row numbers), the
+# routes one after the other, separated by ROUTE_DELIMITER. Order IDs do not
+# fit in int32 (they are ~6.5e9), so the tour uses the dense row key and the
+# table maps it back to the original ID / order object.
+
+ROUTE_DELIMITER = -1
+
+
+class OrderTable:
+    """
+    Struct-of-arrays view of a set of orders.
+    Columns (index = order key): location, demand and arrival_minute as
+    array('i'), ids as array('q') (a list if some IDs are not integers).
+    The original order objects are kept for decoding, but are not pickled:
+    a table sent to a worker process only carries its columns and rebuilds
+    the Order records from them there.
+    """
+
+    def __init__(self, orders):
+        self._init_columns(
+            [o['id'] for o in orders],
+            array('i', (o['index'] for o in orders)),
+            array('i', (o['demand'] for o in orders)),
+            array('i', (o.get('arrival_minute', 0) for o in orders))
+        )
+        self.orders = list(orders)
+
+    def _init_columns(self, ids, location, demand, arrival_minute):
+        if all(isinstance(order_id, int) for order_id in ids):
+            ids = array('q', ids)
+        self.ids = ids
+        self.location = location
+        self.demand = demand
+        self.arrival_minute = arrival_minute
+        self.key_of = {order_id: key for key, order_id in enumerate(ids)}
+
+    def __len__(self):
+        return len(self.location)
+
+    def __getstate__(self):
+        return (self.ids, self.location, self.demand, self.arrival_minute)
+
+    def __setstate__(self, state):
+        self._init_columns(*state)
+        self.orders = [
+            make_order(self.ids[k], self.location[k], self.demand[k], self.arrival_minute[k])
+            for k in range(len(self.location))
+        ]
+
+    def keys(self, orders):
+        """Returns: array('i') with the key of each order (e.g. for the unassigned list)."""
+        key_of = self.key_of
+        return array('i', (key_of[o['id']] for o in orders))
+
+    def order_list(self, keys):
+        """Returns: the order objects of the given keys, in the same order."""
+        orders = self.orders
+        return [orders[k] for k in keys]
+
+
+def build_order_table(routes_dict, pending_orders=()):
+    """Builds the OrderTable of every order in routes_dict plus pending_orders."""
+    orders = [o for route_orders in routes_dict.values() for o in route_orders]
+    orders.extend(pending_orders)
+    return OrderTable(orders)
+
+
+def routes_to_giant_tour(routes_dict, table):
+    """
+    Encodes { v_id: [order, ...] } as a giant tour.
+    Returns: (tour, vehicle_ids) where tour is an array('i') of order keys
+    with one ROUTE_DELIMITER after each route (empty routes included), and
+    vehicle_ids lists the vehicle of each segment.
+    """
+    key_of = table.key_of
+    tour = array('i')
+    vehicle_ids = []
+    for v_id, route_orders in routes_dict.items():
+        tour.extend(key_of[o['id']] for o in route_orders)
+        tour.append(ROUTE_DELIMITER)
+        vehicle_ids.append(v_id)
+    return tour, vehicle_ids
+
+
+def giant_tour_to_routes(tour, vehicle_ids, table):
+    """Decodes a giant tour back to { v_id: [order, ...] } using the table's order objects."""
+    orders = table.orders
+    routes = {}
+    segment = 0
+    current = []
+    for key in tour:
+        if key == ROUTE_DELIMITER:
+            routes[vehicle_ids[segment]] = current
+            segment += 1
+            current = []
+        else:
+            current.append(orders[key])
+    return routes
+
+
+def giant_tour_fleet_cost(tour, table, distance_matrix, fixed_cost_per_truck, variable_cost_per_km):
+    """
+    Fleet cost of a giant tour straight from the arrays, matching
+    calculate_total_fleet_cost: depot -> unique stops (first visit order) -> depot.
+    Returns: total_cost, num_trucks_used, total_distance
+    """
+    location = table.location
+    total_distance = 0
+    num_trucks_used = 0
+    prev = 0
+    seen = set()
+    for key in tour:
+        if key == ROUTE_DELIMITER:
+            if seen:
+                num_trucks_used += 1
+                total_distance += distance_matrix[prev][0]
+            prev = 0
+            seen = set()
+            continue
+        loc = location[key]
+        if loc in seen:
+            continue
+        seen.add(loc)
+        total_distance += distance_matrix[prev][loc]
+        prev = loc
+    total_cost = (fixed_cost_per_truck * num_trucks_used) + (variable_cost_per_km * total_distance)
+    return total_cost, num_trucks_used, total_distance
@@ -0,0 +1,20 @@
+# --- Solution Fingerprint ---
+# Within one search the set of orders is fixed, so the routes alone identify
+# a solution (the unassigned orders are whatever is left over). The ALNS
+# elite pool uses it to keep its solutions distinct. (Fingerprinting every
+# ALNS candidate to look its cost up costs more than evaluating it: most
+# routes are rebuilt by each destroy/repair, and hits are rare.)
+
+
+def solution_fingerprint(routes_dict):
+    """
+    Canonical, hashable fingerprint of a fleet state: the sorted tuple of the
+    non-empty routes, each as (stop sequence, sorted order ids). This is what
+    the cost depends on, so the order of orders sharing a stop and the
+    vehicle ids (swapping two routes between vehicles) are ignored.
+    """
+    return tuple(sorted(
+        (tuple(dict.fromkeys(order['index'] for order in route_orders)),
+         tuple(sorted(order['id'] for order in route_orders)))
+        for route_orders in routes_dict.values() if route_orders
+    ))
@@ -0,0 +1,40 @@
+import random
+
+import pytest
+
+import hybrid_solver_layers as hsl
+from solution_cache import solution_fingerprint
+from orders import make_order, clear_order_registry
+
+# Locations on a line: location i is at i
+LINE_MATRIX = [[float(abs(i - j)) for j in range(10)] for i in range(10)]
+
+
+@pytest.fixture(autouse=True)
+def fresh_orders():
+    clear_order_registry()
+    yield
+    clear_order_registry()
+
+
+def test_shaw_removal_takes_the_orders_nearest_the_seed(monkeypatch):
+    # A huge exponent turns the randomised pick into "always the most related"
+    monkeypatch.setattr(hsl, 'ALNS_REMOVAL_RANDOMNESS', 1000)
+    routes = {0: [make_order(f'a{i}', i, 1, 0) for i in range(1, 5)],
+              1: [make_order(f'b{i}', i, 1, 0) for i in range(5, 10)]}
+    random.seed(3)
+    partial, removed = hsl._destroy_shaw(routes, 3, LINE_MATRIX, LINE_MATRIX)
+
+    assert len(removed) == 3
+    locations = sorted(order['index'] for order in removed)
+    assert locations[-1] - locations[0] == 2  # seed plus its two neighbours on the line
+    remaining = [order['id'] for route in partial.values() for order in route]
+    assert len(remaining) == 6
+    assert not set(remaining) & {order['id'] for order in removed}
+
+
+def test_fingerprint_ignores_vehicle_ids_and_order_within_a_stop():
+    a, b, c = make_order('a', 1, 1, 0), make_order('b', 1, 1, 0), make_order('c', 2, 1, 0)
+    reference = solution_fingerprint({0: [a, b], 1: [c], 2: []})
+    assert solution_fingerprint({0: [c], 1: [b, a]}) == reference
+    assert solution_fingerprint({0: [a], 1: [b, c]}) != reference
@@ -0,0 +1,34 @@
+import pytest
+
+from decomposition import decomposed_alns_optimization
+from orders import make_order, clear_order_registry
+from portfolio import WorkClock
+
+# A depot with two arms of customers, east (1-4) and west (5-8)
+COORDINATES = [(0.0, 0.0)] + [(0.0, float(i)) for i in range(1, 5)] + [(0.0, -float(i)) for i in range(1, 5)]
+LOCATIONS = [{'latitude': lat, 'longitude': lng} for lat, lng in COORDINATES]
+MATRIX = [[abs(a[1] - b[1]) for b in COORDINATES] for a in COORDINATES]
+
+
+@pytest.fixture(autouse=True)
+def fresh_orders():
+    clear_order_registry()
+    yield
+    clear_order_registry()
+
+
+def test_decomposed_alns_routes_every_order_within_the_simulated_deadline():
+    orders = [make_order(f'arm-{i}', i, 1, 0) for i in range(1, 9)]
+    routes = {v_id: [] for v_id in range(4)}
+    clock = WorkClock(0.0, 1.0)
+    alns_state = {}
+
+    new_routes, unassigned = decomposed_alns_optimization(
+        routes, orders, MATRIX, MATRIX, LOCATIONS, 4, 10, 1000, 100, 1,
+        num_clusters=2, deadline=30.0, alns_state=alns_state, seed=1, clock=clock
+    )
+
+    assert unassigned == []
+    assert sorted(o['id'] for route in new_routes.values() for o in route) == sorted(o['id'] for o in orders)
+    assert clock.now() <= 30.0
+    assert 'weights' in alns_state and alns_state['cycles'] == 1
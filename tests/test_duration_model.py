@@ -0,0 +1,64 @@
+import pytest
+
+import hybrid_solver_layers as hsl
+from orders import make_order, clear_order_registry
+
+# Location i is i minutes from the depot (time matrix in seconds, as hsl expects)
+TIME_MATRIX = [[abs(i - j) * 60 for j in range(5)] for i in range(5)]
+SERVICE_MINUTES = hsl.SERVICE_TIME_PER_STOP / 60
+
+
+@pytest.fixture(autouse=True)
+def fresh_orders():
+    clear_order_registry()
+    yield
+    clear_order_registry()
+
+
+def test_service_time_is_added_once_per_stop():
+    timed = hsl.with_service_time(TIME_MATRIX)
+    assert timed[0][3] == TIME_MATRIX[0][3]
+    assert timed[3][1] == TIME_MATRIX[3][1] + hsl.SERVICE_TIME_PER_STOP
+    assert timed[3][3] == 0
+    assert hsl.with_service_time(timed) is timed
+
+    # Depot -> 3 -> 1 -> depot is 6 minutes of travel and two stops, whatever
+    # the number of orders at each stop
+    route = [make_order('a', 3, 1, 0), make_order('b', 1, 1, 0), make_order('c', 3, 1, 0)]
+    assert hsl.calculate_route_cost(route, timed) == 6 + 2 * SERVICE_MINUTES
+
+
+def test_l1_counts_service_time_against_the_duration_limit():
+    # Depot -> 3 -> depot takes 6 minutes of travel plus one stop
+    limit = 6 + SERVICE_MINUTES
+    fits, _ = hsl.assign_new_order_realtime(make_order('a', 3, 1, 0), {0: []}, TIME_MATRIX, 10, limit)
+    too_long, _ = hsl.assign_new_order_realtime(make_order('b', 3, 1, 0), {0: []}, TIME_MATRIX, 10, limit - 1)
+    assert fits is not None and too_long is None
+
+
+@pytest.mark.parametrize('bundle_orders', [True, False])
+def test_l2_accepts_route_at_l1_duration_limit(bundle_orders):
+    # Stops 3 then 1, with a second order at 3 listed after the one at 1:
+    # L1 and ALNS time it as depot -> 3 -> 1 -> depot = 6 minutes plus two stops
+    route = [make_order('a', 3, 1, 0), make_order('b', 1, 1, 0), make_order('c', 3, 1, 0)]
+    max_route_duration_mins = 6 + 2 * SERVICE_MINUTES
+    assert hsl.calculate_route_cost(route, hsl.with_service_time(TIME_MATRIX)) == max_route_duration_mins
+
+    solver_stats = {}
+    routes, unassigned = hsl.batch_optimization_vrp(
+        {0: route}, [], TIME_MATRIX, 1, 10, max_route_duration_mins,
+        bundle_orders=bundle_orders, warm_start=True, solver_stats=solver_stats, deterministic=True
+    )
+
+    assert solver_stats['warm_start']
+    assert unassigned == []
+    assert sorted(order['id'] for order in routes[0]) == ['a', 'b', 'c']
+
+
+def test_l2_drops_route_over_the_duration_limit():
+    route = [make_order('a', 3, 1, 0), make_order('b', 1, 1, 0)]
+    max_route_duration_mins = 6 + 2 * SERVICE_MINUTES - 1
+    routes, unassigned = hsl.batch_optimization_vrp(
+        {0: []}, route, TIME_MATRIX, 1, 10, max_route_duration_mins, deterministic=True
+    )
+    assert len(unassigned) == 1
@@ -0,0 +1,80 @@
+import math
+import random
+
+import hybrid_solver_layers as hsl
+
+NUM_LOCATIONS = 12
+
+
+def random_matrix(rng):
+    # Asymmetric on purpose: the reversal deltas must not assume symmetry
+    return [[0 if i == j else rng.randint(1, 100) for j in range(NUM_LOCATIONS)]
+            for i in range(NUM_LOCATIONS)]
+
+
+def path_cost(stops, matrix):
+    return hsl._raw_route_sum(stops, matrix, "time_matrix")
+
+
+def test_intra_route_deltas_match_a_full_recompute():
+    rng = random.Random(1)
+    kinds = set()
+    for _ in range(100):
+        matrix = random_matrix(rng)
+        stops = rng.sample(range(1, NUM_LOCATIONS), rng.randint(2, 8))
+        path = [0] + stops + [0]
+        fwd, bwd = hsl._path_prefix_sums(path, matrix)
+        # Making each returned move tabu walks down the neighbourhood
+        tabu_set = set()
+        while True:
+            best = hsl._best_intra_route_move(path, fwd, bwd, matrix, math.inf, tabu_set, -math.inf)
+            if best is None:
+                break
+            delta, move, tabu_key = best
+            new_stops = hsl._apply_intra_route_move(stops, move)
+
+            assert sorted(new_stops) == sorted(stops)
+            assert delta == path_cost(new_stops, matrix) - path_cost(stops, matrix)
+            kinds.add(move[0])
+            tabu_set.add(tabu_key)
+    assert kinds == {'swap', '2opt', 'oropt'}
+
+
+def route_state(stops, matrix, rng):
+    groups = {loc: [{'id': f'o{loc}', 'index': loc, 'demand': rng.randint(1, 4)}] for loc in stops}
+    return hsl._inter_route_state(stops, groups, matrix)
+
+
+def load(groups):
+    return sum(o['demand'] for group in groups.values() for o in group)
+
+
+def test_inter_route_deltas_match_a_full_recompute():
+    rng = random.Random(2)
+    kinds = set()
+    for _ in range(300):
+        matrix = random_matrix(rng)
+        locations = rng.sample(range(1, NUM_LOCATIONS), rng.randint(4, NUM_LOCATIONS - 1))
+        split = rng.randint(2, len(locations) - 2)
+        state_a = route_state(locations[:split], matrix, rng)
+        state_b = route_state(locations[split:], matrix, rng)
+        capacity = rng.choice([8, 12, 100])
+        before = path_cost(state_a['stops'], matrix) + path_cost(state_b['stops'], matrix)
+
+        for i in range(1, len(state_a['path']) - 1):
+            for q in range(1, len(state_b['path']) - 1):
+                result = hsl._evaluate_inter_route_moves(state_a, i, state_b, q, matrix, capacity, math.inf)
+                if result is None:
+                    continue
+                delta, move = result
+                stops_a, groups_a, stops_b, groups_b = hsl._apply_inter_route_move(state_a, state_b, move)
+
+                after = path_cost(stops_a, matrix) + path_cost(stops_b, matrix)
+                assert delta < 0
+                assert delta == after - before
+                assert sorted(stops_a + stops_b) == sorted(locations)
+                assert set(groups_a) == set(stops_a) and set(groups_b) == set(stops_b)
+                if max(load(state_a['groups']), load(state_b['groups'])) <= capacity:
+                    assert load(groups_a) <= capacity and load(groups_b) <= capacity
+                kinds.add(move[0])
+    assert kinds == {'relocate', 'exchange', '2opt*'}
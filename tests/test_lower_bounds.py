@@ -0,0 +1,64 @@
+import itertools
+import random
+
+import pytest
+
+import hybrid_solver_layers as hsl
+from lower_bounds import objective_lower_bound
+from orders import make_order, clear_order_registry
+
+FIXED_COST_PER_TRUCK = 500
+VARIABLE_COST_PER_KM = 3
+NUM_VEHICLES = 2
+
+
+@pytest.fixture(autouse=True)
+def fresh_orders():
+    clear_order_registry()
+    yield
+    clear_order_registry()
+
+
+def brute_force_objective(orders, distance_matrix, vehicle_capacity):
+    """Best ALNS objective over every assignment to NUM_VEHICLES trucks (or none) and every stop order."""
+    best_route_distance = {}
+
+    def route_distance(locations):
+        if locations not in best_route_distance:
+            best_route_distance[locations] = min(
+                hsl.calculate_raw_route_distance(list(stops), distance_matrix)
+                for stops in itertools.permutations(locations)
+            )
+        return best_route_distance[locations]
+
+    best = float('inf')
+    # Slot NUM_VEHICLES means "unassigned"
+    for slots in itertools.product(range(NUM_VEHICLES + 1), repeat=len(orders)):
+        routes = [[o for o, slot in zip(orders, slots) if slot == v] for v in range(NUM_VEHICLES)]
+        if any(sum(o['demand'] for o in route) > vehicle_capacity for route in routes):
+            continue
+        unassigned = [o for o, slot in zip(orders, slots) if slot == NUM_VEHICLES]
+        fleet_cost = sum(FIXED_COST_PER_TRUCK + VARIABLE_COST_PER_KM *
+                         route_distance(tuple(sorted({o['index'] for o in route})))
+                         for route in routes if route)
+        best = min(best, hsl.calculate_alns_objective(fleet_cost, unassigned, FIXED_COST_PER_TRUCK))
+    return best
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_objective_lower_bound_is_below_the_optimum(seed):
+    rng = random.Random(seed)
+    num_locations = 5
+    # Asymmetric, and not necessarily metric
+    distance_matrix = [[0 if i == j else rng.randint(1, 30) for j in range(num_locations)]
+                       for i in range(num_locations)]
+    orders = [make_order(f'o{k}', rng.randint(1, num_locations - 1), rng.randint(1, 6), 0)
+              for k in range(5)]
+    # Small capacities force unassigned orders on some seeds
+    vehicle_capacity = rng.choice([6, 8, 12, 30])
+
+    bound = objective_lower_bound(orders, distance_matrix, NUM_VEHICLES, vehicle_capacity,
+                                  FIXED_COST_PER_TRUCK, VARIABLE_COST_PER_KM)
+    optimum = brute_force_objective(orders, distance_matrix, vehicle_capacity)
+
+    assert 0 < bound['objective'] <= optimum + 1e-6
@@ -0,0 +1,131 @@
+import pytest
+
+import run_hybrid_solver_layers as sim
+from orders import make_order, clear_order_registry
+from parallel_alns import create_alns_pool
+
+# A small line of locations: location i is i units from the depot
+NUM_LOCATIONS = 8
+CYCLE_MINUTE = sim.SIMULATION_START_HOUR * 60 + sim.OPTIMIZER_INTERVAL_MINUTES
+
+
+def _line_matrix(scale):
+    return [[abs(i - j) * scale for j in range(NUM_LOCATIONS)] for i in range(NUM_LOCATIONS)]
+
+
+@pytest.fixture
+def cycle_state(monkeypatch):
+    """Simulator state for one optimizer cycle: a few routed and pending orders, no pool."""
+    clear_order_registry()
+    orders = [make_order(f"o{k}", 1 + k % (NUM_LOCATIONS - 1), 1 + k % 3, sim.SIMULATION_START_HOUR * 60)
+              for k in range(10)]
+    monkeypatch.setattr(sim, 'time_matrix', _line_matrix(3))
+    monkeypatch.setattr(sim, 'distance_matrix', _line_matrix(2))
+    monkeypatch.setattr(sim, 'all_locations', [{} for _ in range(NUM_LOCATIONS)])
+    monkeypatch.setattr(sim, 'current_routes', {0: orders[:3], 1: orders[3:5], 2: [], 3: []})
+    monkeypatch.setattr(sim, 'pending_orders', orders[5:])
+    monkeypatch.setattr(sim, 'dispatched_vehicles', set())
+    monkeypatch.setattr(sim, 'completed_trips', [])
+    monkeypatch.setattr(sim, 'alns_state', {})
+    monkeypatch.setattr(sim, 'alns_pool', None)
+    monkeypatch.setattr(sim, 'simulation_events', [])
+    monkeypatch.setattr(sim, 'optimization_performance_log', [])
+    yield
+    clear_order_registry()
+
+
+@pytest.fixture
+def optimizer_pool(monkeypatch, cycle_state):
+    """The pool run_hybrid_simulation creates with the default config (L2 next to the L3 search(es))."""
+    num_workers = sim.LAYER_3_NUM_PROCESSES + (1 if sim.OPTIMIZER_PROCESS_ISOLATION else 0)
+    pool = create_alns_pool(sim.time_matrix, sim.distance_matrix, num_workers)
+    monkeypatch.setattr(sim, 'alns_pool', pool)
+    yield pool
+    pool.close()
+    pool.join()
+
+
+def _route_ids(routes):
+    return {v_id: [order['id'] for order in route] for v_id, route in routes.items()}
+
+
+def test_default_config_runs_single_l3_search_in_pool(monkeypatch, optimizer_pool):
+    assert sim.OPTIMIZER_PROCESS_ISOLATION and sim.LAYER_3_NUM_PROCESSES == 1
+    calls = []
+
+    def spy(name, solver):
+        def wrapper(*args, **kwargs):
+            calls.append(name)
+            return solver(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(sim, 'run_alns_in_pool', spy('single', sim.run_alns_in_pool))
+    monkeypatch.setattr(sim, 'run_alns_multistart', spy('multistart', sim.run_alns_multistart))
+    monkeypatch.setattr(sim, 'run_alns_islands', spy('islands', sim.run_alns_islands))
+    monkeypatch.setattr(sim, 'run_alns_optimization', spy('in_process', sim.run_alns_optimization))
+
+    sim.run_optimization_cycle(CYCLE_MINUTE, 0)
+
+    assert calls == ['single']
+    assert sum(len(route) for route in sim.current_routes.values()) + len(sim.pending_orders) == 10
+
+
+def test_pool_and_in_process_cycles_agree(monkeypatch, cycle_state):
+    # A zero bound: no gap stop, so L3 runs a full, seed-dependent search
+    monkeypatch.setattr(sim, 'objective_lower_bound',
+                        lambda *args: {'objective': 0.0, 'trucks': 0, 'forced_unassigned': 0})
+    initial_routes = dict(sim.current_routes)
+    initial_pending = list(sim.pending_orders)
+
+    # In-process: L2 and L3 in the simulator's own process
+    monkeypatch.setattr(sim, 'OPTIMIZER_PROCESS_ISOLATION', False)
+    sim.run_optimization_cycle(CYCLE_MINUTE, 0)
+    in_process = (_route_ids(sim.current_routes), [order['id'] for order in sim.pending_orders],
+                  sim.alns_state['weights'], sim.alns_state['temperature'])
+
+    # Pool: the same cycle from the same state, L2 and L3 in worker processes
+    monkeypatch.setattr(sim, 'OPTIMIZER_PROCESS_ISOLATION', True)
+    monkeypatch.setattr(sim, 'current_routes', initial_routes)
+    monkeypatch.setattr(sim, 'pending_orders', initial_pending)
+    monkeypatch.setattr(sim, 'alns_state', {})
+    pool = create_alns_pool(sim.time_matrix, sim.distance_matrix, sim.LAYER_3_NUM_PROCESSES + 1)
+    monkeypatch.setattr(sim, 'alns_pool', pool)
+    try:
+        sim.run_optimization_cycle(CYCLE_MINUTE, 0)
+    finally:
+        pool.close()
+        pool.join()
+    in_pool = (_route_ids(sim.current_routes), [order['id'] for order in sim.pending_orders],
+               sim.alns_state['weights'], sim.alns_state['temperature'])
+
+    assert in_pool == in_process
+
+
+def test_cycle_stops_both_layers_at_the_simulated_deadline(monkeypatch, cycle_state):
+    monkeypatch.setattr(sim, 'objective_lower_bound',
+                        lambda *args: {'objective': 0.0, 'trucks': 0, 'forced_unassigned': 0})
+    monkeypatch.setattr(sim, 'OPTIMIZER_PROCESS_ISOLATION', False)
+    # One simulated second per unit of work, whatever the machine
+    monkeypatch.setattr(sim, 'L2_SECONDS_PER_SOLUTION', 1.0)
+    monkeypatch.setattr(sim, 'L3_SECONDS_PER_ITERATION', 1.0)
+    budget = sim.OPTIMIZER_CYCLE_SECONDS * sim.LAYER_3_BUDGET_FRACTION
+
+    sim.run_optimization_cycle(CYCLE_MINUTE, 0)
+
+    log = sim.optimization_performance_log[-1]
+    assert log['race_simulated_seconds'] == budget
+    assert sum(op['calls'] for op in log['l3_operator_stats']['destroy'].values()) == budget
+    # L2 plans for a share of the time left, counted in solutions
+    assert log['l2_anytime'][-1][0] <= budget
+
+
+def test_cycle_takes_the_layers_results_at_the_earliest_acceptance(monkeypatch, cycle_state, capsys):
+    # Any objective clears this bound: L3 accepts its initial solution, before L2 has one
+    monkeypatch.setattr(sim, 'objective_lower_bound',
+                        lambda *args: {'objective': 1e12, 'trucks': 0, 'forced_unassigned': 0})
+    monkeypatch.setattr(sim, 'OPTIMIZER_PROCESS_ISOLATION', False)
+
+    sim.run_optimization_cycle(CYCLE_MINUTE, 0)
+
+    assert "results taken at the acceptance, 0.00s simulated" in capsys.readouterr().out
+    assert "Selected Layer 3 (ALNS)" in sim.simulation_events[-1]['description']
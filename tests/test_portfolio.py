@@ -0,0 +1,165 @@
+import multiprocessing
+import pickle
+import time
+
+import pytest
+from ortools.constraint_solver import pywrapcp
+
+import hybrid_solver_layers as hsl
+from optimization_solver_layers import L2_MAX_TIME_LIMIT_SEC, set_search_limits
+from orders import make_order, clear_order_registry
+from parallel_alns import _detaches_cancel_token
+from portfolio import CancellationToken, WorkClock, acceptance_time, best_at, run_portfolio
+
+
+def polling_solver(token, results, name):
+    """A solver that works until the race is cancelled, then returns its best-so-far."""
+    def solve():
+        while not token.cancelled():
+            time.sleep(0.001)
+        results[name] = 'best-so-far'
+    return solve
+
+
+def test_accepted_objective_cancels_the_other_solvers():
+    token = CancellationToken(accept_objective=100.0)
+    results = {}
+
+    def good_enough():
+        token.report(150.0)
+        token.report(99.0)
+        results['fast'] = 'accepted'
+
+    start = time.time()
+    still_running = run_portfolio({'fast': good_enough, 'slow': polling_solver(token, results, 'slow')},
+                                  token, grace_seconds=5.0)
+
+    assert still_running == []
+    assert results == {'fast': 'accepted', 'slow': 'best-so-far'}
+    assert time.time() - start < 5.0
+
+
+def test_deadline_cancels_the_race():
+    token = CancellationToken()
+    results = {}
+
+    still_running = run_portfolio({'a': polling_solver(token, results, 'a'),
+                                   'b': polling_solver(token, results, 'b')},
+                                  token, deadline=time.time() + 0.05, grace_seconds=5.0)
+
+    assert still_running == []
+    assert results == {'a': 'best-so-far', 'b': 'best-so-far'}
+
+
+def test_solver_past_the_grace_period_is_reported_still_running():
+    token = CancellationToken()
+
+    def stubborn():
+        time.sleep(0.5) # Ignores the token
+
+    still_running = run_portfolio({'stubborn': stubborn}, token, deadline=time.time(), grace_seconds=0.01)
+
+    assert still_running == ['stubborn']
+
+
+def test_without_deadline_or_acceptance_the_race_waits_for_everyone():
+    token = CancellationToken()
+    finished = []
+
+    still_running = run_portfolio({'a': lambda: finished.append('a'),
+                                   'b': lambda: (time.sleep(0.05), finished.append('b'))}, token)
+
+    assert still_running == []
+    assert sorted(finished) == ['a', 'b']
+
+
+def _report_in_worker(token):
+    token.report(1.0)
+    return token.cancelled()
+
+
+def test_token_is_shared_with_worker_processes():
+    token = CancellationToken(accept_objective=10.0)
+    try:
+        with multiprocessing.get_context('fork').Pool(1) as pool:
+            assert pool.apply(_report_in_worker, (token,))
+        assert token.cancelled()
+        assert token.best_objective() == 1.0
+    finally:
+        token.close()
+
+
+@_detaches_cancel_token
+def _reporting_worker(task):
+    task['cancel_token'].report(1.0)
+    return 'done'
+
+
+def test_worker_detaches_its_copy_of_the_token_when_the_task_ends():
+    token = CancellationToken(accept_objective=10.0)
+    try:
+        task = {'cancel_token': pickle.loads(pickle.dumps(token))}  # What a pool worker receives
+        assert _reporting_worker(task) == 'done'
+        assert task['cancel_token']._shm.buf is None
+        token.detach()  # The owner's token is left open
+        assert token.cancelled()
+    finally:
+        token.close()
+
+
+def test_simulated_acceptance_publishes_the_earliest_time():
+    token = CancellationToken(accept_objective=100.0)
+    try:
+        token.report(99.0, at=30.0)
+        token.report(98.0, at=12.0)
+        token.report(50.0, at=20.0)
+        assert token.accepted_at() == 12.0
+        assert token.best_objective() == 50.0
+        assert not token.cancelled()
+        assert not token.cancelled(at=11.5)
+        assert token.cancelled(at=12.0)
+    finally:
+        token.close()
+
+
+def test_best_at_takes_the_last_best_up_to_the_cut():
+    trajectory = [(0.0, 300.0, 'a'), (1.5, 200.0, 'b'), (4.0, 90.0, 'c')]
+
+    assert acceptance_time(trajectory, 100.0) == 4.0
+    assert acceptance_time(trajectory, 50.0) == float('inf')
+    assert best_at(trajectory, -1.0) is None
+    assert best_at(trajectory, 1.5) == 'b'
+    assert best_at(trajectory, 3.9) == 'b'
+    assert best_at(trajectory, float('inf')) == 'c'
+
+
+def test_l2_limits_on_a_work_clock_follow_the_simulated_time_left():
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    clock = WorkClock(100.0, 0.01)
+    clock.tick(50)  # Half a simulated second already used
+
+    # 80 nodes would get 4 s, but only half of the 3 s left may be planned
+    limit = set_search_limits(search_parameters, 80, deadline=103.5, clock=clock)
+
+    assert limit == 1.5
+    assert search_parameters.solution_limit == 150
+    assert search_parameters.time_limit.seconds == L2_MAX_TIME_LIMIT_SEC
+
+
+@pytest.mark.parametrize('accepted_at, iterations', [(None, 10), (4.0, 4)])
+def test_alns_on_a_work_clock_stops_at_the_simulated_deadline_or_acceptance(accepted_at, iterations):
+    clear_order_registry()
+    line = [[float(abs(i - j)) for j in range(6)] for i in range(6)]
+    routes = {0: [make_order(f'clock-{i}', i, 1, 0) for i in range(1, 6)], 1: []}
+    token = CancellationToken(accept_objective=0.0)  # The search's own objectives are never accepted
+    try:
+        if accepted_at is not None:
+            token.report(0.0, at=accepted_at)  # Another solver's acceptance
+        clock = WorkClock(0.0, 1.0)
+        hsl.run_alns_optimization(routes, [], line, line, 2, 10, 1000, 100, 1, alns_iterations=1000,
+                                  deadline=10.0, max_non_improving=None, alns_state={},
+                                  cancel_token=token, clock=clock)
+        assert clock.units == iterations
+    finally:
+        token.close()
+        clear_order_registry()
@@ -0,0 +1,60 @@
+import math
+
+import pytest
+
+import hybrid_solver_layers as hsl
+from orders import make_order, clear_order_registry
+from rolling_horizon import day_fleet_cost, free_fleet, merge_active_solution, trip_return_minute
+
+LINE = [[abs(i - j) * 60.0 for j in range(5)] for i in range(5)]  # One minute per step along a line
+
+
+@pytest.fixture(autouse=True)
+def fresh_orders():
+    clear_order_registry()
+    yield
+    clear_order_registry()
+
+
+def test_trip_returns_after_driving_and_serving_every_stop():
+    route = [make_order('a', 2, 1, 0), make_order('b', 4, 1, 0)]
+
+    # 0 -> 2 -> 4 -> 0 is 8 minutes, plus the service time of two stops
+    assert trip_return_minute(route, 100, LINE) == 100 + math.ceil(8 + 2 * hsl.SERVICE_TIME_MINUTES)
+
+
+def test_merge_moves_new_routes_onto_trucks_back_from_a_trip():
+    dispatched_order = make_order('on-board', 1, 1, 0)
+    new_order = make_order('new', 3, 1, 0)
+    routes = {0: [], 1: [dispatched_order], 2: []}
+
+    # Vehicle 0 came back from a trip; the optimizer put the new order on vehicle 2
+    merged, pending = merge_active_solution(routes, {1}, [0, 2], {0: [], 1: [new_order]}, [], used_vehicles={0})
+
+    assert merged == {0: [new_order], 1: [dispatched_order], 2: []}
+    assert pending == []
+
+
+def test_merge_without_used_trucks_keeps_every_route_on_its_vehicle():
+    new_order = make_order('new', 3, 1, 0)
+
+    merged, _ = merge_active_solution({0: [], 1: []}, set(), [0, 1], {0: [], 1: [new_order]}, [])
+
+    assert merged == {0: [], 1: [new_order]}
+
+
+def test_free_fleet_offers_used_trucks_first():
+    routes = {0: [], 1: [make_order('on-board', 1, 1, 0)], 2: [], 3: []}
+
+    assert list(free_fleet(routes, {1}, used_vehicles={3})) == [3, 0, 2]
+
+
+def test_day_fleet_cost_counts_a_truck_once_and_every_trip():
+    first_trip = [make_order('a', 2, 1, 0)]
+    second_trip = [make_order('b', 3, 1, 0)]
+    distance = [[abs(i - j) for j in range(5)] for i in range(5)]
+
+    cost, trucks, km = day_fleet_cost({0: second_trip, 1: []}, [(0, first_trip)], distance, 100, 2)
+
+    assert (trucks, km) == (1, 4 + 6)
+    assert cost == 100 + 2 * 10
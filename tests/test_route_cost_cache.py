@@ -0,0 +1,64 @@
+import pytest
+
+import hybrid_solver_layers as hsl
+from orders import make_order, clear_order_registry
+
+ROUTE = [1, 2, 3, 4, 5, 6]  # long enough to go through the cache
+
+
+def line_matrix(size=8):
+    return [[float(abs(i - j)) for j in range(size)] for i in range(size)]
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    hsl.invalidate_route_cost_cache()
+    yield
+    hsl.invalidate_route_cost_cache()
+
+
+def test_repeated_route_is_served_from_cache():
+    matrix = line_matrix()
+    assert hsl.calculate_raw_route_time(ROUTE, matrix) == 12
+    assert hsl.calculate_raw_route_time(ROUTE, matrix) == 12
+    assert hsl.route_cost_cache_stats()['hits'] == 1
+
+
+def test_in_place_edit_is_seen_after_refresh():
+    matrix = line_matrix()
+    assert hsl.calculate_raw_route_time(ROUTE, matrix) == 12
+
+    matrix[6][0] = 100.0
+    hsl.refresh_matrix_versions(matrix)
+    assert hsl.calculate_raw_route_time(ROUTE, matrix) == 106
+
+
+def test_in_place_edit_is_seen_by_the_next_layer_call():
+    matrix = line_matrix()
+    assert hsl.calculate_raw_route_time(ROUTE, matrix) == 12
+    assert hsl.build_candidate_lists(matrix, 2)[6] == [5, 7]
+
+    matrix[6][0] = 100.0
+    matrix[6][5] = 100.0
+    # Every layer entry point re-hashes its matrices; L1 with no room
+    # (capacity 0) returns right after that
+    clear_order_registry()
+    assert hsl.assign_new_order_realtime(make_order('x', 1, 1, 0), {0: []}, matrix, 0, 60)[0] is None
+    assert hsl.calculate_raw_route_time(ROUTE, matrix) == 106
+    assert hsl.build_candidate_lists(matrix, 2)[6] == [7, 4]
+
+
+def test_equal_matrices_share_entries():
+    assert hsl.calculate_raw_route_time(ROUTE, line_matrix()) == 12
+    assert hsl.calculate_raw_route_time(ROUTE, line_matrix()) == 12
+    assert hsl.route_cost_cache_stats()['hits'] == 1
+
+
+def test_version_table_is_bounded():
+    matrices = [line_matrix(8 + k) for k in range(hsl.MATRIX_VERSION_TABLE_SIZE + 5)]
+    for matrix in matrices:
+        assert hsl.calculate_raw_route_time(ROUTE, matrix) == 12
+    assert len(hsl._matrix_versions) == hsl.MATRIX_VERSION_TABLE_SIZE
+    assert len(hsl._matrices_by_version) <= hsl.MATRIX_VERSION_TABLE_SIZE
+    # An evicted matrix is simply hashed again
+    assert hsl.calculate_raw_route_time(ROUTE, matrices[0]) == 12
@@ -0,0 +1,57 @@
+import pickle
+
+import pytest
+
+import hybrid_solver_layers as hsl
+from orders import make_order, clear_order_registry
+from solution_arrays import (ROUTE_DELIMITER, build_order_table, giant_tour_fleet_cost,
+                             giant_tour_to_routes, routes_to_giant_tour)
+
+DISTANCE_MATRIX = [[abs(i - j) * 2.5 for j in range(6)] for i in range(6)]
+
+
+@pytest.fixture(autouse=True)
+def fresh_orders():
+    clear_order_registry()
+    yield
+    clear_order_registry()
+
+
+@pytest.fixture
+def routes():
+    return {
+        3: [make_order(6500000001, 2, 4, 10), make_order(6500000002, 5, 1, 12), make_order(6500000003, 2, 2, 15)],
+        7: [],
+        1: [make_order(6500000004, 1, 3, 20)],
+    }
+
+
+def test_giant_tour_round_trip(routes):
+    pending = [make_order(6500000005, 4, 2, 30)]
+    table = build_order_table(routes, pending)
+
+    tour, vehicle_ids = routes_to_giant_tour(routes, table)
+
+    assert list(tour).count(ROUTE_DELIMITER) == len(routes)
+    assert vehicle_ids == [3, 7, 1]
+    decoded = giant_tour_to_routes(tour, vehicle_ids, table)
+    assert decoded == routes
+    assert all(a is b for v_id in routes for a, b in zip(decoded[v_id], routes[v_id]))
+    assert table.order_list(table.keys(pending)) == pending
+
+
+def test_giant_tour_round_trip_through_a_pickled_table(routes):
+    table = build_order_table(routes)
+    tour, vehicle_ids = routes_to_giant_tour(routes, table)
+
+    decoded = giant_tour_to_routes(tour, vehicle_ids, pickle.loads(pickle.dumps(table)))
+
+    assert decoded == routes
+
+
+def test_giant_tour_fleet_cost_matches_the_routes(routes):
+    table = build_order_table(routes)
+    tour, _ = routes_to_giant_tour(routes, table)
+
+    assert giant_tour_fleet_cost(tour, table, DISTANCE_MATRIX, 100, 2) == \
+        hsl.calculate_total_fleet_cost(routes, DISTANCE_MATRIX, 100, 2)